@@ -2,4 +2,5 @@
 from neatcpp import run_console_app
 
 
-run_console_app()
+if __name__ == "__main__":
+    run_console_app()
@@ -20,11 +20,23 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 # pylint: disable=missing-class-docstring, missing-function-docstring
 
+import os
 import re
 import sys
+import json
+import zlib
+import pickle
+import hashlib
+import socket
 import argparse
+import threading
+from time import perf_counter
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from heapq import heappush, heappop
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
 from enum import IntEnum
-from typing import Callable, Generator
+from typing import Callable, Generator, Iterable, TextIO
 from textwrap import dedent
 from pathlib import Path
 
@@ -67,6 +79,9 @@ class Logger():
         self.__msg_printer = msg_printer if msg_printer else self.default_msg_printer
         self.__err_printer = err_printer if err_printer else self.default_err_printer
 
+    def get_printers(self) -> tuple[Callable[[str, bool, str], None], Callable[[str, ErrSeverity, str], None]]:
+        return (self.__msg_printer, self.__err_printer)
+
     def dbg(self, text: str, end: str = "\n") -> None:
         if self.debug_msg_enabled:
             self.__msg_printer(text, True, end)
@@ -101,20 +116,29 @@ class PreprocLogger(Logger):
         self.set_printers(self.msg_printer, self.err_printer)
 
     def msg_printer(self, text: str, debug_msg: bool, end: str) -> None:
-        text = self.__fill_location_tag(text)
+        text = self.fill_location_tag(text)
         self.default_msg_printer(text, debug_msg, end)
 
     def err_printer(self, text: str, severity: Logger.ErrSeverity, end: str) -> None:
-        text = self.__fill_location_tag(text)
+        text = self.fill_location_tag(text)
         self.default_err_printer(text, severity, end)
 
-    def __fill_location_tag(self, text: str) -> str:
+    def fill_location_tag(self, text: str) -> str:
         if self.proc_file_name:
             loc = f"Processed file: {self.proc_file_name}, start line: {self.proc_file_line + 1}"
         else:
             loc = f"Processed start line: {self.proc_file_line + 1}"
         return text.replace("%l", loc)
 
+    def spawn(self) -> "PreprocLogger":
+        # New logger with the same configuration and printers, but with its own location of the processed code, so that
+        # each preprocessor instance can track the location independently of the other instances.
+        logger = PreprocLogger(self.verbosity, self.min_err_severity, self.debug_msg_enabled)
+        (msg_printer, err_printer) = self.get_printers()
+        logger.set_printers(logger.msg_printer if msg_printer == self.msg_printer else msg_printer,
+                            logger.err_printer if err_printer == self.err_printer else err_printer)
+        return logger
+
     def get_code_sample(self, code: str, sample_len: int = 80) -> str:
         sample = code.replace("\n", "").lstrip()[:sample_len]
         if len(code) > sample_len:
@@ -122,25 +146,93 @@ class PreprocLogger(Logger):
         return sample
 
 
+# Default logger configured by the console application. Preprocessor instances log through their own copies of this logger.
 log = PreprocLogger()
 
 
+class Profiler():
+    def __init__(self) -> None:
+        # Exclusive time spent in each processing phase, i.e., without the time of the nested phases.
+        self.phase_times: dict[str, float] = {}
+        # Expansion count and cumulative expansion time of each macro.
+        self.macro_stats: dict[str, list] = {}
+        self.include_counts: dict[Path, int] = {}
+        # Longest chains of nested macro expansions.
+        self.expansion_chains: set[tuple[str, ...]] = set()
+        self.__phase_stack: list[list] = []
+        self.__macro_stack: list[tuple[str, float]] = []
+
+    def reset(self) -> None:
+        self.phase_times = {}
+        self.macro_stats = {}
+        self.include_counts = {}
+        self.expansion_chains = set()
+        self.__phase_stack = []
+        self.__macro_stack = []
+
+    def start(self, phase: str) -> None:
+        self.__phase_stack.append([phase, perf_counter(), 0.0])
+
+    def stop(self) -> None:
+        (phase, start_time, nested_time) = self.__phase_stack.pop()
+        duration = perf_counter() - start_time
+        self.phase_times[phase] = self.phase_times.get(phase, 0.0) + duration - nested_time
+        if self.__phase_stack:
+            self.__phase_stack[-1][2] += duration
+
+    def profile_iter(self, phase: str, items: Iterable) -> Generator:
+        # Time spent by producing the items, e.g., by a generator, is added to the phase time.
+        items_iter = iter(items)
+        while True:
+            self.start(phase)
+            item = next(items_iter, self)
+            self.stop()
+            if item is self:
+                return
+            yield item
+
+    def start_macro(self, macro_id: str) -> None:
+        self.__macro_stack.append((macro_id, perf_counter()))
+        if len(self.__macro_stack) > 1:
+            self.expansion_chains.add(tuple(macro_id for (macro_id, _) in self.__macro_stack))
+            if len(self.expansion_chains) > 1000:
+                self.expansion_chains = set(sorted(self.expansion_chains, key=len, reverse=True)[:100])
+
+    def stop_macro(self) -> None:
+        (macro_id, start_time) = self.__macro_stack.pop()
+        stats = self.macro_stats.setdefault(macro_id, [0, 0.0])
+        stats[0] += 1
+        stats[1] += perf_counter() - start_time
+
+    def get_report(self, top_num: int = 10) -> dict:
+        return {
+            "total_time": sum(self.phase_times.values()),
+            "phase_times": dict(sorted(self.phase_times.items(), key=lambda item: item[1], reverse=True)),
+            "top_macros_by_count": [{"macro": macro_id, "expansions": count, "time": duration} for (macro_id, (count, duration))
+                                    in sorted(self.macro_stats.items(), key=lambda item: item[1][0], reverse=True)[:top_num]],
+            "top_macros_by_time": [{"macro": macro_id, "expansions": count, "time": duration} for (macro_id, (count, duration))
+                                   in sorted(self.macro_stats.items(), key=lambda item: item[1][1], reverse=True)[:top_num]],
+            "deepest_expansion_chains": [list(chain) for chain in sorted(self.expansion_chains, key=len, reverse=True)[:top_num]],
+            "most_included_files": [{"file": str(file_path), "includes": count} for (file_path, count)
+                                    in sorted(self.include_counts.items(), key=lambda item: item[1], reverse=True)[:top_num]]}
+
+
 class CodeFormatter():
     RE_PTRN_MLINE_CMNT = re.compile(r"/\*.*?\*/", re.ASCII + re.DOTALL)
     RE_PTRN_SLINE_CMNT = re.compile(r"[ \t]*//[^\n]*", re.ASCII)
     RE_PTRN_LINE_CONT = re.compile(r"[ \t]*\\[ \t]*\n", re.ASCII)
     RE_PTRN_NUM_CONST = re.compile(r"(?P<num>\d[\d.]*\d*)(?:[uUlLfF]+)", re.ASCII)
+    RE_PTRN_IDENT = re.compile(r"\w+", re.ASCII)
+    WORD_CHARS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_")
+    SPACE_CHARS = frozenset(" \t\n\r\f\v")
+    RE_PTRN_ARGS_SPECIAL = re.compile(r"[(),\"'/]")
 
     @staticmethod
-    def replace_tabs(code: str, tab_size: int = 4) -> str:
-        out_code = ""
-        for line in code.splitlines():
-            tab_pos = line.find("\t")
-            while tab_pos >= 0:
-                line = line.replace("\t", f"{(tab_size - (tab_pos % tab_size)) * ' '}", 1)
-                tab_pos = line.find("\t")
-            out_code = f"{out_code}{line}\n"
-        return out_code
+    def normalize_lines(code: str | Iterable[str], tab_size: int = 4) -> Generator[str, None, None]:
+        # Split the code into lines with any line endings, remove trailing whitespaces and replace tabs by spaces in a single
+        # pass over each line. Code can also be an iterable of lines, e.g., a generator reading the lines from a file.
+        for line in code.splitlines() if isinstance(code, str) else code:
+            yield line.rstrip().expandtabs(tab_size)
 
     @staticmethod
     def remove_line_escapes(code: str, keep_newlines: bool = False) -> str:
@@ -184,13 +276,88 @@ class CodeFormatter():
         s_pos = code.find(start_str, start_pos)
         e_pos = -1
         if s_pos >= 0 and ignored_prefix_re_ptrn.match(code, start_pos, s_pos) is not None:
-            e_pos = code.find(end_str, s_pos + 1)
-            while e_pos >= 0 and (code[s_pos: e_pos + 1].count(start_str) != code[s_pos: e_pos + 1].count(end_str)):
-                e_pos = code.find(end_str, e_pos + 1)
-            if e_pos < 0:
-                s_pos = -1
+            depth = 1
+            pos = s_pos + len(start_str)
+            while depth:
+                e_pos = code.find(end_str, pos)
+                if e_pos < 0:
+                    s_pos = -1
+                    break
+                depth += code.count(start_str, pos, e_pos) - 1
+                pos = e_pos + len(end_str)
         return (s_pos, e_pos)
 
+    @staticmethod
+    def get_macro_ref_args(code: str, start_pos: int = 0) -> tuple[int, int, list[str]]:
+        # Scan the arguments of a function-like macro reference, i.e. the parenthesized code following an optional whitespace
+        # from start_pos, in a single pass. Commas and parentheses in string or character literals and comments are ignored.
+        # Returns the positions of the opening and closing parentheses (-1 if not found) and the stripped argument values.
+        code_len = len(code)
+        pos = start_pos
+        while pos < code_len and code[pos] in CodeFormatter.SPACE_CHARS:
+            pos += 1
+        if pos >= code_len or code[pos] != "(":
+            return (-1, -1, [])
+        s_pos = pos
+        arg_start_pos = pos + 1
+        arg_bounds = []
+        depth = 1
+        re_special = CodeFormatter.RE_PTRN_ARGS_SPECIAL
+        match = re_special.search(code, arg_start_pos)
+        while match is not None:
+            pos = match.start()
+            char = code[pos]
+            next_pos = pos + 1
+            if char == "(":
+                depth += 1
+            elif char == ")":
+                depth -= 1
+                if not depth:
+                    arg_bounds.append((arg_start_pos, pos))
+                    args = [code[a_start: a_end].replace("\n", "").strip() for (a_start, a_end) in arg_bounds]
+                    return (s_pos, pos, args)
+            elif char == ",":
+                if depth == 1:
+                    arg_bounds.append((arg_start_pos, pos))
+                    arg_start_pos = next_pos
+            elif char == "/":
+                if code.startswith("/*", pos):
+                    next_pos = code.find("*/", pos + 2)
+                    next_pos = code_len if next_pos < 0 else next_pos + 2
+                elif code.startswith("//", pos):
+                    next_pos = code.find("\n", pos + 2)
+                    next_pos = code_len if next_pos < 0 else next_pos
+            else:
+                # String or character literal ending with an unescaped quote or unterminated at the end of line.
+                while next_pos < code_len and code[next_pos] != char and code[next_pos] != "\n":
+                    next_pos += 2 if code[next_pos] == "\\" else 1
+                next_pos += 1
+            match = re_special.search(code, next_pos)
+        return (-1, -1, [])
+
+    @staticmethod
+    def get_identifiers(code: str) -> set[str]:
+        return set(CodeFormatter.RE_PTRN_IDENT.findall(code))
+
+    @staticmethod
+    def find_identifier(code: str, ident: str, start_pos: int = 0, func_like: bool = False) -> int:
+        word_chars = CodeFormatter.WORD_CHARS
+        code_len = len(code)
+        ident_len = len(ident)
+        ident_pos = code.find(ident, start_pos)
+        while ident_pos >= 0:
+            end_pos = ident_pos + ident_len
+            if (ident_pos == 0 or code[ident_pos - 1] not in word_chars) and (end_pos == code_len or code[end_pos] not in word_chars):
+                if not func_like:
+                    break
+                # Function-like macro reference must be followed by an opening parenthesis, optionally preceded by whitespaces.
+                while end_pos < code_len and code[end_pos] in CodeFormatter.SPACE_CHARS:
+                    end_pos += 1
+                if end_pos < code_len and code[end_pos] == "(":
+                    break
+            ident_pos = code.find(ident, ident_pos + 1)
+        return ident_pos
+
     @staticmethod
     def is_in_comment(code: str, pos: int) -> bool:
         in_comment = False
@@ -220,16 +387,437 @@ class CodeFormatter():
         return in_string
 
 
+class CodeSpans():
+    RE_PTRN_SPAN_START = re.compile(r"/[*/]|[\"']")
+
+    def __init__(self, code: str) -> None:
+        # Sorted start and end positions of the non-overlapping comments and string or character literals in the code.
+        (self.start_positions, self.end_positions) = CodeSpans.find_spans(code)
+
+    @staticmethod
+    def find_spans(code: str, start_pos: int = 0, end_pos: int | None = None) -> tuple[list[int], list[int]]:
+        end_pos = len(code) if end_pos is None else end_pos
+        start_positions = []
+        end_positions = []
+        re_match = CodeSpans.RE_PTRN_SPAN_START.search(code, start_pos, end_pos)
+        while re_match is not None:
+            span_start_pos = re_match.start()
+            span_start = re_match.group()
+            if span_start == "/*":
+                span_end_pos = code.find("*/", span_start_pos + 2, end_pos)
+                span_end_pos = end_pos if span_end_pos < 0 else span_end_pos + 2
+            elif span_start == "//":
+                span_end_pos = code.find("\n", span_start_pos + 2, end_pos)
+                span_end_pos = end_pos if span_end_pos < 0 else span_end_pos
+            else:
+                # String or character literal ending with an unescaped quote or unterminated at the end of line.
+                span_end_pos = span_start_pos + 1
+                while span_end_pos < end_pos and code[span_end_pos] != span_start and code[span_end_pos] != "\n":
+                    span_end_pos += 2 if code[span_end_pos] == "\\" else 1
+                span_end_pos = min(span_end_pos + 1, end_pos)
+            start_positions.append(span_start_pos)
+            end_positions.append(span_end_pos)
+            re_match = CodeSpans.RE_PTRN_SPAN_START.search(code, span_end_pos, end_pos)
+        return (start_positions, end_positions)
+
+    def get_span_end(self, pos: int) -> int:
+        # Returns the end position of a comment or literal containing the specified position or -1 if there is none.
+        span_idx = bisect_right(self.start_positions, pos) - 1
+        if span_idx >= 0 and pos < self.end_positions[span_idx]:
+            return self.end_positions[span_idx]
+        return -1
+
+    def update(self, code: str, start_pos: int, end_pos: int, new_end_pos: int) -> None:
+        # Updates the spans after the code between start_pos and end_pos outside of any span has been replaced by the code
+        # between start_pos and new_end_pos in the new code.
+        first_idx = bisect_left(self.start_positions, start_pos)
+        last_idx = bisect_left(self.start_positions, end_pos, first_idx)
+        shift = new_end_pos - end_pos
+        (new_start_positions, new_end_positions) = CodeSpans.find_spans(code, start_pos, new_end_pos)
+        self.start_positions[first_idx:] = new_start_positions + [pos + shift for pos in self.start_positions[last_idx:]]
+        self.end_positions[first_idx:] = new_end_positions + [pos + shift for pos in self.end_positions[last_idx:]]
+
+
+class ExprEvaluator():
+    class ValueType(IntEnum):
+        INT = 0
+        UINT = 1
+        FLOAT = 2
+
+    RE_PTRN_TOKEN = re.compile(r"""
+        (?P<space>\s+|/\*.*?\*/|//[^\n]*)|
+        (?P<num>\.?\d(?:[eEpP][+-]|[\w.])*)|
+        (?P<char>(?:u8|[LuU])?'(?:[^'\\\n]|\\.)+')|
+        (?P<ident>[A-Za-z_]\w*)|
+        (?P<op><<|>>|<=|>=|==|!=|&&|\|\||[-+*/%<>&|^!~?:(),])""", re.ASCII + re.VERBOSE + re.DOTALL)
+    RE_PTRN_INT = re.compile(r"(?:0[xX](?P<hex>[\da-fA-F]+)|0[bB](?P<bin>[01]+)|(?P<oct>0[0-7]*)|(?P<dec>[1-9]\d*))"
+                             r"(?P<suffix>(?:[uU](?:ll|LL|[lL])?|(?:ll|LL|[lL])[uU]?)?)$", re.ASCII)
+    RE_PTRN_FLOAT = re.compile(r"(?:(?:\d+\.\d*|\.\d+)(?:[eE][+-]?\d+)?|\d+[eE][+-]?\d+|"
+                               r"0[xX](?:[\da-fA-F]+\.?[\da-fA-F]*|\.[\da-fA-F]+)[pP][+-]?\d+)[fFlL]?$", re.ASCII)
+    RE_PTRN_CHAR_ESC = re.compile(r"\\(?:x(?P<hex>[\da-fA-F]+)|(?P<oct>[0-7]{1,3})|(?P<chr>.))|(?P<raw>.)", re.ASCII + re.DOTALL)
+    CHAR_ESCAPES = {"n": 10, "t": 9, "r": 13, "a": 7, "b": 8, "f": 12, "v": 11, "e": 27}
+    INT_MAX = (1 << 63) - 1
+    UINT_MASK = (1 << 64) - 1
+    # Binary operators precedence, the higher value, the higher precedence.
+    BINARY_OPS_PRECEDENCE = {
+        "*": 10, "/": 10, "%": 10,
+        "+": 9, "-": 9,
+        "<<": 8, ">>": 8,
+        "<": 7, "<=": 7, ">": 7, ">=": 7,
+        "==": 6, "!=": 6,
+        "&": 5,
+        "^": 4,
+        "|": 3,
+        "&&": 2,
+        "||": 1}
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def compile(expr_code: str) -> Callable[[], int | float]:
+        """Compiles the C constant expression with already expanded macros into a function returning its value. Compiled
+        functions are cached by the expression code, so the same expression is not parsed again.
+
+        Raises ValueError if the expression is not valid.
+        """
+        tokens = ExprEvaluator.tokenize(expr_code)
+        if not tokens:
+            raise ValueError("empty expression")
+        parser = ExprEvaluator(tokens)
+        (func, _) = parser.parse_comma()
+        if parser.pos < len(tokens):
+            raise ValueError(f"unexpected token '{tokens[parser.pos][1]}'")
+        return func
+
+    @staticmethod
+    def tokenize(expr_code: str) -> list[tuple[str, str]]:
+        tokens = []
+        pos = 0
+        while pos < len(expr_code):
+            re_match = ExprEvaluator.RE_PTRN_TOKEN.match(expr_code, pos)
+            if re_match is None:
+                raise ValueError(f"unexpected character '{expr_code[pos]}'")
+            if re_match.lastgroup != "space":
+                tokens.append((str(re_match.lastgroup), re_match.group()))
+            pos = re_match.end()
+        return tokens
+
+    def __init__(self, tokens: list[tuple[str, str]]) -> None:
+        self.tokens: list[tuple[str, str]] = tokens
+        self.pos: int = 0
+
+    def parse_comma(self) -> tuple[Callable[[], int | float], ValueType]:
+        (func, val_type) = self.parse_conditional()
+        while self.__accept(","):
+            (first_func, (func, val_type)) = (func, self.parse_conditional())
+            func = (lambda f1, f2: lambda: (f1(), f2())[1])(first_func, func)
+        return (func, val_type)
+
+    def parse_conditional(self) -> tuple[Callable[[], int | float], ValueType]:
+        (cond_func, cond_type) = self.parse_binary(1)
+        if not self.__accept("?"):
+            return (cond_func, cond_type)
+        (true_func, true_type) = self.parse_comma()
+        self.__expect(":")
+        (false_func, false_type) = self.parse_conditional()
+        val_type = max(true_type, false_type)
+        true_func = self.__convert(true_func, true_type, val_type)
+        false_func = self.__convert(false_func, false_type, val_type)
+        return (lambda: true_func() if cond_func() else false_func(), val_type)
+
+    def parse_binary(self, min_precedence: int) -> tuple[Callable[[], int | float], ValueType]:
+        (left_func, left_type) = self.parse_unary()
+        while self.pos < len(self.tokens):
+            (token_type, op) = self.tokens[self.pos]
+            precedence = self.BINARY_OPS_PRECEDENCE.get(op, 0) if token_type == "op" else 0
+            if precedence < min_precedence:
+                break
+            self.pos += 1
+            (right_func, right_type) = self.parse_binary(precedence + 1)
+            (left_func, left_type) = self.__make_binary_op(op, left_func, left_type, right_func, right_type)
+        return (left_func, left_type)
+
+    def parse_unary(self) -> tuple[Callable[[], int | float], ValueType]:
+        if self.pos >= len(self.tokens):
+            raise ValueError("unexpected end of expression")
+        (token_type, token) = self.tokens[self.pos]
+        self.pos += 1
+        if token_type == "op" and token in ("+", "-", "!", "~"):
+            (func, val_type) = self.parse_unary()
+            if token == "!":
+                return (lambda: 0 if func() else 1, self.ValueType.INT)
+            if token == "~":
+                if val_type == self.ValueType.FLOAT:
+                    raise ValueError("invalid operand of '~'")
+                return (self.__normalize(lambda: ~func(), val_type), val_type)
+            if token == "-":
+                return (self.__normalize(lambda: -func(), val_type), val_type)
+            return (func, val_type)
+        if token == "(":
+            result = self.parse_comma()
+            self.__expect(")")
+            return result
+        if token_type == "num":
+            return self.__make_const(*self.parse_number(token))
+        if token_type == "char":
+            return self.__make_const(self.parse_char(token), self.ValueType.INT)
+        if token_type == "ident":
+            # Identifiers remaining after the macro expansion are evaluated to 0.
+            return self.__make_const(0, self.ValueType.INT)
+        raise ValueError(f"unexpected token '{token}'")
+
+    @staticmethod
+    def parse_number(number: str) -> tuple[int | float, ValueType]:
+        re_match = ExprEvaluator.RE_PTRN_INT.match(number)
+        if re_match is None:
+            # Constants without the floating point syntax, e.g., 08, are invalid integer constants, not floats.
+            if ExprEvaluator.RE_PTRN_FLOAT.match(number) is None:
+                raise ValueError(f"invalid integer constant '{number}'")
+            try:
+                if number.lower().startswith("0x"):
+                    return (float.fromhex(number.rstrip("fFlL")), ExprEvaluator.ValueType.FLOAT)
+                return (float(number.rstrip("fFlL")), ExprEvaluator.ValueType.FLOAT)
+            except ValueError as exc:
+                raise ValueError(f"invalid number '{number}'") from exc
+        if re_match.group("hex"):
+            value = int(re_match.group("hex"), 16)
+        elif re_match.group("bin"):
+            value = int(re_match.group("bin"), 2)
+        elif re_match.group("oct"):
+            value = int(re_match.group("oct"), 8)
+        else:
+            value = int(re_match.group("dec"))
+        # Constants with the unsigned suffix or too large for the signed type are unsigned.
+        if "u" in re_match.group("suffix").lower() or value > ExprEvaluator.INT_MAX:
+            return (value & ExprEvaluator.UINT_MASK, ExprEvaluator.ValueType.UINT)
+        return (value, ExprEvaluator.ValueType.INT)
+
+    @staticmethod
+    def parse_char(char: str) -> int:
+        prefix = char[:char.index("'")]
+        value = 0
+        chars_num = 0
+        for re_match in ExprEvaluator.RE_PTRN_CHAR_ESC.finditer(char[len(prefix) + 1: -1]):
+            if re_match.group("hex"):
+                char_val = int(re_match.group("hex"), 16)
+            elif re_match.group("oct"):
+                char_val = int(re_match.group("oct"), 8)
+            elif re_match.group("chr"):
+                char_val = ExprEvaluator.CHAR_ESCAPES.get(re_match.group("chr"), ord(re_match.group("chr")))
+            else:
+                char_val = ord(re_match.group("raw"))
+            value = ((value << 8) | (char_val & 0xFF)) if not prefix else char_val
+            chars_num += 1
+        # Plain single character constant is sign-extended as a signed char.
+        if not prefix and chars_num == 1 and value > 0x7F:
+            value -= 0x100
+        return value
+
+    def __accept(self, op: str) -> bool:
+        if self.pos < len(self.tokens) and self.tokens[self.pos] == ("op", op):
+            self.pos += 1
+            return True
+        return False
+
+    def __expect(self, op: str) -> None:
+        if not self.__accept(op):
+            found = f"'{self.tokens[self.pos][1]}'" if self.pos < len(self.tokens) else "end of expression"
+            raise ValueError(f"expected '{op}', found {found}")
+
+    @staticmethod
+    def __make_const(value: int | float, val_type: ValueType) -> tuple[Callable[[], int | float], ValueType]:
+        return (lambda: value, val_type)
+
+    @staticmethod
+    def __normalize(func: Callable[[], int | float], val_type: ValueType) -> Callable[[], int | float]:
+        # Wrap around the integer values to the 64-bit signed or unsigned range.
+        if val_type == ExprEvaluator.ValueType.UINT:
+            return lambda: func() & ExprEvaluator.UINT_MASK
+        if val_type == ExprEvaluator.ValueType.INT:
+            def wrap_signed() -> int | float:
+                value = func()
+                if -ExprEvaluator.INT_MAX - 1 <= value <= ExprEvaluator.INT_MAX:
+                    return value
+                value &= ExprEvaluator.UINT_MASK
+                return value - (1 << 64) if value > ExprEvaluator.INT_MAX else value
+            return wrap_signed
+        return func
+
+    @staticmethod
+    def __convert(func: Callable[[], int | float], val_type: ValueType, new_val_type: ValueType) -> Callable[[], int | float]:
+        if val_type == new_val_type:
+            return func
+        if new_val_type == ExprEvaluator.ValueType.FLOAT:
+            return lambda: float(func())
+        if new_val_type == ExprEvaluator.ValueType.UINT:
+            return lambda: func() & ExprEvaluator.UINT_MASK
+        return func
+
+    @staticmethod
+    def __divide(left: int | float, right: int | float) -> int | float:
+        if right == 0:
+            raise ZeroDivisionError("division by zero")
+        if isinstance(left, float) or isinstance(right, float):
+            return left / right
+        # Integer division truncates toward zero in C.
+        quotient = abs(left) // abs(right)
+        return -quotient if (left < 0) != (right < 0) else quotient
+
+    @staticmethod
+    def __modulo(left: int | float, right: int | float) -> int | float:
+        if right == 0:
+            raise ZeroDivisionError("modulo by zero")
+        # Remainder has the sign of the dividend in C.
+        remainder = abs(left) % abs(right)
+        return -remainder if left < 0 else remainder
+
+    @staticmethod
+    def __shift_left(left: int | float, right: int | float) -> int | float:
+        return left << right if 0 <= right < 64 else 0
+
+    @staticmethod
+    def __shift_right(left: int | float, right: int | float) -> int | float:
+        return left >> right if 0 <= right < 64 else (-1 if left < 0 else 0)
+
+    def __make_binary_op(self, op: str, left_func: Callable[[], int | float], left_type: ValueType,
+                         right_func: Callable[[], int | float], right_type: ValueType) -> tuple[Callable[[], int | float], ValueType]:
+        if op == "&&":
+            return (lambda: 1 if left_func() and right_func() else 0, self.ValueType.INT)
+        if op == "||":
+            return (lambda: 1 if left_func() or right_func() else 0, self.ValueType.INT)
+        if op in ("<<", ">>"):
+            if self.ValueType.FLOAT in (left_type, right_type):
+                raise ValueError(f"invalid operand of '{op}'")
+            shift = self.__shift_left if op == "<<" else self.__shift_right
+            return (self.__normalize(lambda: shift(left_func(), right_func()), left_type), left_type)
+        # Usual arithmetic conversions of both operands to a common type.
+        val_type = max(left_type, right_type)
+        if val_type == self.ValueType.FLOAT and op in ("%", "&", "|", "^"):
+            raise ValueError(f"invalid operand of '{op}'")
+        left = self.__convert(left_func, left_type, val_type)
+        right = self.__convert(right_func, right_type, val_type)
+        match op:
+            case "*":
+                func = lambda: left() * right()     # noqa: E731
+            case "/":
+                func = lambda: self.__divide(left(), right())   # noqa: E731
+            case "%":
+                func = lambda: self.__modulo(left(), right())   # noqa: E731
+            case "+":
+                func = lambda: left() + right()     # noqa: E731
+            case "-":
+                func = lambda: left() - right()     # noqa: E731
+            case "&":
+                func = lambda: left() & right()     # noqa: E731
+            case "^":
+                func = lambda: left() ^ right()     # noqa: E731
+            case "|":
+                func = lambda: left() | right()     # noqa: E731
+            case "<":
+                return (lambda: 1 if left() < right() else 0, self.ValueType.INT)
+            case "<=":
+                return (lambda: 1 if left() <= right() else 0, self.ValueType.INT)
+            case ">":
+                return (lambda: 1 if left() > right() else 0, self.ValueType.INT)
+            case ">=":
+                return (lambda: 1 if left() >= right() else 0, self.ValueType.INT)
+            case "==":
+                return (lambda: 1 if left() == right() else 0, self.ValueType.INT)
+            case _:
+                return (lambda: 1 if left() != right() else 0, self.ValueType.INT)
+        return (self.__normalize(func, val_type), val_type)
+
+
 class FileIO():
-    def __init__(self) -> None:
+    RE_PTRN_INCLUDE = re.compile(r"^[ \t]*#[ \t]*include[ \t]+(?P<quote>\"|<)(?P<file>[^\">\n]+)(?:\"|>)", re.ASCII + re.MULTILINE)
+
+    def __init__(self, logger: PreprocLogger = log) -> None:
+        self.log: PreprocLogger = logger
         self.incl_dir_paths: list[Path] = [Path("")]
+        # Modification time, size and content digest of all read files.
+        self.file_stamps: dict[Path, tuple[int, int, str]] = {}
+        # Results of all file searches, i.e., found file paths or None for the files not found, keyed by the searched file name
+        # in the quoted or angle bracket form and the directory of the including file. The searches are repeated to detect
+        # the created files that would be found instead of the previous results.
+        self.file_lookups: dict[tuple[str, bool, Path | None], Path | None] = {}
+        # Names of the files in the searched directories and resolved file paths or None for the files not found for the
+        # searched file names in the quoted or angle bracket form and the directory of the including file.
+        self.__dir_file_names: dict[Path, frozenset[str]] = {}
+        self.__found_paths: dict[tuple[str, bool, Path | None], Path | None] = {}
+        self.__found_paths_dirs: list[Path] = self.incl_dir_paths
+        self.__found_paths_dirs_num: int = len(self.incl_dir_paths)
+        self.find_hits: int = 0
+        self.find_misses: int = 0
+        self.profiler: Profiler | None = None
+        # Maximum size in bytes of the files read in advance by the prefetch threads, i.e., the files included by the
+        # read files that have not been read yet. Value 0 disables the prefetching.
+        self.prefetch_budget: int = 0
+        self.prefetch_jobs: int = 4
+        # Prefetched file code with its stamp or None if the file has not been prefetched, and the size of the prefetched
+        # files not read yet. The size is updated by the prefetch threads, so it is guarded by the lock.
+        self.__prefetched: dict[Path, Future[tuple[str, tuple[int, int, str]] | None]] = {}
+        # Paths of the files prefetched for each read file, released once the read file is processed if they are not read.
+        self.__prefetched_by: dict[Path, list[Path]] = {}
+        self.__prefetched_size: int = 0
+        self.__prefetch_lock: threading.Lock = threading.Lock()
+        self.__prefetch_executor: ThreadPoolExecutor | None = None
+        self.prefetch_hits: int = 0
+        self.prefetch_skips: int = 0
 
     def reset(self) -> None:
         self.incl_dir_paths = [Path("")]
+        self.file_stamps = {}
+        self.file_lookups = {}
+        self.__dir_file_names = {}
+        self.__found_paths = {}
+        self.find_hits = 0
+        self.find_misses = 0
+        self.close()
+        self.prefetch_hits = 0
+        self.prefetch_skips = 0
+
+    def close(self) -> None:
+        # Prefetched files not read yet are released and the prefetch threads are stopped. They are started again if needed.
+        for future in self.__prefetched.values():
+            self.__discard_prefetched_file(future)
+        self.__prefetched = {}
+        self.__prefetched_by = {}
+        if self.__prefetch_executor is not None:
+            self.__prefetch_executor.shutdown(wait=False)
+            self.__prefetch_executor = None
+
+    def release_prefetched(self, file_path: Path) -> None:
+        # Files prefetched for the processed file, but not read, e.g., included in the inactive conditional branches,
+        # are released, so they do not occupy the prefetch budget and memory.
+        for prefetched_path in self.__prefetched_by.pop(file_path, ()):
+            future = self.__prefetched.pop(prefetched_path, None)
+            if future is not None:
+                self.__discard_prefetched_file(future)
+
+    def clear_lookups(self) -> None:
+        # Directory listings and found paths are cleared, so the files created or removed since they were searched are found
+        # or reported as missing and the new files shadowing the previously found files in the preceding directories are used.
+        self.__dir_file_names = {}
+        self.__found_paths = {}
+
+    @staticmethod
+    def get_code_digest(code: str) -> str:
+        return hashlib.blake2b(code.encode("utf-8"), digest_size=16).hexdigest()
+
+    @staticmethod
+    def is_file_unchanged(file_path: Path, file_stamp: tuple[int, int, str]) -> bool:
+        try:
+            stat = file_path.stat()
+            if (stat.st_mtime_ns, stat.st_size) == file_stamp[:2]:
+                return True
+            # Compare the content digest in case the file has been touched, but not changed.
+            with open(file_path, "r", encoding="utf-8") as file:
+                return FileIO.get_code_digest(file.read()) == file_stamp[2]
+        except (OSError, UnicodeDecodeError):
+            return False
 
     def add_include_dir(self, *dir_paths: str | Path) -> None:
         for dir_path in dir_paths:
-            log.msg(f"Adding include directory '{Path(dir_path).name}'.")
+            self.log.msg(f"Adding include directory '{Path(dir_path).name}'.")
             incl_dir_path = Path(dir_path).resolve()
             if incl_dir_path.is_file():
                 incl_dir_path = incl_dir_path.parent
@@ -237,20 +825,163 @@ class FileIO():
                 if incl_dir_path not in self.incl_dir_paths:
                     self.incl_dir_paths.append(incl_dir_path)
             else:
-                log.err(f"Include dir '{dir_path}' not found.")
+                self.log.err(f"Include dir '{dir_path}' not found.")
+
+    def find_file(self, file_path: str | Path, angle_form: bool = False, incl_file_dir_path: Path | None = None,
+                  log_missing: bool = True) -> Path | None:
+        # Files in the quoted form, i.e., #include "file", are searched in the directory of the including file first.
+        # Files in the angle bracket form, i.e., #include <file>, are searched only in the include directories.
+        if self.profiler is not None:
+            self.profiler.start("file_io")
+        if self.incl_dir_paths is not self.__found_paths_dirs or len(self.incl_dir_paths) != self.__found_paths_dirs_num:
+            # Found paths are no longer valid if the include directories are changed.
+            self.__found_paths = {}
+            self.__found_paths_dirs = self.incl_dir_paths
+            self.__found_paths_dirs_num = len(self.incl_dir_paths)
+        key = (str(file_path), angle_form, None if angle_form else incl_file_dir_path)
+        if key in self.__found_paths:
+            found_file_path = self.__found_paths[key]
+            self.find_hits += 1
+        else:
+            self.find_misses += 1
+            found_file_path = None
+            search_dir_paths = self.incl_dir_paths if key[2] is None else [key[2], *self.incl_dir_paths]
+            for incl_dir_path in search_dir_paths:
+                incl_file_path = Path(incl_dir_path, file_path)
+                if incl_file_path.name in self.__get_dir_file_names(incl_file_path.parent):
+                    found_file_path = incl_file_path.resolve()
+                    break
+            if found_file_path is None:
+                # File not in the cached directory listings might have been created after the directories were listed or its
+                # name might differ in the letter case on a case-insensitive file system, so check the files directly.
+                for incl_dir_path in search_dir_paths:
+                    incl_file_path = Path(incl_dir_path, file_path)
+                    if incl_file_path.is_file():
+                        found_file_path = incl_file_path.resolve()
+                        self.__dir_file_names.pop(incl_file_path.parent, None)
+                        break
+            # Files not found are cached as well, so they are searched again only after the lookups are cleared.
+            self.__found_paths[key] = found_file_path
+            self.file_lookups[key] = found_file_path
+        if found_file_path is None and log_missing:
+            self.log.err(f"File '{file_path}' not found.", self.log.ErrSeverity.INFO)
+        if self.profiler is not None:
+            self.profiler.stop()
+        return found_file_path
+
+    def get_file_stamp(self, file_path: Path) -> tuple[int, int, str] | None:
+        file_stamp = self.file_stamps.get(file_path)
+        if file_stamp is None:
+            try:
+                with open(file_path, "r", encoding="utf-8") as file:
+                    file_code = file.read()
+                    stat = os.fstat(file.fileno())
+                file_stamp = (stat.st_mtime_ns, stat.st_size, self.get_code_digest(file_code))
+                self.file_stamps[file_path] = file_stamp
+            except (OSError, UnicodeDecodeError):
+                pass
+        return file_stamp
 
     def read_file(self, file_path: str | Path) -> str:
-        for incl_dir_path in self.incl_dir_paths:
-            incl_file_path = Path(incl_dir_path, Path(file_path))
-            if incl_file_path.is_file():
-                with open(incl_file_path, "r", encoding="utf-8") as file:
+        file_code = ""
+        found_file_path = self.find_file(file_path)
+        if found_file_path is not None:
+            if self.profiler is not None:
+                self.profiler.start("file_io")
+            prefetched_file = self.__get_prefetched_file(found_file_path)
+            if prefetched_file is not None:
+                (file_code, self.file_stamps[found_file_path]) = prefetched_file
+            else:
+                with open(found_file_path, "r", encoding="utf-8") as file:
                     file_code = file.read()
-                break
-        else:
-            log.err(f"File '{file_path}' not found.", log.ErrSeverity.INFO)
-            file_code = ""
+                    stat = os.fstat(file.fileno())
+                self.file_stamps[found_file_path] = (stat.st_mtime_ns, stat.st_size, self.get_code_digest(file_code))
+            if self.prefetch_budget > 0:
+                self.__prefetch_includes(file_code, found_file_path)
+            if self.profiler is not None:
+                self.profiler.stop()
         return file_code
 
+    def yield_file_lines(self, file_path: str | Path) -> Generator[str, None, None]:
+        # Lines are split in the same way as by the str.splitlines() method used for the whole file code.
+        found_file_path = self.find_file(file_path)
+        if found_file_path is not None:
+            digest = hashlib.blake2b(digest_size=16)
+            with open(found_file_path, "r", encoding="utf-8") as file:
+                for line in file:
+                    digest.update(line.encode("utf-8"))
+                    yield from line.splitlines()
+                stat = os.fstat(file.fileno())
+            self.file_stamps[found_file_path] = (stat.st_mtime_ns, stat.st_size, digest.hexdigest())
+
+    def __prefetch_includes(self, code: str, file_path: Path) -> None:
+        # Files included by the read code are read by the prefetch threads while the code is processed. Files that have been
+        # already read are not prefetched, because they are typically cached or skipped by their include guard.
+        prefetched_paths = self.__prefetched_by.setdefault(file_path, [])
+        for re_match in FileIO.RE_PTRN_INCLUDE.finditer(code):
+            found_file_path = self.find_file(re_match.group("file"), re_match.group("quote") == "<", file_path.parent, False)
+            if found_file_path is not None and found_file_path not in self.file_stamps and found_file_path not in self.__prefetched:
+                if self.__prefetch_executor is None:
+                    self.__prefetch_executor = ThreadPoolExecutor(self.prefetch_jobs, thread_name_prefix="neatcpp_prefetch")
+                self.__prefetched[found_file_path] = self.__prefetch_executor.submit(self.__prefetch_file, found_file_path,
+                                                                                     self.prefetch_budget)
+                prefetched_paths.append(found_file_path)
+
+    def __prefetch_file(self, file_path: Path, budget: int) -> tuple[str, tuple[int, int, str]] | None:
+        # Executed by a prefetch thread. File is not read if it does not fit into the remaining prefetch budget.
+        try:
+            with open(file_path, "r", encoding="utf-8") as file:
+                stat = os.fstat(file.fileno())
+                with self.__prefetch_lock:
+                    if self.__prefetched_size + stat.st_size > budget:
+                        return None
+                    self.__prefetched_size += stat.st_size
+                try:
+                    file_code = file.read()
+                except (OSError, UnicodeDecodeError):
+                    with self.__prefetch_lock:
+                        self.__prefetched_size -= stat.st_size
+                    return None
+        except OSError:
+            return None
+        return (file_code, (stat.st_mtime_ns, stat.st_size, self.get_code_digest(file_code)))
+
+    def __get_prefetched_file(self, file_path: Path) -> tuple[str, tuple[int, int, str]] | None:
+        future = self.__prefetched.pop(file_path, None)
+        if future is None or future.cancelled():
+            return None
+        prefetched_file = self.__release_prefetched_file(future)
+        if prefetched_file is None:
+            self.prefetch_skips += 1
+        else:
+            self.prefetch_hits += 1
+        return prefetched_file
+
+    def __release_prefetched_file(self, future: Future[tuple[str, tuple[int, int, str]] | None]) -> tuple[str, tuple[int, int, str]] | None:
+        # Size of the prefetched file is subtracted from the prefetch budget once the file is read or discarded.
+        prefetched_file = future.result()
+        if prefetched_file is not None:
+            with self.__prefetch_lock:
+                self.__prefetched_size -= prefetched_file[1][1]
+        return prefetched_file
+
+    def __discard_prefetched_file(self, future: Future[tuple[str, tuple[int, int, str]] | None]) -> None:
+        # File being prefetched is released by the prefetch thread once it is read.
+        if not future.cancel():
+            future.add_done_callback(self.__release_prefetched_file)
+
+    def __get_dir_file_names(self, dir_path: Path) -> frozenset[str]:
+        # Directory is listed only once to avoid checking the existence of each searched file separately.
+        file_names = self.__dir_file_names.get(dir_path)
+        if file_names is None:
+            try:
+                with os.scandir(dir_path) as dir_entries:
+                    file_names = frozenset(entry.name for entry in dir_entries if entry.is_file())
+            except OSError:
+                file_names = frozenset()
+            self.__dir_file_names[dir_path] = file_names
+        return file_names
+
 
 class ConditionManager():
     class BranchState(IntEnum):
@@ -258,7 +989,8 @@ class ConditionManager():
         SEARCH = 1  # if/elif/else branch code is enabled and if condition is not true, so search for true elif/else condition.
         IGNORE = 2  # if/elif/else branch code is not enabled, i.e. the condition does not have to be evaluated anymore.
 
-    def __init__(self) -> None:
+    def __init__(self, logger: PreprocLogger = log) -> None:
+        self.log: PreprocLogger = logger
         self.branch_state: ConditionManager.BranchState = self.BranchState.ACTIVE
         self.branch_state_stack: list[ConditionManager.BranchState] = []
 
@@ -297,7 +1029,7 @@ class ConditionManager():
         if self.branch_depth > 0:
             self.branch_state = self.branch_state_stack.pop()
         else:
-            log.err("Unexpected #endif detected (%l).", log.ErrSeverity.CRITICAL)
+            self.log.err("Unexpected #endif detected (%l).", self.log.ErrSeverity.CRITICAL)
 
 
 class CodeType(IntEnum):
@@ -305,89 +1037,333 @@ class CodeType(IntEnum):
     DIRECTIVE = 1
     COMMENT = 2
     SPACE = 3
+    INACTIVE = 4    # Code of the inactive conditional branches included only in the full output.
 
 
 class PreprocInput():
-    def yield_code_parts(self, code: str) -> Generator[tuple[CodeType, str], None, None]:
-        in_lines = code.splitlines()
+    COND_START_KEYWORDS = frozenset(("if", "ifdef", "ifndef"))
+    COND_BRANCH_KEYWORDS = frozenset(("elif", "else", "endif"))
+
+    def __init__(self, logger: PreprocLogger = log) -> None:
+        # Logger with the location of the processed code updated to the start line of each yielded code part.
+        self.log: PreprocLogger = logger
+        self.part_line_idx: int = 0
+        # Flag set by the consumer of the code parts if the current conditional branch is not active. The lines up to the next
+        # #elif, #else or #endif directive of the current conditional directive are then yielded as a single inactive part.
+        self.skip_inactive: bool = False
+
+    def yield_code_parts(self, code: str | Iterable[str]) -> Generator[tuple[CodeType, str], None, None]:
+        # Code is either a string or an iterable of code lines, e.g., a generator reading the lines from a file.
+        skipped_lines = []
+        skip_depth = 0
+        for (line_idx, out_lines) in self.__yield_line_groups(code):
+            if self.skip_inactive:
+                keyword = self.get_directive_keyword(out_lines[0], out_lines) if out_lines[0].lstrip().startswith("#") else ""
+                if keyword in self.COND_START_KEYWORDS:
+                    skip_depth += 1
+                elif keyword in self.COND_BRANCH_KEYWORDS:
+                    if skip_depth == 0:
+                        self.skip_inactive = False
+                        if skipped_lines:
+                            yield (CodeType.INACTIVE, "\n".join(skipped_lines))
+                            skipped_lines = []
+                    elif keyword == "endif":
+                        skip_depth -= 1
+                if self.skip_inactive:
+                    if not skipped_lines:
+                        self.part_line_idx = line_idx
+                    skipped_lines.extend(out_lines)
+                    continue
+            skip_depth = 0
+            self.part_line_idx = line_idx
+            self.log.proc_file_line = line_idx
+            out_code = "\n".join(out_lines)
+            out_code_stripped = out_code.strip()
+            if out_code_stripped.startswith("#"):
+                out_type = CodeType.DIRECTIVE
+            elif not out_code_stripped:
+                out_type = CodeType.SPACE
+            elif ((out_code_stripped.startswith("/*") and out_code_stripped.endswith("*/")) or
+                    out_code_stripped.startswith("//")):
+                out_type = CodeType.COMMENT
+            else:
+                out_type = CodeType.CODE
+            yield (out_type, out_code)
+        if skipped_lines:
+            yield (CodeType.INACTIVE, "\n".join(skipped_lines))
+
+    def yield_cached_parts(self, code_parts: list[tuple[int, CodeType, str]],
+                           branch_ends: dict[int, int]) -> Generator[tuple[CodeType, str], None, None]:
+        # Code parts already split by the yield_code_parts method. Inactive branches are skipped using the indexes of the
+        # #elif, #else or #endif directives ending the branches started by the directives with the specified indexes.
+        part_idx = 0
+        parts_num = len(code_parts)
+        while part_idx < parts_num:
+            if self.skip_inactive:
+                self.skip_inactive = False
+                end_idx = branch_ends.get(part_idx - 1, part_idx)
+                if end_idx > part_idx:
+                    self.part_line_idx = code_parts[part_idx][0]
+                    yield (CodeType.INACTIVE, "\n".join(code_part for (_, _, code_part) in code_parts[part_idx: end_idx]))
+                    part_idx = end_idx
+                    continue
+            (self.part_line_idx, code_type, code_part) = code_parts[part_idx]
+            yield (code_type, code_part)
+            part_idx += 1
+
+    @staticmethod
+    def get_directive_keyword(code: str, code_lines: list[str] | None = None) -> str:
+        # Keyword of the directive code with the line escapes removed, optionally specified as a list of lines.
+        if code_lines is not None and len(code_lines) > 1:
+            code = CodeFormatter.remove_line_escapes("\n".join(code_lines))
+        elif "\\" in code:
+            code = CodeFormatter.remove_line_escapes(code)
+        re_match = Directive.RE_PTRN_KEYWORD.match(code)
+        return re_match.group("keyword") if re_match else ""
+
+    def __yield_line_groups(self, code: str | Iterable[str]) -> Generator[tuple[int, list[str]], None, None]:
+        # Lines are grouped into the lines joined by line escapes, multiline comments or multiple empty lines.
+        in_lines = iter(code.splitlines() if isinstance(code, str) else code)
         line_idx = 0
-        code_lines_num = len(in_lines)
-        while line_idx < code_lines_num:
+        next_line = next(in_lines, None)
+        while next_line is not None:
+            group_line_idx = line_idx
             out_lines = []
-            in_line = in_lines[line_idx].rstrip()
+            in_line = next_line.rstrip()
             out_lines.append(in_line)
-            log.proc_file_line = line_idx
+            self.log.proc_file_line = line_idx
             line_idx += 1
+            next_line = next(in_lines, None)
             # Detect and extract continuous line split to lines ending with "\".
             if in_line.endswith("\\"):
-                while line_idx < code_lines_num:
-                    in_line = in_lines[line_idx].rstrip()
+                while next_line is not None:
+                    in_line = next_line.rstrip()
                     out_lines.append(in_line)
                     line_idx += 1
+                    next_line = next(in_lines, None)
                     if not in_line.endswith("\\"):
                         break
             # Detect and extract multiline comment.
             elif "/*" in in_line and "*/" not in in_line:
-                while line_idx < code_lines_num:
-                    in_line = in_lines[line_idx].rstrip()
+                while next_line is not None:
+                    in_line = next_line.rstrip()
                     out_lines.append(in_line)
                     line_idx += 1
+                    next_line = next(in_lines, None)
                     if "*/" in in_line:
                         break
                 else:
-                    log.err("Unterminated comment detected (%l).", log.ErrSeverity.CRITICAL)
+                    self.log.err("Unterminated comment detected (%l).", self.log.ErrSeverity.CRITICAL)
             # Detect and extract multiple empty lines.
             elif not in_line:
-                while line_idx < code_lines_num and not in_lines[line_idx].strip():
+                while next_line is not None and not next_line.strip():
                     out_lines.append("")
                     line_idx += 1
-
-            out_code = "\n".join(out_lines)
-            out_code_stripped = out_code.strip()
-            if out_code_stripped.startswith("#"):
-                out_type = CodeType.DIRECTIVE
-            elif not out_code_stripped:
-                out_type = CodeType.SPACE
-            elif ((out_code_stripped.startswith("/*") and out_code_stripped.endswith("*/")) or
-                    out_code_stripped.startswith("//")):
-                out_type = CodeType.COMMENT
-            else:
-                out_type = CodeType.CODE
-            yield (out_type, out_code)
+                    next_line = next(in_lines, None)
+            yield (group_line_idx, out_lines)
 
 
 class PreprocOutput():
-    def __init__(self) -> None:
+    __slots__ = ("last_space", "last_comment", "non_empty", "out_file", "full_output", "__code_parts", "__code_all_parts")
+
+    def __init__(self, out_file: TextIO | None = None, full_output: bool = False) -> None:
         self.last_space: str = ""
-        self.last_comment: str = ""
+        self.last_comment: list[str] = []
         self.non_empty: bool = False
-        self.code: str = ""
-        self.code_all: str = ""
+        # Output file, to which the code parts are written immediately instead of being collected, and the full output flag.
+        self.out_file: TextIO | None = out_file
+        self.full_output: bool = full_output
+        # Output code is collected as a list of parts and joined only when it is read to avoid quadratic string concatenation.
+        self.__code_parts: list[str] = []
+        self.__code_all_parts: list[str] = []
+
+    @property
+    def code(self) -> str:
+        return self.__join_parts(self.__code_parts)
+
+    @code.setter
+    def code(self, code: str) -> None:
+        self.__code_parts = [code] if code else []
+
+    @property
+    def code_all(self) -> str:
+        return self.__join_parts(self.__code_all_parts)
+
+    @code_all.setter
+    def code_all(self, code: str) -> None:
+        self.__code_all_parts = [code] if code else []
 
     def reset(self) -> None:
         self.last_space = ""
-        self.last_comment = ""
+        self.last_comment = []
         self.non_empty = False
-        self.code = ""
-        self.code_all = ""
+        self.__code_parts = []
+        self.__code_all_parts = []
 
     def add_code_part(self, code_part: str, code_type: CodeType) -> None:
-        self.code_all = f"{self.code_all}{code_part}\n"
+        self.__code_all_parts.append(f"{code_part}\n")
         match code_type:
             case CodeType.SPACE:
                 if self.non_empty:
                     self.last_space = f"{code_part}\n"
-                self.last_comment = ""
+                self.last_comment = []
             case CodeType.COMMENT:
-                self.last_comment = f"{self.last_comment}{code_part}\n"
+                self.last_comment.append(f"{code_part}\n")
             case CodeType.DIRECTIVE:
                 self.last_space = ""
-                self.last_comment = ""
+                self.last_comment = []
             case CodeType.CODE:
-                self.code = f"{self.code}{self.last_space}{self.last_comment}{code_part}\n"
+                if self.last_space:
+                    self.__code_parts.append(self.last_space)
+                self.__code_parts.extend(self.last_comment)
+                self.__code_parts.append(f"{code_part}\n")
                 self.last_space = ""
-                self.last_comment = ""
+                self.last_comment = []
                 self.non_empty = True
+        if self.out_file is not None:
+            self.write(self.out_file, self.full_output)
+            self.__code_parts.clear()
+            self.__code_all_parts.clear()
+
+    def write(self, file: TextIO, full_output: bool = False) -> None:
+        file.writelines(self.__code_all_parts if full_output else self.__code_parts)
+
+    @staticmethod
+    def __join_parts(parts: list[str]) -> str:
+        # Joined code replaces the individual parts, so that repeated reading does not join them again.
+        if len(parts) > 1:
+            parts[:] = ["".join(parts)]
+        return parts[0] if parts else ""
+
+
+class IncludeCache():
+    RE_PTRN_DIRECTIVE = re.compile(r"^[ \t]*#[ \t]*(?P<keyword>\w+)(?P<expr>.*)", re.ASCII + re.DOTALL)
+    RE_PTRN_GUARD_IFNDEF = re.compile(r"^\s*(?P<ident>\w+)\s*$", re.ASCII)
+    RE_PTRN_GUARD_IF = re.compile(r"^\s*!\s*defined\s*(?:\(\s*(?P<ident_p>\w+)\s*\)|\s(?P<ident>\w+))\s*$", re.ASCII)
+
+    class File():
+        __slots__ = ("code_parts", "guard_macro", "pragma_once", "branch_ends")
+
+        def __init__(self, code_parts: list[tuple[int, CodeType, str]] | None, guard_macro: str = "", pragma_once: bool = False) -> None:
+            # Code parts are None if only the include guard is known, e.g., from the macro database.
+            self.code_parts: list[tuple[int, CodeType, str]] | None = code_parts
+            self.guard_macro: str = guard_macro
+            self.pragma_once: bool = pragma_once
+            # Indexes of the #elif, #else or #endif directives ending the conditional branches started by the directives
+            # at the key indexes, used to skip the inactive branches.
+            self.branch_ends: dict[int, int] = IncludeCache.get_branch_ends(code_parts) if code_parts else {}
+
+    def __init__(self) -> None:
+        self.files: dict[Path, IncludeCache.File] = {}
+        self.included_paths: set[Path] = set()
+        self.hits: int = 0
+        self.misses: int = 0
+        self.skips: int = 0
+        self.tab_size: int = 4
+
+    def reset(self) -> None:
+        self.files = {}
+        self.included_paths = set()
+        self.hits = 0
+        self.misses = 0
+        self.skips = 0
+
+    def get_file(self, file_path: Path, file_io: FileIO, tab_size: int = 4) -> File:
+        if tab_size != self.tab_size:
+            # Code parts with tabs replaced using a different tab size are not valid anymore, but the include guards are.
+            self.files = {path: IncludeCache.File(None, incl_file.guard_macro, incl_file.pragma_once)
+                          for (path, incl_file) in self.files.items()}
+            self.tab_size = tab_size
+        incl_file = self.files.get(file_path)
+        if incl_file is None or incl_file.code_parts is None:
+            self.misses += 1
+            code_lines = CodeFormatter.normalize_lines(file_io.read_file(file_path), tab_size)
+            code_input = PreprocInput(file_io.log)
+            code_parts = [(code_input.part_line_idx, code_type, code_part)
+                          for (code_type, code_part) in code_input.yield_code_parts(code_lines)]
+            (guard_macro, pragma_once) = self.detect_guard(code_parts)
+            incl_file = IncludeCache.File(code_parts, guard_macro, pragma_once)
+            self.files[file_path] = incl_file
+        else:
+            self.hits += 1
+        return incl_file
+
+    def get_guards(self) -> dict[Path, tuple[str, bool]]:
+        return {file_path: (incl_file.guard_macro, incl_file.pragma_once) for (file_path, incl_file) in self.files.items()
+                if incl_file.guard_macro or incl_file.pragma_once}
+
+    def add_guards(self, guards: dict[Path, tuple[str, bool]]) -> None:
+        for (file_path, (guard_macro, pragma_once)) in guards.items():
+            if file_path not in self.files:
+                self.files[file_path] = IncludeCache.File(None, guard_macro, pragma_once)
+
+    @staticmethod
+    def get_branch_ends(code_parts: list[tuple[int, CodeType, str]]) -> dict[int, int]:
+        branch_ends = {}
+        # Indexes of the last #if, #ifdef, #ifndef, #elif or #else directive of the currently open conditional directives.
+        branch_starts = []
+        for (part_idx, (_, code_type, code_part)) in enumerate(code_parts):
+            if code_type != CodeType.DIRECTIVE:
+                continue
+            keyword = PreprocInput.get_directive_keyword(code_part)
+            if keyword in PreprocInput.COND_START_KEYWORDS:
+                branch_starts.append(part_idx)
+            elif keyword in PreprocInput.COND_BRANCH_KEYWORDS and branch_starts:
+                branch_ends[branch_starts[-1]] = part_idx
+                if keyword == "endif":
+                    branch_starts.pop()
+                else:
+                    branch_starts[-1] = part_idx
+        return branch_ends
+
+    @staticmethod
+    def detect_guard(code_parts: list[tuple[int, CodeType, str]]) -> tuple[str, bool]:
+        # Detect the include guard, i.e., the whole file code enclosed in #ifndef X or #if !defined(X) ... #endif without
+        # #elif or #else branch, and the #pragma once directive outside of the conditional blocks.
+        guard_macro = ""
+        pragma_once = False
+        guard_candidate = ""
+        guard_closed = False
+        guard_broken = False
+        depth = 0
+        for (_, code_type, code_part) in code_parts:
+            if code_type == CodeType.CODE:
+                if depth == 0:
+                    guard_broken = True
+                continue
+            if code_type != CodeType.DIRECTIVE:
+                continue
+            directive_code = CodeFormatter.remove_comments(CodeFormatter.remove_line_escapes(code_part), replace_with_spaces=True)
+            re_match = IncludeCache.RE_PTRN_DIRECTIVE.match(directive_code)
+            if re_match is None:
+                guard_broken = True
+                continue
+            (keyword, expr) = (re_match.group("keyword"), re_match.group("expr"))
+            if depth == 0:
+                if keyword == "pragma" and expr.strip() == "once":
+                    pragma_once = True
+                    continue
+                if guard_candidate or guard_closed:
+                    guard_broken = True
+                elif keyword == "ifndef":
+                    re_match = IncludeCache.RE_PTRN_GUARD_IFNDEF.match(expr)
+                    guard_candidate = re_match.group("ident") if re_match else ""
+                elif keyword == "if":
+                    re_match = IncludeCache.RE_PTRN_GUARD_IF.match(expr)
+                    guard_candidate = (re_match.group("ident_p") or re_match.group("ident")) if re_match else ""
+                if not guard_candidate:
+                    guard_broken = True
+            if keyword in ("if", "ifdef", "ifndef"):
+                depth += 1
+            elif keyword in ("elif", "else") and depth == 1:
+                guard_broken = True
+            elif keyword == "endif":
+                depth -= 1
+                if depth == 0:
+                    guard_closed = True
+        if guard_candidate and guard_closed and not guard_broken:
+            guard_macro = guard_candidate
+        return (guard_macro, pragma_once)
 
 
 class DirectiveGroup(IntEnum):
@@ -395,15 +1371,104 @@ class DirectiveGroup(IntEnum):
     CONDITIONAL = 1
 
 
+class ExpansionCache():
+    def __init__(self, max_size: int = 4096) -> None:
+        # Fully expanded macro references keyed by the macro identifier and argument values, stored together with the
+        # identifiers the expansion depends on, in the least recently used order.
+        self.entries: dict[tuple[str, ...], tuple[str, frozenset[str]]] = {}
+        # Keys of the cached expansions depending on each identifier.
+        self.dep_keys: dict[str, set[tuple[str, ...]]] = {}
+        # Hashes of the keys of the expansions not cached yet. Expansion is cached only if its key is added repeatedly,
+        # so the unique expansions, e.g., function-like macros with unique argument values, do not evict the reused ones.
+        self.seen_key_hashes: set[int] = set()
+        self.max_size: int = max_size
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.invalidations: int = 0
+
+    def reset(self) -> None:
+        self.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def clear(self) -> None:
+        self.entries = {}
+        self.dep_keys = {}
+        self.seen_key_hashes = set()
+
+    def get(self, key: tuple[str, ...]) -> tuple[str, frozenset[str]] | None:
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+        else:
+            # Reinsert the entry to move it to the end of the least recently used order.
+            self.entries[key] = entry
+            self.hits += 1
+        return entry
+
+    def add(self, key: tuple[str, ...], exp_code: str, deps: set[str]) -> None:
+        if self.max_size <= 0:
+            return
+        key_hash = hash(key)
+        if key_hash not in self.seen_key_hashes:
+            if len(self.seen_key_hashes) >= 4 * self.max_size:
+                self.seen_key_hashes = set()
+            self.seen_key_hashes.add(key_hash)
+            return
+        self.seen_key_hashes.discard(key_hash)
+        deps = frozenset(deps)
+        self.entries[key] = (exp_code, deps)
+        for dep in deps:
+            self.dep_keys.setdefault(dep, set()).add(key)
+        self.trim()
+
+    def trim(self) -> None:
+        while len(self.entries) > max(self.max_size, 0):
+            key = next(iter(self.entries))
+            self.__remove(key)
+            self.evictions += 1
+
+    def invalidate(self, ident: str) -> None:
+        # Remove all cached expansions depending on the defined or undefined macro.
+        for key in self.dep_keys.pop(ident, ()):
+            if key in self.entries:
+                self.__remove(key)
+                self.invalidations += 1
+
+    def get_stats(self) -> dict[str, int]:
+        return {"size": len(self.entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "invalidations": self.invalidations}
+
+    def __remove(self, key: tuple[str, ...]) -> None:
+        (_, deps) = self.entries.pop(key)
+        for dep in deps:
+            keys = self.dep_keys.get(dep)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.dep_keys[dep]
+
+
 class Directive():
-    def __init__(self, re_ptrn: re.Pattern | None = None, handler: Callable[[dict[str, str | None], str], None] | None = None) -> None:
+    RE_PTRN_KEYWORD = re.compile(r"^[ \t]*#[ \t]*(?P<keyword>\w+)", re.ASCII)
+
+    __slots__ = ("re_ptrn", "handler", "group")
+
+    def __init__(self, re_ptrn: re.Pattern | None = None, handler: Callable[[dict[str, str | None], str], None] | None = None,
+                 group: DirectiveGroup = DirectiveGroup.STANDARD) -> None:
         self.re_ptrn: re.Pattern | None = re_ptrn
         self.handler: Callable[[dict[str, str | None], str], None] | None = handler
+        # Conditional directives are processed also in the inactive conditional branches.
+        self.group: DirectiveGroup = group
 
-    def process(self, code: str) -> bool:
+    def process(self, code: str, joined_code: str | None = None) -> bool:
         processed = False
         if self.re_ptrn and self.handler:
-            joined_code = CodeFormatter.remove_line_escapes(code)
+            if joined_code is None:
+                joined_code = CodeFormatter.remove_line_escapes(code)
             re_match = self.re_ptrn.match(joined_code)
             if re_match:
                 self.handler(re_match.groupdict(), code)
@@ -412,73 +1477,533 @@ class Directive():
 
 
 class Macro():
-    def __init__(self, identifier: str = "", args: list[str] | None = None, body: str = "") -> None:
-        self.identifier: str = identifier
-        self.args: list[str] = args if args is not None else []
-        self.body: str = body
+    class SlotType(IntEnum):
+        ARG = 0         # Fully expanded argument value.
+        RAW_ARG = 1     # Argument value concatenated by the ## operator.
+        STR_ARG = 2     # Argument value stringified by the # operator.
+
+    RE_PTRN_CONCAT = re.compile(r"[\s\\]*##[\s\\]*", re.ASCII)
+    # Start of the #define directive up to the macro body in the code with line escapes replaced by newlines.
+    RE_PTRN_BODY_START = re.compile(r"^\s*#\s*define\s+\w+(?:\([^\)]*\)|[ \t]*)", re.ASCII)
+
+    __slots__ = ("identifier", "args", "__body", "__define_code", "__subst_plan")
+
+    def __init__(self, identifier: str = "", args: Iterable[str] | None = None, body: str = "", define_code: str | None = None) -> None:
+        # Identifiers and argument names are interned, because the same names are used by many macros and in the macro references.
+        self.identifier: str = sys.intern(identifier)
+        self.args: tuple[str, ...] = tuple(sys.intern(arg) for arg in args) if args else ()
+        # Body is parsed from the code of the #define directive when it is needed for the first time, because most of the
+        # macros defined in the headers are never referenced.
+        self.__body: str | None = body if define_code is None else None
+        self.__define_code: str | None = define_code
+        # Substitution plan, i.e., the body split into literal segments around the argument slots, created on the first expansion.
+        self.__subst_plan: tuple[tuple[str, ...], tuple[tuple[int, Macro.SlotType], ...]] | None = None
+
+    @property
+    def body(self) -> str:
+        # Macros can be shared by the preprocessor instances running in multiple threads, so the body can be parsed by two
+        # threads at once. Directive code is cleared only after the body is set, so the parsed body is never lost.
+        body = self.__body
+        if body is None:
+            define_code = self.__define_code
+            if define_code is None:
+                return self.__body or ""
+            body = self.__parse_body(define_code)
+            self.__body = body
+            self.__define_code = None
+        return body
+
+    @body.setter
+    def body(self, body: str) -> None:
+        self.__body = body
+        self.__define_code = None
+        self.__subst_plan = None
+
+    @property
+    def parsed(self) -> bool:
+        return self.__body is not None
 
     def expand_args(self, arg_vals: list[str] | None = None, fully_exp_arg_vals: list[str] | None = None) -> str:
         exp_code = self.body
-        if arg_vals is not None and fully_exp_arg_vals is not None:
-            for (arg_idx, arg_name) in enumerate(self.args):
-                # Handle variadic arguments.
-                if arg_name == "...":
-                    arg_name = "__VA_ARGS__"
-                    arg_val = ""
-                    fully_exp_arg_val = ""
-                    for arg_val_idx in range(arg_idx, len(arg_vals)):
-                        arg_val = f"{arg_val}{arg_vals[arg_val_idx]}, "
-                        fully_exp_arg_val = f"{fully_exp_arg_val}{fully_exp_arg_vals[arg_val_idx]}, "
-                    arg_val = arg_val[:-2]  # Remove the last two characters, i.e. ", " that is used for argument separation.
-                    fully_exp_arg_val = fully_exp_arg_val[:-2]
+        subst_plan = self.__subst_plan
+        if subst_plan is None:
+            subst_plan = self.__create_subst_plan()
+            self.__subst_plan = subst_plan
+        (literals, slots) = subst_plan
+        if arg_vals is not None and fully_exp_arg_vals is not None and slots:
+            exp_parts = [literals[0]]
+            for (slot_idx, (arg_idx, slot_type)) in enumerate(slots):
+                if slot_type == Macro.SlotType.ARG:
+                    arg_val = self.__get_arg_val(fully_exp_arg_vals, arg_idx)
+                elif slot_type == Macro.SlotType.RAW_ARG:
+                    arg_val = self.__get_arg_val(arg_vals, arg_idx)
                 else:
-                    # If argument value is specified, then use it. Otherwise use empty string (not enough parameters in a macro reference).
-                    arg_val = arg_vals[arg_idx] if arg_idx < len(arg_vals) else ""
-                    fully_exp_arg_val = fully_exp_arg_vals[arg_idx] if arg_idx < len(fully_exp_arg_vals) else ""
-                # Perform concatenatenation of macro arguments specified by the ## operator.
-                exp_code = re.sub(rf"[\s\\]*##[\s\\]*{arg_name}", rf"##{arg_val}", exp_code, count=0, flags=re.ASCII + re.MULTILINE)
-                exp_code = re.sub(rf"{arg_name}[\s\\]*##[\s\\]*", rf"{arg_val}##", exp_code, count=0, flags=re.ASCII + re.MULTILINE)
-                # Perform stringification specified by the # operator.
-                exp_code = re.sub(rf"(^|[^#])#\s*{arg_name}($|[^\w])", r'\g<1>"' + arg_val.replace("\\", "\\\\") + r'"\g<2>',
-                                  exp_code, count=0, flags=re.ASCII + re.MULTILINE)
-                # Replace the macro argument in macro body with the fully expanded argument value.
-                exp_code = re.sub(rf"(^|[^\w]){arg_name}($|[^\w])", rf"\g<1>{fully_exp_arg_val}\g<2>",
-                                  exp_code, count=0, flags=re.ASCII + re.MULTILINE)
+                    arg_val = f"\"{self.__get_arg_val(arg_vals, arg_idx)}\""
+                exp_parts.append(arg_val)
+                exp_parts.append(literals[slot_idx + 1])
+            exp_code = "".join(exp_parts)
         # Perform concatenatenations specified by the ## operator by removing the operator and its surrounding spaces.
-        exp_code = re.sub(r"[\s\\]*##[\s\\]*", "", exp_code, count=0, flags=re.ASCII + re.MULTILINE)
+        if "##" in exp_code:
+            exp_code = Macro.RE_PTRN_CONCAT.sub("", exp_code)
         # Perform an lstrip in case some of the expanded arguments are empty and generate a whitespace at the beginning of the macro body.
         return exp_code.lstrip()
 
+    def __get_arg_val(self, arg_vals: list[str], arg_idx: int) -> str:
+        # Variadic argument value consists of all remaining argument values separated by commas.
+        if self.args[arg_idx] == "...":
+            return ", ".join(arg_vals[arg_idx:])
+        # If argument value is specified, then use it. Otherwise use empty string (not enough parameters in a macro reference).
+        return arg_vals[arg_idx] if arg_idx < len(arg_vals) else ""
+
+    def __parse_body(self, define_code: str) -> str:
+        multiline_code = CodeFormatter.remove_line_escapes(define_code, True)
+        re_match = Macro.RE_PTRN_BODY_START.match(multiline_code)
+        if re_match is None:
+            # Not possible for the macros defined by the processed #define directives, because their formatting has been already
+            # checked by the preprocessor. The macros are shared by the preprocessor instances, so there is no logger to report to.
+            return ""
+        body = multiline_code[re_match.end():].rstrip()
+        if body.startswith("\n"):
+            body = dedent(body[1:])
+        else:
+            body = body.lstrip()
+        return body
+
+    def __create_subst_plan(self) -> tuple[tuple[str, ...], tuple[tuple[int, SlotType], ...]]:
+        body = self.body
+        if not self.args:
+            return ((body,), ())
+        arg_idxs = {("__VA_ARGS__" if arg_name == "..." else arg_name): arg_idx for (arg_idx, arg_name) in enumerate(self.args) if arg_name}
+        literals = []
+        slots = []
+        literal_start_pos = 0
+        for re_match in CodeFormatter.RE_PTRN_IDENT.finditer(body):
+            arg_idx = arg_idxs.get(re_match.group())
+            if arg_idx is None:
+                continue
+            (slot_start_pos, slot_end_pos) = re_match.span()
+            if Macro.__is_concatenated(body, slot_start_pos, slot_end_pos):
+                slot_type = Macro.SlotType.RAW_ARG
+            else:
+                slot_type = Macro.SlotType.ARG
+                # Check for the # operator optionally followed by whitespaces and not preceded by another #.
+                hash_pos = slot_start_pos - 1
+                while hash_pos >= literal_start_pos and body[hash_pos] in CodeFormatter.SPACE_CHARS:
+                    hash_pos -= 1
+                if hash_pos >= literal_start_pos and body[hash_pos] == "#" and (hash_pos == 0 or body[hash_pos - 1] != "#"):
+                    slot_type = Macro.SlotType.STR_ARG
+                    slot_start_pos = hash_pos
+            literals.append(body[literal_start_pos: slot_start_pos])
+            slots.append((arg_idx, slot_type))
+            literal_start_pos = slot_end_pos
+        literals.append(body[literal_start_pos:])
+        return (tuple(literals), tuple(slots))
+
+    @staticmethod
+    def __is_concatenated(body: str, start_pos: int, end_pos: int) -> bool:
+        concat_chars = CodeFormatter.SPACE_CHARS | {"\\"}
+        pos = start_pos - 1
+        while pos >= 0 and body[pos] in concat_chars:
+            pos -= 1
+        if pos >= 1 and body[pos - 1: pos + 1] == "##":
+            return True
+        pos = end_pos
+        while pos < len(body) and body[pos] in concat_chars:
+            pos += 1
+        return body.startswith("##", pos)
+
+
+class PreprocSnapshot():
+    """A snapshot of the preprocessor state created by the :py:meth:`neatcpp.NeatCpp.snapshot` method. The snapshot contains
+    the defined macros, include directories, excluded macros and files, tab size, conditional directives state and the
+    files included with the ``#pragma once`` directive. The snapshot is not modified by the preprocessor and can be restored
+    repeatedly by the :py:meth:`neatcpp.NeatCpp.restore` method or saved to a file and loaded in another process.
+    """
+    def __init__(self, macros: dict[str, Macro], macro_ranks: dict[str, int], macro_rank_bounds: tuple[int, int],
+                 incl_dir_paths: list[Path], exclude_macros_files: list[str], branch_states: list[ConditionManager.BranchState],
+                 included_paths: set[Path], tab_size: int = 4) -> None:
+        self.version: str = __version__
+        self.macros: dict[str, Macro] = macros
+        self.macro_ranks: dict[str, int] = macro_ranks
+        self.macro_rank_bounds: tuple[int, int] = macro_rank_bounds
+        self.incl_dir_paths: tuple[Path, ...] = tuple(incl_dir_paths)
+        self.exclude_macros_files: tuple[str, ...] = tuple(exclude_macros_files)
+        self.branch_states: tuple[ConditionManager.BranchState, ...] = tuple(branch_states)
+        self.included_paths: frozenset[Path] = frozenset(included_paths)
+        self.tab_size: int = tab_size
+
+    def save(self, file_path: str | Path, logger: PreprocLogger = log) -> None:
+        """Saves the snapshot to a binary file.
+
+        Args:
+            file_path (str): Save file path.
+            logger (PreprocLogger, optional): Logger of the console messages and errors. Defaults to the module-level logger.
+        """
+        with open(file_path, "wb") as file:
+            logger.msg(f"Saving preprocessor snapshot to file '{Path(file_path).name}'.")
+            pickle.dump(self, file, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(file_path: str | Path, logger: PreprocLogger = log) -> "PreprocSnapshot | None":
+        """Loads the snapshot from a binary file saved by the :py:meth:`neatcpp.PreprocSnapshot.save` method.
+
+        .. warning::
+            The file is loaded using the Python's ``pickle`` module, so only trusted files should be loaded.
+
+        Args:
+            file_path (str): Path to the snapshot file.
+            logger (PreprocLogger, optional): Logger of the console messages and errors. Defaults to the module-level logger.
+
+        Returns:
+            PreprocSnapshot | None: Loaded snapshot or None if the file cannot be loaded or if it has been saved by
+                a different version of neatcpp.
+        """
+        snapshot = None
+        try:
+            with open(file_path, "rb") as file:
+                logger.msg(f"Loading preprocessor snapshot from file '{Path(file_path).name}'.")
+                snapshot = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as exc:
+            logger.err(f"Snapshot file '{file_path}' cannot be loaded: {exc}", logger.ErrSeverity.CRITICAL)
+        if snapshot is not None and (not isinstance(snapshot, PreprocSnapshot) or snapshot.version != __version__):
+            logger.err(f"Snapshot file '{file_path}' is not compatible with {__module_name__} {__version__}.", logger.ErrSeverity.CRITICAL)
+            snapshot = None
+        return snapshot
+
+
+class MacroDatabase():
+    """A database of macros and other preprocessor state created from the processed files, typically the prelude headers,
+    that can be saved to a file and loaded later instead of processing the same files again. The database is valid only
+    if none of the files read during its creation has been changed and if the files searched during its creation would be
+    found in the same way, i.e., no previously missing file can be found and no found file is shadowed by a new file.
+    """
+    FILE_ID = b"NEATCPPDB"
+    FORMAT_VERSION = 2
+
+    def __init__(self, key: tuple, snapshot: PreprocSnapshot, file_stamps: dict[Path, tuple[int, int, str]],
+                 include_guards: dict[Path, tuple[str, bool]],
+                 file_lookups: dict[tuple[str, bool, Path | None], Path | None] | None = None) -> None:
+        self.key: tuple = key
+        self.snapshot: PreprocSnapshot = snapshot
+        self.file_stamps: dict[Path, tuple[int, int, str]] = file_stamps
+        self.include_guards: dict[Path, tuple[str, bool]] = include_guards
+        self.file_lookups: dict[tuple[str, bool, Path | None], Path | None] = file_lookups if file_lookups is not None else {}
+
+    def is_valid(self, key: tuple, file_io: FileIO) -> bool:
+        """Checks if the database has been created with the same key, e.g., the same processed files, if none of the
+        files read during its creation has been changed and if all files searched during its creation are found at the same
+        paths, i.e., no previously missing file can be found and no new file shadows the previously found file.
+
+        Args:
+            key (tuple): Key identifying the processed files and settings used to create the database.
+            file_io (FileIO): File input object used to search the files.
+
+        Returns:
+            bool: True if the database is valid.
+        """
+        if self.key != key:
+            return False
+        if not all(FileIO.is_file_unchanged(file_path, file_stamp) for (file_path, file_stamp) in self.file_stamps.items()):
+            return False
+        return all(file_io.find_file(name, angle_form, dir_path, log_missing=False) == found_file_path
+                   for ((name, angle_form, dir_path), found_file_path) in self.file_lookups.items())
+
+    def save(self, file_path: str | Path, logger: PreprocLogger = log) -> None:
+        """Saves the database to a compressed binary file.
+
+        Args:
+            file_path (str): Save file path.
+            logger (PreprocLogger, optional): Logger of the console messages and errors. Defaults to the module-level logger.
+        """
+        snapshot = self.snapshot
+        data = {
+            "version": __version__,
+            "key": self.key,
+            "macros": [(snapshot.macros[macro_id].identifier, snapshot.macros[macro_id].args, snapshot.macros[macro_id].body)
+                       for macro_id in sorted(snapshot.macros, key=snapshot.macro_ranks.__getitem__)],
+            "incl_dir_paths": [str(path) for path in snapshot.incl_dir_paths],
+            "exclude_macros_files": list(snapshot.exclude_macros_files),
+            "tab_size": snapshot.tab_size,
+            "branch_states": [int(state) for state in snapshot.branch_states],
+            "included_paths": [str(path) for path in snapshot.included_paths],
+            "file_stamps": {str(path): stamp for (path, stamp) in self.file_stamps.items()},
+            "include_guards": {str(path): guard for (path, guard) in self.include_guards.items()},
+            "file_lookups": [(name, angle_form, str(dir_path) if dir_path is not None else None,
+                              str(found_file_path) if found_file_path is not None else None)
+                             for ((name, angle_form, dir_path), found_file_path) in self.file_lookups.items()]}
+        with open(file_path, "wb") as file:
+            logger.msg(f"Saving macro database to file '{Path(file_path).name}'.")
+            file.write(self.FILE_ID + bytes((self.FORMAT_VERSION,)))
+            file.write(zlib.compress(pickle.dumps(data, pickle.HIGHEST_PROTOCOL)))
+
+    @staticmethod
+    def load(file_path: str | Path, logger: PreprocLogger = log) -> "MacroDatabase | None":
+        """Loads the database from a file saved by the :py:meth:`neatcpp.MacroDatabase.save` method.
+
+        .. warning::
+            The file is loaded using the Python's ``pickle`` module, so only trusted files should be loaded.
+
+        Args:
+            file_path (str): Path to the database file.
+            logger (PreprocLogger, optional): Logger of the console messages and errors. Defaults to the module-level logger.
+
+        Returns:
+            MacroDatabase | None: Loaded database or None if the file does not exist, cannot be loaded or if it has been
+                saved by a different version of neatcpp.
+        """
+        if not Path(file_path).is_file():
+            return None
+        try:
+            with open(file_path, "rb") as file:
+                logger.msg(f"Loading macro database from file '{Path(file_path).name}'.")
+                header = file.read(len(MacroDatabase.FILE_ID) + 1)
+                if header != MacroDatabase.FILE_ID + bytes((MacroDatabase.FORMAT_VERSION,)):
+                    logger.err(f"Macro database file '{file_path}' has an unsupported format.", logger.ErrSeverity.WARNING)
+                    return None
+                data = pickle.loads(zlib.decompress(file.read()))
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError) as exc:
+            logger.err(f"Macro database file '{file_path}' cannot be loaded: {exc}", logger.ErrSeverity.WARNING)
+            return None
+        if data["version"] != __version__:
+            logger.msg(f"Macro database file '{Path(file_path).name}' created by a different version of {__module_name__} ignored.")
+            return None
+        macros = {ident: Macro(ident, args, body) for (ident, args, body) in data["macros"]}
+        snapshot = PreprocSnapshot(macros, {macro_id: rank for (rank, macro_id) in enumerate(macros)}, (-1, len(macros)),
+                                   [Path(path) for path in data["incl_dir_paths"]], data["exclude_macros_files"],
+                                   [ConditionManager.BranchState(state) for state in data["branch_states"]],
+                                   {Path(path) for path in data["included_paths"]}, data["tab_size"])
+        return MacroDatabase(data["key"], snapshot, {Path(path): tuple(stamp) for (path, stamp) in data["file_stamps"].items()},
+                             {Path(path): tuple(guard) for (path, guard) in data["include_guards"].items()},
+                             {(name, angle_form, Path(dir_path) if dir_path is not None else None):
+                              Path(found_path) if found_path is not None else None
+                              for (name, angle_form, dir_path, found_path) in data["file_lookups"]})
+
+
+class DependencyManifest():
+    """Dependencies of the output files created by the :py:meth:`neatcpp.NeatCpp.process_files_incremental` method, i.e.,
+    the processed and included files and the definitions of the macros consulted while processing the input files.
+    The manifest is saved as a JSON file and used to skip the processing of the input files if their output file exists
+    and none of its dependencies has changed.
+    """
+    FORMAT_VERSION = 1
+
+    def __init__(self) -> None:
+        # Dependencies of each output file. Each entry is a dictionary with the key identifying the processed files and
+        # settings, stamps of the processed and included files, included files not found, definitions of the consulted macros
+        # defined before the processing and the consulted identifiers that have not been defined before the processing.
+        self.entries: dict[str, dict] = {}
+
+    def add_entry(self, out_file_path: str | Path, key: list, file_stamps: dict[Path, tuple[int, int, str] | None],
+                  missing_files: set[tuple[str, bool, Path | None]], macros: dict[str, Macro], undefined_ids: set[str]) -> None:
+        """Adds or replaces the dependencies of an output file.
+
+        Args:
+            out_file_path (str): Path to the output file.
+            key (list): Key identifying the processed files and settings used to create the output file.
+            file_stamps (dict): Modification time, size and content digest of the processed and included files.
+            missing_files (set): Included file names, include forms (True for angle brackets) and including file
+                directories of the included files that have not been found.
+            macros (dict): Consulted macros defined before the processing.
+            undefined_ids (set): Consulted identifiers that have not been defined as macros before the processing.
+        """
+        self.entries[str(Path(out_file_path).resolve())] = {
+            "key": key,
+            "files": {str(path): list(stamp) if stamp is not None else None for (path, stamp) in file_stamps.items()},
+            "missing_files": sorted([name, angle_form, str(dir_path) if dir_path is not None else None]
+                                    for (name, angle_form, dir_path) in missing_files),
+            "macros": {ident: [list(macro.args), macro.body] for (ident, macro) in sorted(macros.items())},
+            "undefined": sorted(undefined_ids)}
+
+    def is_up_to_date(self, out_file_path: str | Path, key: list, macros: dict[str, Macro], file_io: FileIO) -> bool:
+        """Checks if the output file exists and if it has been created with the same key and none of its dependencies has
+        changed, i.e., the processed and included files are unchanged, no previously missing included file can be found
+        and the consulted macros have the same definitions.
+
+        Args:
+            out_file_path (str): Path to the output file.
+            key (list): Key identifying the processed files and settings used to create the output file.
+            macros (dict): Macros defined before the processing.
+            file_io (FileIO): File input object used to search the included files.
+
+        Returns:
+            bool: True if the output file is up to date.
+        """
+        entry = self.entries.get(str(Path(out_file_path).resolve()))
+        if entry is None or entry["key"] != key or not Path(out_file_path).is_file():
+            return False
+        for (path, stamp) in entry["files"].items():
+            if stamp is None or not FileIO.is_file_unchanged(Path(path), tuple(stamp)):
+                return False
+        for (name, angle_form, dir_path) in entry["missing_files"]:
+            if file_io.find_file(name, angle_form, Path(dir_path) if dir_path is not None else None, log_missing=False) is not None:
+                return False
+        for (ident, (args, body)) in entry["macros"].items():
+            macro = macros.get(ident)
+            if macro is None or list(macro.args) != args or macro.body != body:
+                return False
+        return not any(ident in macros for ident in entry["undefined"])
+
+    def save(self, file_path: str | Path, logger: PreprocLogger = log) -> None:
+        """Saves the manifest to a JSON file.
+
+        Args:
+            file_path (str): Save file path.
+            logger (PreprocLogger, optional): Logger of the console messages and errors. Defaults to the module-level logger.
+        """
+        with open(file_path, "w", encoding="utf-8") as file:
+            logger.msg(f"Saving dependency manifest to file '{Path(file_path).name}'.")
+            json.dump({"format_version": self.FORMAT_VERSION, "version": __version__, "entries": self.entries}, file, indent=1)
+
+    @staticmethod
+    def load(file_path: str | Path, logger: PreprocLogger = log) -> "DependencyManifest":
+        """Loads the manifest from a file saved by the :py:meth:`neatcpp.DependencyManifest.save` method.
+
+        Args:
+            file_path (str): Path to the manifest file.
+            logger (PreprocLogger, optional): Logger of the console messages and errors. Defaults to the module-level logger.
+
+        Returns:
+            DependencyManifest: Loaded manifest or an empty manifest if the file does not exist, cannot be loaded or if it
+                has been saved by a different version of neatcpp.
+        """
+        manifest = DependencyManifest()
+        if Path(file_path).is_file():
+            try:
+                with open(file_path, "r", encoding="utf-8") as file:
+                    data = json.load(file)
+                if data.get("format_version") == DependencyManifest.FORMAT_VERSION and data.get("version") == __version__:
+                    manifest.entries = data["entries"]
+            except (OSError, ValueError, AttributeError, KeyError) as exc:
+                logger.err(f"Dependency manifest file '{file_path}' cannot be loaded: {exc}", logger.ErrSeverity.WARNING)
+        return manifest
+
 
 class NeatCpp():
     """A minimalistic C preprocessor class.
 
+    Each instance keeps its whole processing state including the logger, so distinct instances can be used concurrently
+    from multiple threads, e.g., restored from the same snapshot. A single instance must not be used from multiple threads
+    at the same time.
+
     Attributes:
         macros (dict[str, Macro]): A dictionary with all macros defined by the processed ``#define`` directives. This dictionary is
             typically updated and used by this class itself, but can be modified by the user if necessary.
         exclude_macros_files (list[str]): A list of user-defined macro names and file names to be excluded from processing.
             The ``#define`` and ``#include`` directives for the specified macros and files will not be processed.
+        log (PreprocLogger): Logger of the console messages and errors with the location of the processed code. Defaults to
+            a copy of the module-level logger ``log`` made when the instance is created.
     """
-    def __init__(self) -> None:
-        self.__file_io: FileIO = FileIO()
+    RE_PTRN_DEFINED = re.compile(r"(?<!\w)defined\s*(?:\(\s*(?P<ident_p>\w+)\s*\)|(?P<ident>\w+))", re.ASCII)
+
+    def __init__(self, logger: PreprocLogger | None = None) -> None:
+        self.log: PreprocLogger = logger if logger is not None else log.spawn()
+        self.__file_io: FileIO = FileIO(self.log)
         self.__output: PreprocOutput = PreprocOutput()
-        self.__cond_mngr: ConditionManager = ConditionManager()
-        self.__directives: tuple[tuple[Directive, ...], ...] = (
-            # DirectiveGroup.STANDARD
-            (Directive(re.compile(r"^[ \t]*#[ \t]*define[ \t]+(?P<ident>\w+)(?:\((?P<args>[^\)]*)\))?", re.ASCII), self.__process_define),
-             Directive(re.compile(r"^[ \t]*#[ \t]*undef[ \t]+(?P<ident>\w+)", re.ASCII), self.__process_undef),
-             Directive(re.compile(r"^[ \t]*#[ \t]*include[ \t]+(?:\"|<)(?P<file>[^\">]+)(?:\"|>)", re.ASCII), self.__process_include)),
-            # DirectiveGroup.CONDITIONAL
-            (Directive(re.compile(r"^[ \t]*#[ \t]*if[ \t]+(?P<expr>.*)", re.ASCII), self.__process_if),
-             Directive(re.compile(r"^[ \t]*#[ \t]*elif[ \t]+(?P<expr>.*)", re.ASCII), self.__process_elif),
-             Directive(re.compile(r"^[ \t]*#[ \t]*else(?:\s|$)", re.ASCII), self.__process_else),
-             Directive(re.compile(r"^[ \t]*#[ \t]*endif(?:\s|$)", re.ASCII), self.__process_endif),
-             Directive(re.compile(r"^[ \t]*#[ \t]*ifdef[ \t]+(?P<expr>.*)", re.ASCII), self.__process_ifdef),
-             Directive(re.compile(r"^[ \t]*#[ \t]*ifndef[ \t]+(?P<expr>.*)", re.ASCII), self.__process_ifndef)))
-        self.macros: dict[str, Macro] = {}
+        self.__cond_mngr: ConditionManager = ConditionManager(self.log)
+        self.__incl_cache: IncludeCache = IncludeCache()
+        # Cache of the expanded macro references with a stack of identifiers consulted by the expansions being cached
+        # and a count of errors detected during the macro expansion, because expansions with errors are not cached.
+        self.__exp_cache: ExpansionCache = ExpansionCache()
+        self.__exp_deps_stack: list[set[str]] = []
+        self.__exp_errors: int = 0
+        # Directory of the currently processed file used to search the files included in the quoted form.
+        self.__proc_file_dir_path: Path | None = None
+        # Dependencies recorded by the process_files_incremental method, i.e., processed and included files, included files
+        # not found and identifiers consulted as potential macros. Dependencies are not recorded if the file paths are None.
+        self.__dep_file_paths: set[Path] | None = None
+        self.__dep_missing_files: set[tuple[str, bool, Path | None]] = set()
+        self.__dep_ids: set[str] = set()
+        # Profiler collecting the processing times and statistics if the profiling is enabled.
+        self.__profiler: Profiler | None = None
+        # Directives dispatched by their keyword, i.e., the identifier following the # symbol.
+        self.__directives: dict[str, Directive] = {
+            "define": Directive(re.compile(r"^[ \t]*#[ \t]*define[ \t]+(?P<ident>\w+)(?:\((?P<args>[^\)]*)\))?", re.ASCII),
+                                self.__process_define),
+            "undef": Directive(re.compile(r"^[ \t]*#[ \t]*undef[ \t]+(?P<ident>\w+)", re.ASCII), self.__process_undef),
+            "include": Directive(re.compile(r"^[ \t]*#[ \t]*include[ \t]+(?P<quote>\"|<)(?P<file>[^\">]+)(?:\"|>)", re.ASCII),
+                                 self.__process_include),
+            "if": Directive(re.compile(r"^[ \t]*#[ \t]*if[ \t]+(?P<expr>.*)", re.ASCII), self.__process_if, DirectiveGroup.CONDITIONAL),
+            "elif": Directive(re.compile(r"^[ \t]*#[ \t]*elif[ \t]+(?P<expr>.*)", re.ASCII), self.__process_elif,
+                              DirectiveGroup.CONDITIONAL),
+            "else": Directive(re.compile(r"^[ \t]*#[ \t]*else(?:\s|$)", re.ASCII), self.__process_else, DirectiveGroup.CONDITIONAL),
+            "endif": Directive(re.compile(r"^[ \t]*#[ \t]*endif(?:\s|$)", re.ASCII), self.__process_endif, DirectiveGroup.CONDITIONAL),
+            "ifdef": Directive(re.compile(r"^[ \t]*#[ \t]*ifdef[ \t]+(?P<expr>.*)", re.ASCII), self.__process_ifdef,
+                               DirectiveGroup.CONDITIONAL),
+            "ifndef": Directive(re.compile(r"^[ \t]*#[ \t]*ifndef[ \t]+(?P<expr>.*)", re.ASCII), self.__process_ifndef,
+                                DirectiveGroup.CONDITIONAL)}
+        self.__macros: dict[str, Macro] = {}
+        # Flag indicating that the macros dictionary and macro ranks are shared with a snapshot and must be copied before modification.
+        self.__macros_shared: bool = False
         self.exclude_macros_files: list[str] = []
+        # Number of columns between the tab stops used to replace the tabs by spaces in the processed code.
+        self.tab_size: int = 4
+        # Expansion order of the macros represented by ranks that are kept up to date on each #define and #undef without
+        # reordering the macros dictionary. The dictionary is sorted by the ranks only when it is accessed from outside
+        # of this class and the ranks are rebuilt from the dictionary order if it has been modified from outside.
+        self.__ranked_macros: dict[str, Macro] | None = None
+        self.__macro_ranks: dict[str, int] = {}
+        self.__macro_rank_lo: int = -1
+        self.__macro_rank_hi: int = 0
+        self.__macros_ordered: bool = True
 
     # ----- INTERFACE METHODS ----- #
+    @property
+    def macros(self) -> dict[str, Macro]:
+        """Dictionary with all macros defined by the processed ``#define`` directives in the order of their expansion.
+
+        Returns:
+            dict[str, Macro]: Dictionary of macros with macro identifiers as keys.
+        """
+        self.__unshare_macros()
+        if not self.__macros_ordered:
+            macro_ranks = self.__get_macro_ranks()
+            self.__macros = {macro_id: self.__macros[macro_id]
+                             for macro_id in sorted(self.__macros, key=lambda macro_id: macro_ranks.get(macro_id, self.__macro_rank_hi))}
+            self.__ranked_macros = self.__macros
+            self.__macros_ordered = True
+        # Macros can be modified outside of this class, so the cached macro expansions may not be valid anymore.
+        self.__exp_cache.clear()
+        return self.__macros
+
+    @macros.setter
+    def macros(self, macros: dict[str, Macro]) -> None:
+        self.__macros = macros
+        self.__macros_shared = False
+        self.__macros_ordered = True
+        self.__exp_cache.clear()
+
+    @property
+    def expansion_cache_size(self) -> int:
+        """Maximum number of the fully expanded macro references stored in the expansion cache. Expansions of the object-like
+        macros and of the function-like macros with the same argument values are reused until any macro they depend on is
+        defined or undefined. The least recently used expansions are removed if the cache is full. Value 0 disables the cache.
+
+        Returns:
+            int: Maximum number of the cached macro expansions. Defaults to 4096.
+        """
+        return self.__exp_cache.max_size
+
+    @expansion_cache_size.setter
+    def expansion_cache_size(self, size: int) -> None:
+        self.__exp_cache.max_size = size
+        self.__exp_cache.trim()
+
+    @property
+    def prefetch_budget(self) -> int:
+        """Maximum size in bytes of the included files read in advance. If the value is greater than 0, then the files
+        included by each read file are read by background threads while the file is processed, so the processing does not
+        wait for the slow file systems. Files that do not fit into the remaining budget are read when they are included.
+        Value 0 disables the prefetching.
+
+        Returns:
+            int: Maximum size of the prefetched files not processed yet. Defaults to 0.
+        """
+        return self.__file_io.prefetch_budget
+
+    @prefetch_budget.setter
+    def prefetch_budget(self, budget: int) -> None:
+        self.__file_io.prefetch_budget = budget
+
     @property
     def output(self) -> str:
         """Processed output string.
@@ -511,14 +2036,202 @@ class NeatCpp():
         self.__file_io.reset()
         self.__output.reset()
         self.__cond_mngr.reset()
-        self.macros = {}
+        self.__incl_cache.reset()
+        self.__exp_cache.reset()
+        self.__proc_file_dir_path = None
+        if self.__profiler is not None:
+            self.__profiler.reset()
+        self.__macros = {}
+        self.__macros_shared = False
+        self.__macros_ordered = True
         self.exclude_macros_files = []
+        self.tab_size = 4
 
     def reset_output(self) -> None:
         """Resets the preprocessor output only. Other internal values remain unchanged.
         """
         self.__output.reset()
 
+    def close(self) -> None:
+        """Stops the background threads reading the included files in advance (see :py:attr:`neatcpp.NeatCpp.prefetch_budget`)
+        and releases the files read by them. The preprocessor can still be used, the threads are started again if needed.
+        The threads are stopped also by the :py:meth:`neatcpp.NeatCpp.reset` method.
+        """
+        self.__file_io.close()
+
+    def snapshot(self) -> PreprocSnapshot:
+        """Creates a snapshot of the current preprocessor state, i.e., defined macros, include directories, excluded macros
+        and files, conditional directives state and files included with the ``#pragma once`` directive. The preprocessor
+        output is not included in the snapshot.
+
+        The macros are shared between the preprocessor and the snapshot until they are modified, so creating the snapshot
+        does not require copying of all macros.
+
+        Returns:
+            PreprocSnapshot: Snapshot of the preprocessor state.
+        """
+        macro_ranks = self.__get_macro_ranks()
+        self.__macros_shared = True
+        return PreprocSnapshot(self.__macros, macro_ranks, (self.__macro_rank_lo, self.__macro_rank_hi),
+                               self.__file_io.incl_dir_paths[1:], self.exclude_macros_files,
+                               [*self.__cond_mngr.branch_state_stack, self.__cond_mngr.branch_state],
+                               self.__incl_cache.included_paths, self.tab_size)
+
+    def restore(self, snapshot: PreprocSnapshot) -> None:
+        """Restores the preprocessor state from the snapshot created by the :py:meth:`neatcpp.NeatCpp.snapshot` method.
+        The preprocessor output is not modified.
+
+        The macros are shared between the preprocessor and the snapshot until they are modified, so the restoration
+        does not require copying of all macros.
+
+        Args:
+            snapshot (PreprocSnapshot): Snapshot of the preprocessor state to be restored.
+        """
+        self.__macros = snapshot.macros
+        self.__macros_ordered = False
+        self.__exp_cache.clear()
+        self.__macro_ranks = snapshot.macro_ranks
+        self.__ranked_macros = snapshot.macros
+        (self.__macro_rank_lo, self.__macro_rank_hi) = snapshot.macro_rank_bounds
+        self.__macros_shared = True
+        self.__file_io.incl_dir_paths = [Path(""), *snapshot.incl_dir_paths]
+        self.exclude_macros_files = list(snapshot.exclude_macros_files)
+        self.tab_size = snapshot.tab_size
+        self.__cond_mngr.branch_state_stack = list(snapshot.branch_states[:-1])
+        self.__cond_mngr.branch_state = snapshot.branch_states[-1]
+        self.__incl_cache.included_paths = set(snapshot.included_paths)
+
+    def save_macro_db(self, db_file_path: str | Path, *file_paths: str | Path) -> None:
+        """Saves the current preprocessor state (see :py:meth:`neatcpp.NeatCpp.snapshot`) together with the known include
+        guards into a macro database file. The database can be loaded later by the :py:meth:`neatcpp.NeatCpp.load_macro_db`
+        method instead of processing the specified files again.
+
+        Args:
+            db_file_path (str): Path to the macro database file.
+            file_paths (str): One or more arguments specifying paths to the processed files, e.g., prelude headers, that
+                have been used to create the current preprocessor state. All files read and searched by the preprocessor
+                since its last reset are used to check the validity of the database when it is loaded.
+        """
+        MacroDatabase(self.__get_macro_db_key(file_paths), self.snapshot(), dict(self.__file_io.file_stamps),
+                      self.__incl_cache.get_guards(), dict(self.__file_io.file_lookups)).save(db_file_path, self.log)
+
+    def load_macro_db(self, db_file_path: str | Path, *file_paths: str | Path) -> bool:
+        """Loads the preprocessor state from the macro database file saved by the :py:meth:`neatcpp.NeatCpp.save_macro_db`
+        method if the database has been created from the same files with the same include directories and excluded
+        macros and files, if none of the files read during the database creation has been changed since then and if all
+        files searched during the database creation would be found at the same paths, e.g., no missing included file
+        has been created since then.
+
+        Args:
+            db_file_path (str): Path to the macro database file.
+            file_paths (str): One or more arguments specifying paths to the files, e.g., prelude headers, used to create
+                the database.
+
+        Returns:
+            bool: True if the database has been loaded, False if it does not exist or is not valid anymore and the
+                specified files need to be processed again.
+        """
+        macro_db = MacroDatabase.load(db_file_path, self.log)
+        # Files are searched again to detect the files created since they have been searched by this preprocessor.
+        self.__file_io.clear_lookups()
+        if macro_db is None or not macro_db.is_valid(self.__get_macro_db_key(file_paths), self.__file_io):
+            self.log.msg(f"Macro database '{Path(db_file_path).name}' not loaded, because it is missing or outdated.")
+            return False
+        self.restore(macro_db.snapshot)
+        self.__file_io.file_stamps.update(macro_db.file_stamps)
+        self.__file_io.file_lookups.update(macro_db.file_lookups)
+        self.__incl_cache.add_guards(macro_db.include_guards)
+        return True
+
+    def is_up_to_date(self) -> bool:
+        """Checks if none of the files read by the preprocessor since its last reset, including the files read during the
+        creation of the loaded macro database, has been changed, i.e., if the current state can still be used.
+
+        Returns:
+            bool: True if none of the read files has been changed.
+        """
+        return all(FileIO.is_file_unchanged(file_path, file_stamp) for (file_path, file_stamp) in self.__file_io.file_stamps.items())
+
+    def clear_file_lookups(self) -> None:
+        """Clears the cached listings of the searched directories and the cached results of the included files searches.
+        Files not found are not searched again until the results are cleared, so this method needs to be called to find
+        the files created since they have been searched, including the files shadowing the previously found files in the
+        preceding include directories.
+        """
+        self.__file_io.clear_lookups()
+
+    def enable_profiling(self, enable: bool = True) -> None:
+        """Enables or disables the collection of the profiling data available from the :py:meth:`neatcpp.NeatCpp.get_profile`
+        method. Enabling the profiling clears the previously collected data. The data are cleared also by the
+        :py:meth:`neatcpp.NeatCpp.reset` method.
+
+        Args:
+            enable (bool, optional): Flag to enable the profiling. Defaults to True.
+        """
+        self.__profiler = Profiler() if enable else None
+        self.__file_io.profiler = self.__profiler
+
+    def get_profile(self, top_num: int = 10) -> dict:
+        """Returns the profiling data collected since the profiling has been enabled by the
+        :py:meth:`neatcpp.NeatCpp.enable_profiling` method. The data contain the time spent in the processing phases, i.e.,
+        input code splitting (``input``), file search and reading (``file_io``), processing of each directive type
+        (``directive:<name>``), macro expansion (``expand_macros``) and expression evaluation (``evaluate``), the most
+        expanded macros by the expansion count and cumulative expansion time, the deepest chains of nested macro expansions,
+        the most included files and the include cache, file search cache, file prefetch and macro expansion cache statistics.
+        Times are in seconds.
+
+        Args:
+            top_num (int, optional): Maximum number of the listed macros, expansion chains and included files.
+                Defaults to 10.
+
+        Returns:
+            dict: Profiling data in a JSON compatible dictionary. Empty dictionary if the profiling is not enabled.
+        """
+        if self.__profiler is None:
+            return {}
+        profile = self.__profiler.get_report(top_num)
+        profile["include_cache"] = {"hits": self.__incl_cache.hits, "misses": self.__incl_cache.misses,
+                                    "skips": self.__incl_cache.skips}
+        profile["file_search_cache"] = {"hits": self.__file_io.find_hits, "misses": self.__file_io.find_misses}
+        profile["prefetch"] = {"hits": self.__file_io.prefetch_hits, "skips": self.__file_io.prefetch_skips}
+        profile["expansion_cache"] = self.get_expansion_cache_stats()
+        return profile
+
+    def get_expansion_cache_stats(self) -> dict[str, int]:
+        """Returns the statistics of the macro expansion cache (see :py:attr:`neatcpp.NeatCpp.expansion_cache_size`) collected
+        since the last :py:meth:`neatcpp.NeatCpp.reset`.
+
+        Returns:
+            dict[str, int]: Current (``size``) and maximum (``max_size``) number of the cached expansions, number of the
+                reused (``hits``) and not found (``misses``) expansions, number of the expansions removed because the cache
+                was full (``evictions``) and because a macro they depend on has been defined or undefined (``invalidations``).
+        """
+        return self.__exp_cache.get_stats()
+
+    def add_directive(self, keyword: str, handler: Callable[[dict[str, str | None], str], None],
+                      re_ptrn: str | re.Pattern | None = None) -> None:
+        """Adds a handler of a preprocessor directive not processed by the preprocessor, e.g., ``#pragma``, ``#error``,
+        ``#line`` or ``#include_next``, or replaces the handler of the ``#define``, ``#undef`` or ``#include`` directive.
+        The handler is called for the directives with the specified keyword in the active conditional branches.
+        Conditional directives cannot be replaced.
+
+        Args:
+            keyword (str): Directive keyword, i.e., the identifier following the ``#`` symbol.
+            handler (Callable[[dict[str, str | None], str], None]): Function called with the dictionary of the named groups
+                matched by the ``re_ptrn`` pattern and with the directive code.
+            re_ptrn (str | re.Pattern, optional): Regular expression pattern matched with the start of the directive code
+                with the line escapes removed. The handler is not called if the pattern does not match. Defaults to None,
+                i.e., a pattern matching the directive keyword followed by an optional expression in the ``expr`` group.
+        """
+        if keyword in self.__directives and self.__directives[keyword].group == DirectiveGroup.CONDITIONAL:
+            self.log.err(f"Conditional directive #{keyword} cannot be replaced.", self.log.ErrSeverity.WARNING)
+            return
+        if re_ptrn is None:
+            re_ptrn = rf"^[ \t]*#[ \t]*{re.escape(keyword)}(?:\s+(?P<expr>.*))?"
+        if isinstance(re_ptrn, str):
+            re_ptrn = re.compile(re_ptrn, re.ASCII + re.DOTALL)
+        self.__directives[keyword] = Directive(re_ptrn, handler)
+
     def save_output_to_file(self, file_path: str | Path, full_output: bool = False) -> None:
         """Saves the processed output to file.
 
@@ -528,9 +2241,8 @@ class NeatCpp():
                 all comments and whitespaces. Defaults to False.
         """
         with open(file_path, "w", encoding="utf-8") as file:
-            log.msg(f"Saving processed output to file '{Path(file_path).name}'.")
-            output = self.output_full if full_output else self.output
-            file.write(output)
+            self.log.msg(f"Saving processed output to file '{Path(file_path).name}'.")
+            self.__output.write(file, full_output)
 
     def add_include_dirs(self, *dir_paths: str | Path) -> None:
         """Adds paths to the included directories for searching files specified either manually or by the #include directives.
@@ -558,9 +2270,144 @@ class NeatCpp():
         for file_path in file_paths:
             file_code = self.__file_io.read_file(file_path)
             if file_code:
+                found_file_path = self.__file_io.find_file(file_path)
+                self.__proc_file_dir_path = found_file_path.parent
                 local_output_code += self.process_code(file_code, global_output, full_local_output, Path(file_path).name)
+                self.__proc_file_dir_path = None
+                self.__file_io.release_prefetched(found_file_path)
         return local_output_code
 
+    def process_files_stream(self, *file_paths: str | Path, out_file_path: str | Path, full_output: bool = False) -> None:
+        """Processes the specified C source files in a streaming mode and saves the processed output into a file.
+        The files are read line by line and the output is written into the output file as soon as it is produced, so the
+        used memory does not grow with the size of the processed files. The global internal preprocessor output is not
+        modified by this method.
+
+        Args:
+            file_paths (str): One or more arguments specifying paths to processed files.
+            out_file_path (str): Path to the output file.
+            full_output (bool, optional): Flag to save the full output, i.e., including all preprocessor directives,
+                all comments and whitespaces. Defaults to False.
+        """
+        with open(out_file_path, "w", encoding="utf-8") as out_file:
+            self.log.msg(f"Streaming processed output to file '{Path(out_file_path).name}'.")
+            stream_output = PreprocOutput(out_file, full_output)
+            for file_path in file_paths:
+                self.log.msg(f"Processing file '{Path(file_path).name}'.")
+                self.log.proc_file_name = Path(file_path).name
+                found_file_path = self.__file_io.find_file(file_path)
+                if found_file_path is None:
+                    continue
+                self.__proc_file_dir_path = found_file_path.parent
+                code_lines = CodeFormatter.normalize_lines(self.__file_io.yield_file_lines(found_file_path), self.tab_size)
+                code_input = PreprocInput(self.log)
+                code_parts = code_input.yield_code_parts(code_lines)
+                if self.__profiler is not None:
+                    code_parts = self.__profiler.profile_iter("input", code_parts)
+                self.__process_code_parts(((code_input.part_line_idx, code_type, code_part) for (code_type, code_part) in code_parts),
+                                          False, full_output, stream_output, code_input)
+                self.__proc_file_dir_path = None
+
+    def process_files_incremental(self, *file_paths: str | Path, out_file_path: str | Path, manifest: DependencyManifest,
+                                  full_output: bool = False) -> bool:
+        """Processes the specified C source files in the streaming mode (see :py:meth:`neatcpp.NeatCpp.process_files_stream`)
+        and saves the processed output into a file only if the output file is not up to date according to the dependency
+        manifest. The files, included files and definitions of the macros consulted during the processing are then recorded
+        into the manifest as the dependencies of the output file. Output file is up to date if it has been created from the
+        same files with the same include directories, excluded macros and files and full output flag, none of its dependency
+        files has changed and all consulted macros have the same definitions as before the processing.
+
+        Args:
+            file_paths (str): One or more arguments specifying paths to processed files.
+            out_file_path (str): Path to the output file.
+            manifest (DependencyManifest): Dependency manifest used to check and record the output file dependencies.
+            full_output (bool, optional): Flag to save the full output, i.e., including all preprocessor directives,
+                all comments and whitespaces. Defaults to False.
+
+        Returns:
+            bool: True if the files have been processed, False if the processing has been skipped, because the output file
+                is up to date.
+        """
+        key = self.__get_deps_key(file_paths, full_output)
+        if manifest.is_up_to_date(out_file_path, key, self.__macros, self.__file_io):
+            self.log.msg(f"Output file '{Path(out_file_path).name}' is up to date, processing skipped.")
+            return False
+        initial_macros = self.snapshot().macros
+        self.__dep_file_paths = set()
+        self.__dep_missing_files = set()
+        self.__dep_ids = set()
+        for file_path in file_paths:
+            found_file_path = self.__file_io.find_file(file_path)
+            if found_file_path is not None:
+                self.__dep_file_paths.add(found_file_path)
+        self.process_files_stream(*file_paths, out_file_path=out_file_path, full_output=full_output)
+        manifest.add_entry(out_file_path, key, {path: self.__file_io.get_file_stamp(path) for path in self.__dep_file_paths},
+                           self.__dep_missing_files, {ident: initial_macros[ident] for ident in self.__dep_ids if ident in initial_macros},
+                           {ident for ident in self.__dep_ids if ident not in initial_macros})
+        self.__dep_file_paths = None
+        return True
+
+    def process_files_parallel(self, *file_paths: str | Path, out_dir_path: str | Path, out_suffix: str = "",
+                               full_output: bool = False, jobs: int = 0, stream: bool = False,
+                               manifest: DependencyManifest | None = None) -> list[Path]:
+        """Processes the specified C source files as independent translation units in parallel processes and saves the
+        processed output of each file into a separate output file. Each file is processed starting from the current state of
+        the preprocessor, i.e., with the currently defined macros, include directories and excluded macros or files.
+        The preprocessor state and its global output are not modified by this method.
+
+        Args:
+            file_paths (str): One or more arguments specifying paths to processed files.
+            out_dir_path (str): Path to the directory for the output files.
+            out_suffix (str, optional): Suffix added to the input file name stem to create the output file name,
+                e.g., the suffix ``_out`` creates the output file ``src_out.c`` for the input file ``src.c``. Defaults to "".
+            full_output (bool, optional): Flag to save the full output, i.e., including all preprocessor directives,
+                all comments and whitespaces. Defaults to False.
+            jobs (int, optional): Maximum number of parallel processes. Value 0 uses the number of available CPUs,
+                value 1 processes the files one after another in the current process. Defaults to 0.
+            stream (bool, optional): Flag to process the files in the streaming mode as described in the
+                :py:meth:`neatcpp.NeatCpp.process_files_stream` method. Defaults to False.
+            manifest (DependencyManifest, optional): Dependency manifest used to skip the files with up to date output files
+                and to record the dependencies of the created output files as described in the
+                :py:meth:`neatcpp.NeatCpp.process_files_incremental` method. Defaults to None.
+
+        Returns:
+            list[Path]: Paths to the saved output files.
+        """
+        out_dir_path = Path(out_dir_path)
+        out_dir_path.mkdir(parents=True, exist_ok=True)
+        tasks = []
+        out_file_paths = []
+        for file_path in file_paths:
+            out_file_path = Path(out_dir_path, f"{Path(file_path).stem}{out_suffix}{Path(file_path).suffix}")
+            if out_file_path.resolve() == Path(file_path).resolve():
+                self.log.err(f"Output file for the input file '{file_path}' would overwrite the input file.", self.log.ErrSeverity.CRITICAL)
+            elif out_file_path in out_file_paths:
+                self.log.err(f"Output file '{out_file_path}' for the input file '{file_path}' would overwrite another output file.",
+                             self.log.ErrSeverity.CRITICAL)
+            elif manifest is not None and manifest.is_up_to_date(out_file_path, self.__get_deps_key((file_path,), full_output),
+                                                                 self.__macros, self.__file_io):
+                self.log.msg(f"Output file '{out_file_path.name}' is up to date, processing skipped.")
+                out_file_paths.append(out_file_path)
+            else:
+                tasks.append((file_path, out_file_path, full_output, stream, manifest is not None))
+                out_file_paths.append(out_file_path)
+        worker_state = (self.snapshot(), (self.log.verbosity, self.log.min_err_severity, self.log.debug_msg_enabled),
+                        self.prefetch_budget)
+        jobs = jobs if jobs > 0 else (os.cpu_count() or 1)
+        if jobs == 1 or len(tasks) <= 1:
+            # Files are processed by a separate instance in the current thread without modifying the module-level worker state.
+            worker = NeatCpp(self.log.spawn())
+            worker.prefetch_budget = self.prefetch_budget
+            results = [_process_file(worker, worker_state[0], *task) for task in tasks]
+            worker.close()
+        else:
+            with ProcessPoolExecutor(min(jobs, len(tasks)), initializer=_init_parallel_worker, initargs=worker_state) as executor:
+                results = list(executor.map(_process_file_in_worker, *zip(*tasks)))
+        if manifest is not None:
+            for (_, manifest_entries) in results:
+                manifest.entries.update(manifest_entries)
+        return out_file_paths
+
     def process_code(self, code: str, global_output: bool = True, full_local_output: bool = False, proc_file_name: str = "") -> str:
         """Processes the specified source code string.
 
@@ -577,61 +2424,42 @@ class NeatCpp():
             str: Local output for the processed code. Generated always, regardless of the ``global_output`` argument value.
         """
         if proc_file_name:
-            log.msg(f"Processing file '{Path(proc_file_name).name}'.")
+            self.log.msg(f"Processing file '{Path(proc_file_name).name}'.")
         else:
-            log.msg(f"Processing source code '{log.get_code_sample(code)}'.")
-        log.proc_file_name = proc_file_name
-        orig_branch_depth = self.__cond_mngr.branch_depth
+            self.log.msg(f"Processing source code '{self.log.get_code_sample(code)}'.")
+        self.log.proc_file_name = proc_file_name
         # General code processing.
-        code = CodeFormatter.replace_tabs(code)
+        code_lines = CodeFormatter.normalize_lines(code, self.tab_size)
         # Extraction and processing of directives, comments, whitespaces and other code parts.
-        code_input = PreprocInput()
-        local_output = PreprocOutput()
-        for (code_type, code_part) in code_input.yield_code_parts(code):
-            if code_type == CodeType.DIRECTIVE:
-                log.msg(f"    Processing directive '{log.get_code_sample(code_part)}'.", 2)
-                self.__process_directives(code_part)
-            else:
-                if self.__cond_mngr.branch_active:
-                    if code_type == CodeType.CODE:
-                        code_part = self.expand_macros(code_part)
-            if global_output:
-                self.__output.add_code_part(code_part, code_type)
-            local_output.add_code_part(code_part, code_type)
-        if self.__cond_mngr.branch_depth != orig_branch_depth:
-            log.err("Unterminated #if detected in a previous code (%l).", log.ErrSeverity.CRITICAL)
-        return local_output.code_all if full_local_output else local_output.code
-
-    def evaluate(self, expr_code: str) -> object:
-        """Evaluates the specified C expression to the numerical value. Only simple C code expressions are supported.
-        Ternary operator is not supported. Multiline or other more complex expressions might not be evaluated correctly.
-
-        .. warning::
-            Python's ``eval()`` function is used, so this method could be potentially dangerous.
+        code_input = PreprocInput(self.log)
+        code_parts = code_input.yield_code_parts(code_lines)
+        if self.__profiler is not None:
+            code_parts = self.__profiler.profile_iter("input", code_parts)
+        return self.__process_code_parts(
+            ((code_input.part_line_idx, code_type, code_part) for (code_type, code_part) in code_parts),
+            global_output, full_local_output, code_input=code_input)
+
+    def evaluate(self, expr_code: str) -> int | float | bool:
+        """Evaluates the specified C constant expression to the numerical value. The expression is evaluated according to
+        the C language rules for the preprocessor ``#if`` expressions, i.e., with 64-bit signed or unsigned integer
+        arithmetic including the wraparound, all C operators with their precedence including the ternary operator,
+        character constants and integer constants with type suffixes. Identifiers remaining after the macro expansion are
+        evaluated to 0. Floating point constants are also supported.
 
         Args:
             expr_code (str): C code expression to be evaluated.
 
         Returns:
-            any: Value corresponding to the evaluated C expression.
+            int | float | bool: Value corresponding to the evaluated C expression or False if the expression
+                cannot be evaluated.
         """
-        expr_code = self.__preproc_eval_expr(expr_code)
-        # Expression must already be preprocessed, i.e., lines joined, comments removed, macros expanded.
-        expr_code = expr_code.replace("&&", " and ").replace("||", " or ").replace("/", "//")
-        re.sub(r"!([^?==])", r" not \1", expr_code)
-        try:
-            # Make eval a little bit safer by removing the import keyword.
-            expr_code = expr_code.replace("import", "")
-            output = eval(expr_code)    # pylint: disable = eval-used
-        except (SyntaxError, NameError, TypeError, ZeroDivisionError):
-            output = False
-        return output
+        return self.__evaluate_expr(self.__preproc_eval_expr(expr_code))
 
     def is_true(self, expr_code: str) -> bool:
         """Evaluates the specified C expression to the boolean true or false value.
 
-        .. warning::
-            The limitations and warnings specified for the :py:meth:`neatcpp.NeatCpp.evaluate` method apply also to this method.
+        .. note::
+            The rules specified for the :py:meth:`neatcpp.NeatCpp.evaluate` method apply also to this method.
 
         Args:
             expr_code (str): C code expression to be evaluated to the boolean value.
@@ -639,11 +2467,7 @@ class NeatCpp():
         Returns:
             bool: Boolean value corresponding to the evaluated C expression.
         """
-        expr_code = self.__preproc_eval_expr(expr_code)
-        state = self.evaluate(expr_code)
-        if isinstance(state, str):
-            return False
-        return bool(state)
+        return bool(self.__evaluate_expr(self.__preproc_eval_expr(expr_code)))
 
     def expand_macros(self, code: str, exp_depth: int = 0) -> str:
         """Expands macro references of known macros in the specified C code.
@@ -661,100 +2485,216 @@ class NeatCpp():
         if exp_depth == 0:
             exp_code = CodeFormatter.remove_line_escapes(exp_code)
         if exp_depth > 512:
-            log.err("Macro expansion depth limit 512 exceeded (%l).", log.ErrSeverity.SEVERE)
+            self.__exp_errors += 1
+            self.log.err("Macro expansion depth limit 512 exceeded (%l).", self.log.ErrSeverity.SEVERE)
             return exp_code
 
-        for (macro_id, macro) in self.macros.items():
-            macro_start_pos = self.__get_macro_ident_pos(exp_code, macro_id, bool(macro.args))
-            while macro_start_pos >= 0 and (not CodeFormatter.is_in_comment(exp_code, macro_start_pos) and
-                                            not CodeFormatter.is_in_string(exp_code, macro_start_pos)):
-                log.msg(f"    {exp_depth * '    '}Expanding macro '{macro_id}'.", 2)
+        profiler = self.__profiler
+        if profiler is not None and exp_depth == 0:
+            profiler.start("expand_macros")
+        # Only the macros referenced by the identifiers present in the code are expanded, in the order of the macros dictionary.
+        macro_ranks = self.__get_macro_ranks() if exp_depth == 0 else self.__macro_ranks
+        pending_macros = []
+        queued_ids = set()
+        code_spans = None
+        self.__queue_macros(exp_code, pending_macros, queued_ids, macro_ranks)
+        while pending_macros:
+            (macro_rank, macro_id) = heappop(pending_macros)
+            macro = self.__macros[macro_id]
+            func_like = bool(macro.args)
+            macro_start_pos = CodeFormatter.find_identifier(exp_code, macro_id, 0, func_like)
+            while macro_start_pos >= 0:
+                if code_spans is None:
+                    code_spans = CodeSpans(exp_code)
+                span_end_pos = code_spans.get_span_end(macro_start_pos)
+                if span_end_pos >= 0:
+                    # Skip the macro reference in a comment or a string literal.
+                    macro_start_pos = CodeFormatter.find_identifier(exp_code, macro_id, span_end_pos, func_like)
+                    continue
+                self.log.msg(f"    {exp_depth * '    '}Expanding macro '{macro_id}'.", 2)
+                if profiler is not None:
+                    profiler.start_macro(macro_id)
                 macro_end_pos = macro_start_pos + len(macro_id)
-                if macro.args:
-                    arg_vals = []
-                    (args_start_pos, args_end_pos) = CodeFormatter.get_enclosed_subst_pos(exp_code, macro_end_pos)
+                arg_vals = []
+                if func_like:
+                    (args_start_pos, args_end_pos, arg_vals) = CodeFormatter.get_macro_ref_args(exp_code, macro_end_pos)
                     if args_start_pos >= 0:
                         macro_end_pos = args_end_pos + 1
-                        arg_vals = self.__extract_macro_ref_args(exp_code[args_start_pos + 1: args_end_pos])
                     req_args_num = len(macro.args) - 1 if macro.args[-1] == "..." else len(macro.args)
                     if len(arg_vals) < req_args_num:
-                        log.err(f"{macro_id} macro reference is missing some of its {len(macro.args)} required arguments (%l).",
-                                log.ErrSeverity.CRITICAL)
-                    # Create a list of fully expanded macro arguments.
-                    fully_exp_arg_vals = []
-                    for arg_val in arg_vals:
-                        exp_arg_val = self.expand_macros(arg_val, exp_depth + 1)
-                        fully_exp_arg_vals.append(exp_arg_val)
-                    exp_macro_code = macro.expand_args(arg_vals, fully_exp_arg_vals)
+                        self.__exp_errors += 1
+                        self.log.err(f"{macro_id} macro reference is missing some of its {len(macro.args)} required arguments (%l).",
+                                     self.log.ErrSeverity.CRITICAL)
+                # Fully expanded macro reference depends only on the macro argument values and on the definitions of the identifiers
+                # found in the expanded code, so it can be reused until any of these identifiers is defined or undefined.
+                # The reference is expanded here instead of in a separate method to keep a single stack frame per expansion level.
+                cache_key = (macro.identifier, *arg_vals)
+                cached_exp = self.__exp_cache.get(cache_key)
+                if cached_exp is not None:
+                    (exp_macro_code, deps) = cached_exp
+                    if self.__exp_deps_stack:
+                        self.__exp_deps_stack[-1].update(deps)
+                    if self.__dep_file_paths is not None:
+                        self.__dep_ids.update(deps)
                 else:
-                    exp_macro_code = macro.expand_args()
-                # Recursively expand the expanded macro body.
-                exp_macro_code = self.expand_macros(exp_macro_code, exp_depth + 1)
+                    deps = {macro.identifier}
+                    self.__exp_deps_stack.append(deps)
+                    orig_exp_errors = self.__exp_errors
+                    if func_like:
+                        # Create a list of fully expanded macro arguments. A loop is used, because a list comprehension adds
+                        # a stack frame in older Python versions.
+                        fully_exp_arg_vals = []
+                        for arg_val in arg_vals:
+                            fully_exp_arg_vals.append(self.expand_macros(arg_val, exp_depth + 1))
+                        exp_macro_code = macro.expand_args(arg_vals, fully_exp_arg_vals)
+                    else:
+                        exp_macro_code = macro.expand_args()
+                    # Recursively expand the expanded macro body.
+                    exp_macro_code = self.expand_macros(exp_macro_code, exp_depth + 1)
+                    self.__exp_deps_stack.pop()
+                    if self.__exp_deps_stack:
+                        self.__exp_deps_stack[-1].update(deps)
+                    if self.__exp_errors == orig_exp_errors:
+                        self.__exp_cache.add(cache_key, exp_macro_code, deps)
+                code_len = len(exp_code)
                 exp_code = self.__insert_expanded_macro(exp_code, macro_start_pos, macro_end_pos, exp_macro_code)
-                macro_start_pos = self.__get_macro_ident_pos(exp_code, macro_id, bool(macro.args))
+                exp_macro_end_pos = macro_end_pos + len(exp_code) - code_len
+                code_spans.update(exp_code, macro_start_pos, macro_end_pos, exp_macro_end_pos)
+                if profiler is not None:
+                    profiler.stop_macro()
+                # Macros referenced in the inserted code are expanded later, unless they precede the current macro in the order.
+                self.__queue_macros(exp_macro_code, pending_macros, queued_ids, macro_ranks, macro_rank)
+                # Inserted code is already fully expanded, so the search continues after it. Otherwise, the reference of
+                # a self-referencing macro remaining in its expansion would be expanded again and again.
+                macro_start_pos = CodeFormatter.find_identifier(exp_code, macro_id, exp_macro_end_pos, func_like)
+        if profiler is not None and exp_depth == 0:
+            profiler.stop()
         return exp_code
 
     # ----- END OF INTERFACE METHODS ----- #
 
+    def __process_code_parts(self, code_parts: Iterable[tuple[int, CodeType, str]], global_output: bool = True,
+                             full_local_output: bool = False, stream_output: PreprocOutput | None = None,
+                             code_input: PreprocInput | None = None) -> str:
+        orig_branch_depth = self.__cond_mngr.branch_depth
+        # Streamed output writing the code parts into a file is used as the local output.
+        local_output = PreprocOutput() if stream_output is None else stream_output
+        if code_input is not None:
+            code_input.skip_inactive = not self.__cond_mngr.branch_active
+        for (line_idx, code_type, code_part) in code_parts:
+            self.log.proc_file_line = line_idx
+            if code_type == CodeType.DIRECTIVE:
+                self.log.msg(f"    Processing directive '{self.log.get_code_sample(code_part)}'.", 2)
+                self.__process_directives(code_part)
+                # Code input yields the whole inactive conditional branch as a single part without splitting it.
+                if code_input is not None and not self.__cond_mngr.branch_active:
+                    code_input.skip_inactive = True
+            elif self.__cond_mngr.branch_active:
+                if code_type == CodeType.CODE:
+                    code_part = self.expand_macros(code_part)
+            else:
+                code_type = CodeType.INACTIVE
+            if global_output:
+                self.__output.add_code_part(code_part, code_type)
+            local_output.add_code_part(code_part, code_type)
+        if self.__cond_mngr.branch_depth != orig_branch_depth:
+            self.log.err("Unterminated #if detected in a previous code (%l).", self.log.ErrSeverity.CRITICAL)
+        return local_output.code_all if full_local_output else local_output.code
+
     def __process_directives(self, code: str) -> bool:
         processed = False
-        # Process conditional directives to correctly update the brach state stack and
-        # detect elif/else for SEARCH branch state.
-        for directive in self.__directives[DirectiveGroup.CONDITIONAL]:
-            processed = directive.process(code)
-            if processed:
-                break
-        if not processed and self.__cond_mngr.branch_active:
-            # Process non-conditional directives in the active conditional branch.
-            for directive in self.__directives[DirectiveGroup.STANDARD]:
-                processed = directive.process(code)
-                if processed:
-                    break
+        # Line escapes are removed and the directive keyword is extracted only once for all directive patterns.
+        joined_code = CodeFormatter.remove_line_escapes(code)
+        re_match = Directive.RE_PTRN_KEYWORD.match(joined_code)
+        keyword = re_match.group("keyword") if re_match else ""
+        if self.__profiler is not None:
+            self.__profiler.start(f"directive:{keyword}")
+        directive = self.__directives.get(keyword)
+        # Process conditional directives also in the inactive conditional branch to correctly update the brach state stack and
+        # detect elif/else for SEARCH branch state. Process non-conditional directives only in the active conditional branch.
+        if directive is not None and (directive.group == DirectiveGroup.CONDITIONAL or self.__cond_mngr.branch_active):
+            processed = directive.process(code, joined_code)
+        if self.__profiler is not None:
+            self.__profiler.stop()
         return processed
 
     def __process_include(self, parts: dict[str, str | None], _code: str) -> None:
         if parts["file"] is not None and parts["file"] not in self.exclude_macros_files:
-            orig_log_file_name = log.proc_file_name
-            self.process_files(parts["file"], global_output=False)
-            log.proc_file_name = orig_log_file_name
+            file_path = self.__file_io.find_file(parts["file"], parts["quote"] == "<", self.__proc_file_dir_path)
+            if self.__dep_file_paths is not None:
+                if file_path is None:
+                    self.__dep_missing_files.add((parts["file"], parts["quote"] == "<", self.__proc_file_dir_path))
+                else:
+                    self.__dep_file_paths.add(file_path)
+            if file_path is None:
+                return
+            if self.__profiler is not None:
+                self.__profiler.include_counts[file_path] = self.__profiler.include_counts.get(file_path, 0) + 1
+            # Include guard of the file might be known without the file code, so try to skip the file before reading it.
+            incl_file = self.__incl_cache.files.get(file_path)
+            if incl_file is None or not self.__is_include_skipped(file_path, incl_file):
+                if self.__profiler is not None:
+                    self.__profiler.start("input")
+                incl_file = self.__incl_cache.get_file(file_path, self.__file_io, self.tab_size)
+                if self.__profiler is not None:
+                    self.__profiler.stop()
+            else:
+                self.__incl_cache.hits += 1
+            if self.__is_include_skipped(file_path, incl_file):
+                self.__file_io.release_prefetched(file_path)
+                self.__incl_cache.skips += 1
+                self.log.msg(f"    Skipping file '{file_path.name}' included repeatedly (include cache hits: {self.__incl_cache.hits}, "
+                             f"misses: {self.__incl_cache.misses}, skipped files: {self.__incl_cache.skips}).", 2)
+                return
+            self.log.msg(f"    Including file '{file_path.name}' (include cache hits: {self.__incl_cache.hits}, "
+                         f"misses: {self.__incl_cache.misses}, skipped files: {self.__incl_cache.skips}, "
+                         f"file search cache hits: {self.__file_io.find_hits}, misses: {self.__file_io.find_misses}).", 2)
+            self.__incl_cache.included_paths.add(file_path)
+            if incl_file.code_parts:
+                orig_log_file_name = self.log.proc_file_name
+                orig_log_file_line = self.log.proc_file_line
+                orig_proc_file_dir_path = self.__proc_file_dir_path
+                self.log.msg(f"Processing file '{file_path.name}'.")
+                self.log.proc_file_name = file_path.name
+                self.__proc_file_dir_path = file_path.parent
+                code_input = PreprocInput(self.log)
+                code_parts = code_input.yield_cached_parts(incl_file.code_parts, incl_file.branch_ends)
+                self.__process_code_parts(((code_input.part_line_idx, code_type, code_part) for (code_type, code_part) in code_parts),
+                                          global_output=False, code_input=code_input)
+                self.log.proc_file_name = orig_log_file_name
+                self.log.proc_file_line = orig_log_file_line
+                self.__proc_file_dir_path = orig_proc_file_dir_path
+            self.__file_io.release_prefetched(file_path)
+
+    def __is_include_skipped(self, file_path: Path, incl_file: IncludeCache.File) -> bool:
+        if self.__dep_file_paths is not None and incl_file.guard_macro:
+            self.__dep_ids.add(incl_file.guard_macro)
+        return bool((incl_file.pragma_once and file_path in self.__incl_cache.included_paths) or
+                    (incl_file.guard_macro and incl_file.guard_macro in self.__macros))
 
     def __process_define(self, parts: dict[str, str | None], code: str) -> None:
         if parts["ident"] is not None:
-            ident = parts["ident"]
+            ident = sys.intern(parts["ident"])
             if ident not in self.exclude_macros_files:
                 args_list = [arg.strip() for arg in parts["args"].split(",")] if parts["args"] is not None else []
-                multiline_code = CodeFormatter.remove_line_escapes(code, True)
-                # Find the starting position of the macro body, i.e., the last argument position or the end position of the macro ident.
+                # If macro has arguments, then it gets the lowest rank, i.e., it is the first one in the expansion order, because
+                # if a const macro is an argument to the func-like macro, the func-like macro needs to be expanded first in the
+                # expand_macros method. The macros dictionary is not reordered, only its order is not the expansion order anymore.
+                self.__exp_cache.invalidate(ident)
+                self.__set_macro_rank(ident, bool(args_list))
+                # Macro body is parsed from the directive code only if the macro is expanded.
+                self.__macros[ident] = Macro(ident, args_list, define_code=code)
                 if args_list:
-                    re_match = re.search(rf"{args_list[-1]}\s*\)", multiline_code, re.ASCII)
-                else:
-                    re_match = re.search(rf"{ident}[ \t]*", multiline_code, re.ASCII)
-                if re_match is not None:
-                    body = multiline_code[re_match.end():].rstrip()
-                    if body.startswith("\n"):
-                        body = body[1:]
-                        body = dedent(body)
-                    else:
-                        body = body.lstrip()
-                    # if macro has arguments, then insert it at the beginning of the macros dictionary, because if a const macro
-                    # is an argument to the func-like macro, the func-like macro needs to be expanded first in the expand_macros method.
-                    if args_list:
-                        # if macro is already in a dict, then it needs to be deleted, because update function will not change its value.
-                        if ident in self.macros:
-                            del self.macros[ident]
-                        new_macro_dict = {ident: Macro(ident, args_list, body)}
-                        new_macro_dict.update(self.macros)
-                        self.macros = new_macro_dict
-                    else:
-                        self.macros[ident] = Macro(ident, args_list, body)
-                else:
-                    log.err(f"Macro body not detected (%l):\n{code}", log.ErrSeverity.CRITICAL)
+                    self.__macros_ordered = False
         else:
-            log.err(f"#define with an unexpected formatting detected (%l):\n{code}", log.ErrSeverity.CRITICAL)
+            self.log.err(f"#define with an unexpected formatting detected (%l):\n{code}", self.log.ErrSeverity.CRITICAL)
 
     def __process_undef(self, parts: dict[str, str | None], _code: str) -> None:
-        if parts["ident"] is not None and parts["ident"] in self.macros:
-            del self.macros[parts["ident"]]
+        if parts["ident"] is not None and parts["ident"] in self.__macros:
+            self.__unshare_macros()
+            self.__get_macro_ranks().pop(parts["ident"], None)
+            del self.__macros[parts["ident"]]
+            self.__exp_cache.invalidate(parts["ident"])
 
     def __process_if(self, parts: dict[str, str | None], _code: str) -> None:
         is_true = self.is_true(parts["expr"]) if self.__cond_mngr.branch_active and parts["expr"] else False
@@ -772,18 +2712,20 @@ class NeatCpp():
 
     def __process_ifdef(self, parts: dict[str, str | None], _code: str) -> None:
         expr = parts["expr"].strip() if parts["expr"] else ""
-        self.__cond_mngr.enter_if(expr in self.macros)
+        if self.__dep_file_paths is not None:
+            self.__dep_ids.add(expr)
+        self.__cond_mngr.enter_if(expr in self.__macros)
 
     def __process_ifndef(self, parts: dict[str, str | None], _code: str) -> None:
         expr = parts["expr"].strip() if parts["expr"] else ""
-        self.__cond_mngr.enter_if(expr not in self.macros)
+        if self.__dep_file_paths is not None:
+            self.__dep_ids.add(expr)
+        self.__cond_mngr.enter_if(expr not in self.__macros)
 
     def __preproc_eval_expr(self, code: str) -> str:
         out_code = self.__eval_defined(code)
         out_code = self.expand_macros(out_code)
         out_code = CodeFormatter.remove_line_escapes(out_code)
-        out_code = CodeFormatter.remove_comments(out_code)
-        out_code = CodeFormatter.remove_num_type_suffix(out_code)
         # Evaluate defined expressions again in case there are new ones comeing from expanded macros.
         out_code = self.__eval_defined(out_code)
         out_code = CodeFormatter.remove_empty_lines(out_code)
@@ -791,36 +2733,89 @@ class NeatCpp():
 
     def __eval_defined(self, code: str) -> str:
         def repl_defined(match: re.Match) -> str:
-            ident = match.group("ident")
-            return " 1" if ident is not None and ident in self.macros else " 0"
-
-        return re.sub(r"(?:^|[ \t])defined[ \t]*\(?\s*(?P<ident>\w+)[ \t]*\)?",
-                      repl_defined, code, count=0, flags=re.ASCII + re.MULTILINE)
-
-    def __get_macro_ident_pos(self, code: str, macro_ident: str, has_args: bool = False) -> int:
-        macro_id_pos = -1
-        macro_re_ptrn_end = r"\s*\(" if has_args else r"(?:$|[^\w])"
-        re_match_macro_id = re.search(rf"(?:^|[^\w])(?P<id>{macro_ident}){macro_re_ptrn_end}", code, re.ASCII + re.MULTILINE)
-        if re_match_macro_id is not None:
-            macro_id_pos = re_match_macro_id.start("id")
-        return macro_id_pos
-
-    def __extract_macro_ref_args(self, args_code: str) -> list[str]:
-        args = []
-        args_code = args_code.strip().replace("\n", "")
-        temp_args = [arg for arg in args_code.split(",")]
-        arg_idx = 0
-        args.append(temp_args[0])
-        for temp_arg in temp_args[1:]:
-            # Check if the argument args[arg_idx] does not contain uneven number of parentheses or apostrophes, e.g. "value(1".
-            # If yes, then the argument is incomplete and the next argument temp_arg needs to be added to it, e.g. "value(1, 2)".
-            if ((args[arg_idx].count("\"") & 1) or (args[arg_idx].count("\'") & 1) or
-                    (args[arg_idx].count("(") != args[arg_idx].count(")"))):
-                args[arg_idx] = f"{args[arg_idx]}, {temp_arg}"
-            else:
-                args.append(temp_arg.strip())
-                arg_idx += 1
-        return args
+            ident = match.group("ident") or match.group("ident_p")
+            if self.__dep_file_paths is not None:
+                self.__dep_ids.add(ident)
+            return "1" if ident in self.__macros else "0"
+
+        if "defined" not in code:
+            return code
+        return self.RE_PTRN_DEFINED.sub(repl_defined, code)
+
+    def __evaluate_expr(self, expr_code: str) -> int | float | bool:
+        # Expression must already be preprocessed, i.e., macros expanded and defined expressions evaluated.
+        if self.__profiler is not None:
+            self.__profiler.start("evaluate")
+        try:
+            value = ExprEvaluator.compile(expr_code)()
+        except (ValueError, ZeroDivisionError) as exc:
+            self.log.err(f"Expression '{self.log.get_code_sample(expr_code)}' cannot be evaluated, {exc} (%l).",
+                         self.log.ErrSeverity.WARNING)
+            value = False
+        if self.__profiler is not None:
+            self.__profiler.stop()
+        return value
+
+    def __get_macro_db_key(self, file_paths: tuple[str | Path, ...]) -> tuple:
+        return (tuple(str(self.__file_io.find_file(file_path)) for file_path in file_paths),
+                tuple(str(path) for path in self.__file_io.incl_dir_paths[1:]), tuple(self.exclude_macros_files), self.tab_size)
+
+    def __get_deps_key(self, file_paths: tuple[str | Path, ...], full_output: bool) -> list:
+        # Dependency manifest key contains only the JSON compatible values.
+        return [[str(self.__file_io.find_file(file_path)) for file_path in file_paths],
+                [str(path) for path in self.__file_io.incl_dir_paths[1:]], list(self.exclude_macros_files), self.tab_size, full_output]
+
+    def __unshare_macros(self) -> None:
+        if self.__macros_shared:
+            self.__macros = dict(self.__macros)
+            self.__macro_ranks = dict(self.__macro_ranks)
+            self.__ranked_macros = self.__macros
+            self.__macros_shared = False
+
+    def __get_macro_ranks(self) -> dict[str, int]:
+        # Ranks are rebuilt from the macros dictionary order only if the dictionary has been replaced outside of this class.
+        if self.__ranked_macros is not self.__macros:
+            self.__ranked_macros = self.__macros
+            self.__macro_ranks = {macro_id: rank for (rank, macro_id) in enumerate(self.__macros)}
+            self.__macro_rank_lo = -1
+            self.__macro_rank_hi = len(self.__macros)
+        elif len(self.__macro_ranks) != len(self.__macros):
+            # Macros added to the dictionary outside of this class are the last ones in the expansion order.
+            for macro_id in [macro_id for macro_id in self.__macro_ranks if macro_id not in self.__macros]:
+                del self.__macro_ranks[macro_id]
+            for macro_id in self.__macros:
+                if macro_id not in self.__macro_ranks:
+                    self.__macro_ranks[macro_id] = self.__macro_rank_hi
+                    self.__macro_rank_hi += 1
+        return self.__macro_ranks
+
+    def __set_macro_rank(self, ident: str, first: bool) -> None:
+        self.__unshare_macros()
+        macro_ranks = self.__get_macro_ranks()
+        if first:
+            macro_ranks[ident] = self.__macro_rank_lo
+            self.__macro_rank_lo -= 1
+        elif ident not in macro_ranks:
+            macro_ranks[ident] = self.__macro_rank_hi
+            self.__macro_rank_hi += 1
+
+    def __queue_macros(self, code: str, pending_macros: list[tuple[int, str]], queued_ids: set[str],
+                       macro_ranks: dict[str, int], min_rank: int | None = None) -> None:
+        idents = CodeFormatter.get_identifiers(code)
+        if self.__exp_deps_stack:
+            self.__exp_deps_stack[-1].update(idents)
+        if self.__dep_file_paths is not None:
+            self.__dep_ids.update(idents)
+        for ident in idents:
+            if ident in self.__macros and ident not in queued_ids:
+                if ident not in macro_ranks:
+                    # Macro added to the dictionary from outside of this class is the last one in the dictionary order.
+                    macro_ranks[ident] = self.__macro_rank_hi
+                    self.__macro_rank_hi += 1
+                rank = macro_ranks[ident]
+                if min_rank is None or rank > min_rank:
+                    heappush(pending_macros, (rank, ident))
+                    queued_ids.add(ident)
 
     def __insert_expanded_macro(self, code: str, macro_ref_start_pos: int, macro_ref_end_pos: int, exp_macro_code: str) -> str:
         out_code = code[:macro_ref_start_pos]
@@ -839,37 +2834,508 @@ class NeatCpp():
         return out_code
 
 
+class PreprocServer():
+    """A preprocessing server keeping the preprocessor state created from the silently processed files, typically the prelude
+    headers, in memory and answering the requests of the :py:class:`neatcpp.PreprocClient` over a Unix domain socket.
+
+    Requests and responses are JSON objects, each sent as a single line. The request contains the operation ``op`` with
+    its parameters:
+
+    - ``{"op": "process_file", "file": path, "full_output": false}`` returns the output of the processed file,
+    - ``{"op": "process_code", "code": code, "full_output": false}`` returns the output of the processed code,
+    - ``{"op": "expand_macros", "code": code}`` returns the code with expanded macros,
+    - ``{"op": "evaluate", "expr": expr}`` returns the value of the expression.
+
+    The response contains the ``result`` and the list of ``errors`` logged during the request, or only the ``error``
+    describing an invalid or failed request, e.g., a file that cannot be read. Each request starts from the state created
+    from the silent files, i.e., macros defined by one request are not visible to the other requests. Clients are served
+    concurrently by a pool of threads, each with its own preprocessor instance. The silent files are processed again if
+    any of them is changed and the included files are searched again in each watch interval, so the newly created files
+    are found.
+
+    Args:
+        socket_path (str): Path to the Unix domain socket created by the server.
+        silent_file_paths (Iterable[str], optional): Paths to the files processed silently to create the initial state
+            of each request. Defaults to ().
+        incl_dir_paths (Iterable[str], optional): Directories to search for the included files. Defaults to ().
+        exclude_macros_files (Iterable[str], optional): Macro names and file names excluded from processing. Defaults to ().
+        tab_size (int, optional): Number of columns between the tab stops. Defaults to 4.
+        macro_db_path (str, optional): Path to the macro database file loaded instead of processing the silent files
+            as described in the :py:meth:`neatcpp.NeatCpp.load_macro_db` method. Defaults to None.
+        workers (int, optional): Maximum number of the concurrently served clients. Value 0 uses the number of available
+            CPUs. Defaults to 0.
+        watch_interval (float, optional): Interval in seconds between the checks of the silent files changes.
+            Value 0 disables the checks. Defaults to 1.0.
+        logger (PreprocLogger, optional): Logger of the server console messages and errors. Defaults to a copy of the
+            module-level logger.
+
+    Attributes:
+        socket_path (Path): Path to the Unix domain socket of the server.
+        log (PreprocLogger): Logger of the server console messages and errors.
+    """
+    def __init__(self, socket_path: str | Path, silent_file_paths: Iterable[str | Path] = (), incl_dir_paths: Iterable[str | Path] = (),
+                 exclude_macros_files: Iterable[str] = (), tab_size: int = 4, macro_db_path: str | Path | None = None,
+                 workers: int = 0, watch_interval: float = 1.0, logger: PreprocLogger | None = None) -> None:
+        self.socket_path: Path = Path(socket_path)
+        self.log: PreprocLogger = logger if logger is not None else log.spawn()
+        self.__silent_file_paths: tuple[str | Path, ...] = tuple(silent_file_paths)
+        self.__incl_dir_paths: tuple[str | Path, ...] = tuple(incl_dir_paths)
+        self.__exclude_macros_files: list[str] = list(exclude_macros_files)
+        self.__tab_size: int = tab_size
+        self.__macro_db_path: str | Path | None = macro_db_path
+        self.__workers: int = workers if workers > 0 else (os.cpu_count() or 1)
+        self.__watch_interval: float = watch_interval
+        # Preprocessor used to create the initial state of the requests and to detect the changes of the read files,
+        # the snapshot of its state and its generation incremented each time the silent files are processed again.
+        self.__prelude: NeatCpp | None = None
+        self.__snapshot: PreprocSnapshot | None = None
+        self.__generation: int = 0
+        self.__lock: threading.Lock = threading.Lock()
+        # Preprocessor, its generation and the errors logged during the current request of each thread of the pool.
+        self.__local: threading.local = threading.local()
+        self.__connections: set[socket.socket] = set()
+        self.__stop_event: threading.Event = threading.Event()
+        self.__threads: list[threading.Thread] = []
+        self.__executor: ThreadPoolExecutor | None = None
+        self.__server_socket: socket.socket | None = None
+
+    def start(self) -> bool:
+        """Processes the silent files, creates the socket and starts serving the clients in the background threads.
+
+        Returns:
+            bool: True if the server has been started, False if the socket cannot be created.
+        """
+        if not hasattr(socket, "AF_UNIX"):
+            self.log.err("Unix domain sockets are not supported on this platform.", self.log.ErrSeverity.CRITICAL)
+            return False
+        self.__load_prelude()
+        try:
+            # Socket file left by a previous server is removed, but other files are never overwritten.
+            if self.socket_path.is_socket():
+                self.socket_path.unlink()
+            self.__server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            # Socket is created accessible only by the current user, so other users cannot connect before its mode is set.
+            umask = os.umask(0o177)
+            try:
+                self.__server_socket.bind(str(self.socket_path))
+            finally:
+                os.umask(umask)
+            self.__server_socket.listen()
+            # Waiting for a new connection is interrupted periodically to check if the server has been stopped.
+            self.__server_socket.settimeout(0.2)
+        except OSError as exc:
+            self.log.err(f"Server socket '{self.socket_path}' cannot be created: {exc}", self.log.ErrSeverity.CRITICAL)
+            if self.__server_socket is not None:
+                self.__server_socket.close()
+                self.__server_socket = None
+            return False
+        self.log.msg(f"Serving on socket '{self.socket_path}'.")
+        self.__stop_event.clear()
+        self.__executor = ThreadPoolExecutor(self.__workers)
+        self.__threads = [threading.Thread(target=self.__accept_clients, daemon=True)]
+        if self.__watch_interval > 0:
+            self.__threads.append(threading.Thread(target=self.__watch_files, daemon=True))
+        for thread in self.__threads:
+            thread.start()
+        return True
+
+    def stop(self) -> None:
+        """Stops serving the clients, closes the open connections and removes the socket.
+        """
+        self.__stop_event.set()
+        for thread in self.__threads:
+            thread.join()
+        self.__threads = []
+        with self.__lock:
+            for connection in self.__connections:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        if self.__executor is not None:
+            self.__executor.shutdown()
+            self.__executor = None
+        if self.__server_socket is not None:
+            self.__server_socket.close()
+            self.__server_socket = None
+            self.socket_path.unlink(missing_ok=True)
+            self.log.msg(f"Server on socket '{self.socket_path}' stopped.")
+
+    def serve_forever(self) -> None:
+        """Starts the server and serves the clients until the process is interrupted, e.g., by the Ctrl+C keys.
+        """
+        if self.start():
+            try:
+                while not self.__stop_event.wait(1.0):
+                    pass
+            except KeyboardInterrupt:
+                pass
+            self.stop()
+
+    def process_request(self, request: dict) -> dict:
+        """Processes the request received from a client in the current thread.
+
+        Args:
+            request (dict): Request with the operation and its parameters described in the class documentation.
+
+        Returns:
+            dict: Response with the result and logged errors, or with the error describing an invalid or failed request.
+        """
+        neatcpp = self.__get_neatcpp()
+        errors: list[str] = self.__local.errors
+        errors.clear()
+        try:
+            match request["op"]:
+                case "process_file":
+                    result = neatcpp.process_files(request["file"], global_output=False, full_local_output=bool(request.get("full_output")))
+                case "process_code":
+                    result = neatcpp.process_code(request["code"], global_output=False, full_local_output=bool(request.get("full_output")))
+                case "expand_macros":
+                    result = neatcpp.expand_macros(request["code"])
+                case "evaluate":
+                    result = neatcpp.evaluate(request["expr"])
+                case op:
+                    return {"error": f"unknown operation '{op}'"}
+        except (KeyError, TypeError, AttributeError) as exc:
+            return {"error": f"invalid request parameters: {exc}"}
+        except (OSError, ValueError) as exc:
+            # Preprocessor state might be inconsistent after the interrupted processing, so it is created again.
+            neatcpp.close()
+            self.__local.neatcpp = None
+            return {"error": f"request failed: {exc}"}
+        return {"result": result, "errors": list(errors)}
+
+    def __load_prelude(self) -> None:
+        prelude = NeatCpp(self.log.spawn())
+        prelude.tab_size = self.__tab_size
+        prelude.add_include_dirs(*self.__incl_dir_paths)
+        if self.__silent_file_paths:
+            if self.__macro_db_path is None or not prelude.load_macro_db(self.__macro_db_path, *self.__silent_file_paths):
+                prelude.process_files(*self.__silent_file_paths, global_output=False)
+                if self.__macro_db_path is not None:
+                    prelude.save_macro_db(self.__macro_db_path, *self.__silent_file_paths)
+        prelude.exclude_macros_files = list(self.__exclude_macros_files)
+        snapshot = prelude.snapshot()
+        with self.__lock:
+            self.__prelude = prelude
+            self.__snapshot = snapshot
+            self.__generation += 1
+
+    def __watch_files(self) -> None:
+        while not self.__stop_event.wait(self.__watch_interval):
+            if self.__prelude is not None and not self.__prelude.is_up_to_date():
+                self.log.msg("Silent files changed, processing them again.")
+                self.__load_prelude()
+
+    def __accept_clients(self) -> None:
+        while not self.__stop_event.is_set() and self.__server_socket is not None and self.__executor is not None:
+            try:
+                (connection, _) = self.__server_socket.accept()
+            except TimeoutError:
+                continue
+            except OSError:
+                break
+            with self.__lock:
+                self.__connections.add(connection)
+            self.__executor.submit(self.__serve_client, connection)
+
+    def __serve_client(self, connection: socket.socket) -> None:
+        # Each line received from the client is a request answered by a response line until the client closes the connection.
+        try:
+            with connection, connection.makefile("r", encoding="utf-8") as reader, connection.makefile("w", encoding="utf-8") as writer:
+                for request_line in reader:
+                    if not request_line.strip():
+                        continue
+                    try:
+                        request = json.loads(request_line)
+                        response = self.process_request(request) if isinstance(request, dict) else {"error": "request is not an object"}
+                    except ValueError as exc:
+                        response = {"error": f"invalid request: {exc}"}
+                    writer.write(f"{json.dumps(response)}\n")
+                    writer.flush()
+        except OSError:
+            pass
+        finally:
+            with self.__lock:
+                self.__connections.discard(connection)
+
+    def __get_neatcpp(self) -> NeatCpp:
+        # Preprocessor of the current thread keeps the included files cached between the requests. It is created again
+        # if the silent files have been processed again or if any of the files it has read has been changed, which is
+        # checked at most once per the watch interval together with clearing the file lookups to find the new files.
+        with self.__lock:
+            (snapshot, generation) = (self.__snapshot, self.__generation)
+        neatcpp: NeatCpp | None = getattr(self.__local, "neatcpp", None)
+        if neatcpp is not None and self.__watch_interval > 0 and perf_counter() - self.__local.check_time >= self.__watch_interval:
+            self.__local.check_time = perf_counter()
+            if neatcpp.is_up_to_date():
+                neatcpp.clear_file_lookups()
+            else:
+                neatcpp.close()
+                neatcpp = None
+        if neatcpp is not None and self.__local.generation != generation:
+            neatcpp.close()
+            neatcpp = None
+        if neatcpp is None:
+            errors: list[str] = []
+            logger = self.log.spawn()
+            logger.set_printers(logger.get_printers()[0], lambda text, severity, _end: errors.append(
+                f"ERROR ({Logger.ErrSeverity(severity).name}): {logger.fill_location_tag(text)}"))
+            neatcpp = NeatCpp(logger)
+            self.__local.neatcpp = neatcpp
+            self.__local.generation = generation
+            self.__local.errors = errors
+            self.__local.check_time = perf_counter()
+        if snapshot is not None:
+            neatcpp.restore(snapshot)
+        neatcpp.reset_output()
+        return neatcpp
+
+
+class PreprocClient():
+    """A client sending the requests to the :py:class:`neatcpp.PreprocServer` over a Unix domain socket.
+
+    Args:
+        socket_path (str): Path to the Unix domain socket of the server.
+        timeout (float, optional): Timeout in seconds for connecting to the server and receiving the response.
+            Defaults to None, i.e., no timeout.
+
+    Attributes:
+        socket_path (Path): Path to the Unix domain socket of the server.
+    """
+    def __init__(self, socket_path: str | Path, timeout: float | None = None) -> None:
+        self.socket_path: Path = Path(socket_path)
+        self.__timeout: float | None = timeout
+
+    def request(self, op: str, **params: str | bool) -> dict:
+        """Sends the request to the server and waits for the response. The request operations and the response format are
+        described in the :py:class:`neatcpp.PreprocServer` class documentation.
+
+        Args:
+            op (str): Requested operation, i.e., ``process_file``, ``process_code``, ``expand_macros`` or ``evaluate``.
+            params (str): Parameters of the operation, e.g., ``code="A + 1"``. File paths are sent as they are, so they
+                should be absolute if the server runs in a different directory.
+
+        Returns:
+            dict: Response of the server or a response with the ``error`` describing the communication failure.
+        """
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client_socket:
+                client_socket.settimeout(self.__timeout)
+                client_socket.connect(str(self.socket_path))
+                with client_socket.makefile("rw", encoding="utf-8") as stream:
+                    stream.write(f"{json.dumps({'op': op, **params})}\n")
+                    stream.flush()
+                    response_line = stream.readline()
+            response = json.loads(response_line)
+        except (OSError, ValueError) as exc:
+            response = {"error": f"request to the server on socket '{self.socket_path}' failed: {exc}"}
+        return response
+
+
+_worker_neatcpp: NeatCpp | None = None
+_worker_snapshot: PreprocSnapshot | None = None
+
+
+def _init_parallel_worker(snapshot: PreprocSnapshot, log_config: tuple[int, int, bool], prefetch_budget: int) -> None:
+    global _worker_neatcpp, _worker_snapshot    # pylint: disable=global-statement
+    log.config(*log_config)
+    _worker_neatcpp = NeatCpp()
+    _worker_neatcpp.prefetch_budget = prefetch_budget
+    _worker_snapshot = snapshot
+
+
+def _process_file_in_worker(file_path: str | Path, out_file_path: Path, full_output: bool, stream: bool,
+                            incremental: bool) -> tuple[Path, dict[str, dict]]:
+    if _worker_neatcpp is None or _worker_snapshot is None:
+        return (out_file_path, {})
+    return _process_file(_worker_neatcpp, _worker_snapshot, file_path, out_file_path, full_output, stream, incremental)
+
+
+def _process_file(neatcpp: NeatCpp, snapshot: PreprocSnapshot, file_path: str | Path, out_file_path: Path, full_output: bool,
+                  stream: bool, incremental: bool) -> tuple[Path, dict[str, dict]]:
+    # Each file starts from the same snapshot, but the files parsed into the include cache are reused by the worker.
+    # Dependencies of the output file are returned as the dependency manifest entries in the incremental mode.
+    manifest = DependencyManifest()
+    neatcpp.restore(snapshot)
+    neatcpp.reset_output()
+    if incremental:
+        neatcpp.process_files_incremental(file_path, out_file_path=out_file_path, manifest=manifest, full_output=full_output)
+    elif stream:
+        neatcpp.process_files_stream(file_path, out_file_path=out_file_path, full_output=full_output)
+    else:
+        neatcpp.process_files(file_path, global_output=True)
+        neatcpp.save_output_to_file(out_file_path, full_output)
+    return (out_file_path, manifest.entries)
+
+
 def run_console_app() -> None:
-    argparser = argparse.ArgumentParser(description=CLI_DESCRIPTION, epilog=CLI_EPILOG,
-                                        formatter_class=argparse.RawDescriptionHelpFormatter)
+    args_list = CLI_DEBUG_ARGS_LIST if CLI_DEBUG_ARGS_LIST is not None else sys.argv[1:]
+    if args_list and args_list[0] == "serve":
+        _run_server_app(args_list[1:])
+        return
+    if args_list and args_list[0] == "client":
+        _run_client_app(args_list[1:])
+        return
+    argparser = argparse.ArgumentParser(description=f"{CLI_DESCRIPTION}\n\nRun '{__module_name__} serve -h' or '{__module_name__} "
+                                                    f"client -h' for the preprocessing server and its client.",
+                                        epilog=CLI_EPILOG, formatter_class=argparse.RawDescriptionHelpFormatter)
     argparser.add_argument("in_files", metavar="input_files", type=Path, nargs="+",
                            help="one or more input C source files to be processed into an output file")
-    argparser.add_argument("out_file", metavar="output_file", type=Path,
-                           help="output file generated from processed input files")
+    argparser.add_argument("out_file", metavar="output_file", type=Path, nargs="?",
+                           help="output file generated from processed input files, omitted if the --out_dir option is used")
     argparser.add_argument("-i", "--incl_dirs", metavar="incl_dir", type=Path, nargs="+",
                            help="directories to search for included files")
     argparser.add_argument("-s", "--silent", metavar="file", type=Path, nargs="+",
                            help="additional files to be preprocessed first silently without generating an output file")
+    argparser.add_argument("-m", "--macro_db", "--macro-db", metavar="db_file", type=Path,
+                           help="macro database file storing the state after processing the silent files, loaded instead of "
+                                "processing the silent files again if none of the processed files has changed")
     argparser.add_argument("-x", "--exclude", metavar="macro_or_file", type=str, nargs="+",
                            help="excluded macros or files for which the #define and #include directives will not be processed")
     argparser.add_argument("-f", "--full_output", action="store_true",
                            help="enable full output, i.e., include directives, all comments and whitespaces in the preprocessor output")
+    argparser.add_argument("-t", "--tab_size", metavar="size", type=int, default=4,
+                           help="number of columns between the tab stops used to replace the tabs by spaces, defaults to 4")
+    argparser.add_argument("-o", "--out_dir", metavar="dir", type=Path,
+                           help="save a separate output file for each input file processed as an independent translation unit "
+                                "into the specified directory instead of a single output file")
+    argparser.add_argument("--out_suffix", metavar="suffix", type=str, default="",
+                           help="suffix added to the input file names to create the output file names in the --out_dir directory")
+    argparser.add_argument("-j", "--jobs", metavar="N", type=int, default=1,
+                           help="number of parallel processes used with the --out_dir option (0 = number of CPUs)")
+    argparser.add_argument("--incremental", metavar="manifest_file", type=str, nargs="?", const="",
+                           help="process only the input files with outdated output files according to the dependency manifest file, "
+                                "defaults to output_file.deps.json or out_dir/neatcpp_deps.json")
+    argparser.add_argument("--profile", metavar="json_file", type=str, nargs="?", const="",
+                           help="save the profiling data in the JSON format into the specified file or print them if the file "
+                                "is not specified, data are not collected from the parallel processes of the --out_dir option")
+    argparser.add_argument("--stream", action="store_true",
+                           help="read the input files line by line and write the output continuously to limit the used memory")
+    argparser.add_argument("--prefetch", metavar="budget_mb", type=float, default=0.0,
+                           help="read the included files in advance in background threads using at most the specified memory "
+                                "in MB, useful for slow or network file systems (0 = no prefetching)")
     argparser.add_argument("-v", "--verbosity", metavar="level", type=int, choices=range(3), default=0,
                            help="set console log messages verbosity level 0-2 (0 = log OFF), does not affect error messages")
     argparser.add_argument("-V", "--version", action="version", version=f"{__module_name__} {__version__}")
 
-    args = argparser.parse_args(CLI_DEBUG_ARGS_LIST)
+    args = argparser.parse_args(args_list)
+    # Input files are followed by the output file, unless the separate output files are saved into the output directory.
+    if args.out_dir is None:
+        if args.out_file is None:
+            if len(args.in_files) < 2:
+                argparser.error("the following arguments are required: output_file")
+            args.out_file = args.in_files.pop()
+        if args.jobs != 1:
+            argparser.error("argument -j/--jobs: requires the -o/--out_dir option")
+    elif args.out_file is not None:
+        args.in_files.append(args.out_file)
 
     log.config(args.verbosity)
     neatcpp = NeatCpp()
+    neatcpp.tab_size = args.tab_size
+    neatcpp.prefetch_budget = int(args.prefetch * 1024 * 1024)
+    if args.profile is not None:
+        neatcpp.enable_profiling()
     if args.incl_dirs is not None:
         neatcpp.add_include_dirs(*args.incl_dirs)
     if args.silent is not None:
-        neatcpp.process_files(*args.silent, global_output=False)
+        if args.macro_db is None or not neatcpp.load_macro_db(args.macro_db, *args.silent):
+            neatcpp.process_files(*args.silent, global_output=False)
+            if args.macro_db is not None:
+                neatcpp.save_macro_db(args.macro_db, *args.silent)
     if args.exclude is not None:
         neatcpp.exclude_macros_files = args.exclude
-    neatcpp.process_files(*args.in_files, global_output=True)
-    neatcpp.save_output_to_file(args.out_file, args.full_output)
+    manifest = None
+    if args.incremental is not None:
+        if not args.incremental:
+            args.incremental = Path(args.out_dir, "neatcpp_deps.json") if args.out_dir is not None else Path(f"{args.out_file}.deps.json")
+        manifest = DependencyManifest.load(args.incremental)
+    if args.out_dir is not None:
+        neatcpp.process_files_parallel(*args.in_files, out_dir_path=args.out_dir, out_suffix=args.out_suffix,
+                                       full_output=args.full_output, jobs=args.jobs, stream=args.stream, manifest=manifest)
+    elif manifest is not None:
+        neatcpp.process_files_incremental(*args.in_files, out_file_path=args.out_file, manifest=manifest, full_output=args.full_output)
+    elif args.stream:
+        neatcpp.process_files_stream(*args.in_files, out_file_path=args.out_file, full_output=args.full_output)
+    else:
+        neatcpp.process_files(*args.in_files, global_output=True)
+        neatcpp.save_output_to_file(args.out_file, args.full_output)
+    if manifest is not None:
+        manifest.save(args.incremental)
+    if args.profile:
+        with open(args.profile, "w", encoding="utf-8") as file:
+            json.dump(neatcpp.get_profile(), file, indent=4)
+    elif args.profile is not None:
+        print(json.dumps(neatcpp.get_profile(), indent=4))
+
+
+def _run_server_app(args_list: list[str]) -> None:
+    argparser = argparse.ArgumentParser(prog=f"{__module_name__} serve", description=f"{CLI_DESCRIPTION}\n\nPreprocessing server "
+                                        "answering the client requests over a Unix domain socket.",
+                                        epilog=CLI_EPILOG, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument("socket", type=Path, help="path to the Unix domain socket created by the server")
+    argparser.add_argument("-i", "--incl_dirs", metavar="incl_dir", type=Path, nargs="+",
+                           help="directories to search for included files")
+    argparser.add_argument("-s", "--silent", metavar="file", type=Path, nargs="+",
+                           help="files preprocessed silently to create the initial state of each request")
+    argparser.add_argument("-m", "--macro_db", "--macro-db", metavar="db_file", type=Path,
+                           help="macro database file storing the state after processing the silent files, loaded instead of "
+                                "processing the silent files again if none of the processed files has changed")
+    argparser.add_argument("-x", "--exclude", metavar="macro_or_file", type=str, nargs="+",
+                           help="excluded macros or files for which the #define and #include directives will not be processed")
+    argparser.add_argument("-t", "--tab_size", metavar="size", type=int, default=4,
+                           help="number of columns between the tab stops used to replace the tabs by spaces, defaults to 4")
+    argparser.add_argument("-j", "--jobs", metavar="N", type=int, default=0,
+                           help="maximum number of concurrently served clients (0 = number of CPUs)")
+    argparser.add_argument("-w", "--watch", metavar="seconds", type=float, default=1.0,
+                           help="interval between the checks of the processed files changes (0 = no checks), defaults to 1")
+    argparser.add_argument("-v", "--verbosity", metavar="level", type=int, choices=range(3), default=0,
+                           help="set console log messages verbosity level 0-2 (0 = log OFF), does not affect error messages")
+    args = argparser.parse_args(args_list)
+
+    log.config(args.verbosity)
+    server = PreprocServer(args.socket, args.silent or (), args.incl_dirs or (), args.exclude or (), args.tab_size, args.macro_db,
+                           args.jobs, args.watch)
+    server.serve_forever()
+
+
+def _run_client_app(args_list: list[str]) -> None:
+    argparser = argparse.ArgumentParser(prog=f"{__module_name__} client", description=f"{CLI_DESCRIPTION}\n\nClient sending "
+                                        f"a request to the server started by '{__module_name__} serve' and printing the result.",
+                                        epilog=CLI_EPILOG, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument("socket", type=Path, help="path to the Unix domain socket of the server")
+    argparser.add_argument("--timeout", metavar="seconds", type=float, help="timeout for the server response")
+    subparsers = argparser.add_subparsers(dest="op", required=True, metavar="operation")
+    for (op, arg_name, arg_help) in (("process_file", "file", "C source file to be processed"),
+                                     ("process_code", "code", "C source code to be processed, - reads the code from stdin"),
+                                     ("expand_macros", "code", "C code with the macros to be expanded, - reads the code from stdin"),
+                                     ("evaluate", "expr", "C constant expression to be evaluated")):
+        subparser = subparsers.add_parser(op, help=f"{op.replace('_', ' ')} using the server state")
+        subparser.add_argument(arg_name, type=str, help=arg_help)
+        if op.startswith("process"):
+            subparser.add_argument("-f", "--full_output", action="store_true",
+                                   help="enable full output, i.e., include directives, all comments and whitespaces in the output")
+    args = argparser.parse_args(args_list)
+
+    params: dict[str, str | bool]
+    if args.op == "process_file":
+        # Server may run in a different directory, so the file path is sent as an absolute path.
+        params = {"file": str(Path(args.file).resolve()), "full_output": args.full_output}
+    elif args.op == "evaluate":
+        params = {"expr": args.expr}
+    else:
+        params = {"code": sys.stdin.read() if args.code == "-" else args.code}
+        if args.op == "process_code":
+            params["full_output"] = args.full_output
+    response = PreprocClient(args.socket, args.timeout).request(args.op, **params)
+    for error in response.get("errors", []):
+        print(error, file=sys.stderr)
+    if "error" in response:
+        print(f"ERROR: {response['error']}", file=sys.stderr)
+        sys.exit(1)
+    result = response.get("result")
+    print(result, end="" if args.op.startswith("process") else "\n")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,300 @@
+# pylint: disable=missing-module-docstring, missing-function-docstring
+
+from pathlib import Path
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+
+CURR_DIR_PATH = Path(__file__).parent
+
+sys.path.append(str(Path(CURR_DIR_PATH, "../src").resolve()))
+
+# pylint: disable=wrong-import-position
+from neatcpp import NeatCpp                                 # noqa: E402
+from neatcpp.neatcpp import PreprocInput, PreprocOutput     # noqa: E402
+
+
+CODE_BLOCK = """/* Sample function used to generate a benchmark input. */
+static int calc_value(int value_a, int value_b)
+{
+    int result;
+
+    // Compute the result.
+    result = value_a * value_b + 42;
+    return result;
+}
+
+#define SOME_MACRO  1
+
+"""
+
+IF_MACROS = """
+#define CFG_A       5
+#define CFG_B       (CFG_A * 2)
+#define CFG_C(X)    ((X) << 2)
+"""
+
+
+def generate_object_macros(scale: float) -> dict[str, str]:
+    macros_num = int(2000 * scale)
+    code = "".join(f"#define OBJ_{idx} ({idx} + OBJ_BASE)\n" for idx in range(macros_num))
+    code += "#define OBJ_BASE 7\n\n"
+    code += "".join(f"int var_{idx} = OBJ_{idx} * OBJ_{(idx * 7) % macros_num} + OBJ_{(idx * 13) % macros_num};\n"
+                    for idx in range(int(20000 * scale)))
+    return {"main.c": code}
+
+
+def generate_func_nesting(scale: float) -> dict[str, str]:
+    depth = 16
+    code = "#define FN_0(X) (X)\n"
+    code += "".join(f"#define FN_{idx}(X) FN_{idx - 1}((X) + {idx})\n" for idx in range(1, depth + 1))
+    code += "".join(f"int res_{idx} = FN_{depth}({idx}) + FN_{idx % depth}(FN_{(idx + 3) % depth}({idx}));\n"
+                    for idx in range(int(3000 * scale)))
+    return {"main.c": code}
+
+
+def generate_variadic_calls(scale: float) -> dict[str, str]:
+    code = "#define LOG(LEVEL, FMT, ...) log_write(LEVEL, __FILE__, FMT, __VA_ARGS__)\n#define LVL_INFO 1\n"
+    args = ", ".join(f"(uint32_t)value_{idx}" for idx in range(60))
+    code += "".join(f"    LOG(LVL_INFO, \"entry {idx}: %u, (%u)\", {args});\n" for idx in range(int(3000 * scale)))
+    return {"main.c": code}
+
+
+def generate_include_fanout(scale: float) -> dict[str, str]:
+    headers_num = max(2, int(200 * scale))
+    files = {}
+    for idx in range(headers_num):
+        includes = "".join(f"#include \"hdr_{(idx + step) % headers_num}.h\"\n" for step in (1, 2, 5, 11))
+        files[f"hdr_{idx}.h"] = (f"#ifndef HDR_{idx}_H\n#define HDR_{idx}_H\n{includes}"
+                                 f"#define HDR_{idx}_VAL {idx}\ntypedef int hdr_{idx}_t;\n#endif\n")
+    code = "".join(f"#include \"hdr_{idx % headers_num}.h\"\nint use_{idx} = HDR_{idx % headers_num}_VAL;\n"
+                   for idx in range(int(5000 * scale)))
+    files["main.c"] = code
+    return files
+
+
+def generate_multiline_bodies(scale: float) -> dict[str, str]:
+    body = "".join(f"        (name)->field_{idx} = (val) + {idx}; \\\n" for idx in range(30))
+    code = f"#define INIT_STRUCT(name, val) \\\n    do {{ \\\n{body}    }} while (0)\n\n"
+    code += "void init(void)\n{\n"
+    code += "".join(f"    INIT_STRUCT(&items[{idx}], {idx});\n" for idx in range(int(1500 * scale)))
+    code += "}\n"
+    return {"main.c": code}
+
+
+def generate_if_trees(scale: float) -> dict[str, str]:
+    code = "#define CFG_LEVEL 3\n#define CFG_MASK 0x5A\n#define CFG_HAS(X) (((CFG_MASK) >> (X)) & 1)\n"
+    block = ""
+    for idx in range(int(2000 * scale)):
+        block += (f"#if CFG_LEVEL > {idx % 5} && CFG_HAS({idx % 8})\n"
+                  f"#  if defined(CFG_OPT_{idx % 3}) || (CFG_MASK & {idx % 256}) == {idx % 256}\n"
+                  f"int opt_a_{idx} = {idx};\n"
+                  f"#  elif CFG_LEVEL * 2 >= {idx % 9}\n"
+                  f"int opt_b_{idx} = {idx};\n"
+                  f"#  else\n"
+                  f"int opt_c_{idx} = {idx};\n"
+                  f"#  endif\n"
+                  f"#else\n"
+                  f"int opt_d_{idx} = {idx};\n"
+                  f"#endif\n")
+    return {"main.c": code + block}
+
+
+def generate_comment_blocks(scale: float) -> dict[str, str]:
+    code = "#define DOC_MACRO 1\n#define DOC_FUNC(X) ((X) + DOC_MACRO)\n"
+    comment = "".join(f" * Line {idx} of the description mentioning DOC_MACRO and DOC_FUNC(x) usage.\n" for idx in range(40))
+    code += "".join(f"/**\n * @brief Function {idx}.\n{comment} */\nint func_{idx}(int x) {{ return DOC_FUNC(x); }}\n"
+                    for idx in range(int(600 * scale)))
+    return {"main.c": code}
+
+
+def generate_func_defines(scale: float) -> dict[str, str]:
+    macros_num = int(8000 * scale)
+    code = "".join(f"#define REG_{idx}_SET(BASE, VAL) (*(volatile unsigned *)((BASE) + {idx * 4}) = (VAL))\n"
+                   f"#define REG_{idx}_OFFSET {idx * 4}\n" for idx in range(macros_num))
+    code += "".join(f"REG_{idx}_SET(0x40000000, REG_{idx}_OFFSET);\n" for idx in range(0, macros_num, 100))
+    return {"main.c": code}
+
+
+SCENARIOS = {
+    "object_macros": generate_object_macros,
+    "func_nesting": generate_func_nesting,
+    "variadic_calls": generate_variadic_calls,
+    "include_fanout": generate_include_fanout,
+    "multiline_bodies": generate_multiline_bodies,
+    "if_trees": generate_if_trees,
+    "comment_blocks": generate_comment_blocks,
+    "func_defines": generate_func_defines}
+
+
+def generate_prelude(macros_num: int) -> str:
+    # SDK-like header with register addresses, bit masks and multi-line register access macros.
+    return "".join(f"#define PERIPH_{idx}_BASE    (0x40000000UL + 0x{idx * 0x400:X}UL)\n"
+                   f"#define PERIPH_{idx}_EN_MSK  (1UL << {idx % 32})\n"
+                   f"#define PERIPH_{idx}_WRITE(REG, VAL)  \\\n"
+                   f"    do {{ \\\n"
+                   f"        *(volatile unsigned long *)(PERIPH_{idx}_BASE + (REG)) = (VAL) | PERIPH_{idx}_EN_MSK; \\\n"
+                   f"    }} while (0)\n" for idx in range(macros_num // 3))
+
+
+def generate_code(size_mb: float) -> str:
+    return CODE_BLOCK * max(1, int(size_mb * 1024 * 1024) // len(CODE_BLOCK))
+
+
+def generate_if_exprs(lines_num: int) -> list[str]:
+    return [f"(CFG_A + {idx % 50}) > 10 && CFG_B == 10 || CFG_C({idx % 7}) >= 16" for idx in range(lines_num)]
+
+
+def legacy_evaluate(expr_code: str) -> object:
+    # Evaluation of an already preprocessed expression using the Python's eval() as in neatcpp 1.2.0.
+    expr_code = expr_code.replace("&&", " and ").replace("||", " or ").replace("/", "//")
+    try:
+        return eval(expr_code.replace("import", ""))     # pylint: disable = eval-used
+    except (SyntaxError, NameError, TypeError, ZeroDivisionError):
+        return False
+
+
+def bench_output(size_mb: float) -> float:
+    code_parts = list(PreprocInput().yield_code_parts(generate_code(size_mb)))
+    output = PreprocOutput()
+    start_time = time.perf_counter()
+    for (code_type, code_part) in code_parts:
+        output.add_code_part(code_part, code_type)
+    _ = output.code
+    _ = output.code_all
+    return time.perf_counter() - start_time
+
+
+def bench_if(lines_num: int) -> tuple[float, float]:
+    neatcpp = NeatCpp()
+    neatcpp.process_code(IF_MACROS, global_output=False)
+    exprs = generate_if_exprs(lines_num)
+    exp_exprs = [neatcpp.expand_macros(expr) for expr in exprs]
+    start_time = time.perf_counter()
+    for expr in exprs:
+        neatcpp.is_true(expr)
+    eval_time = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    for expr in exp_exprs:
+        neatcpp.is_true(expr)
+    exp_eval_time = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    for expr in exp_exprs:
+        legacy_evaluate(expr)
+    legacy_eval_time = time.perf_counter() - start_time
+    print(f"{'#if lines':>10} {'is_true [s]':>12} {'expanded [s]':>13} {'legacy eval() [s]':>18}")
+    print(f"{lines_num:>10} {eval_time:>12.3f} {exp_eval_time:>13.3f} {legacy_eval_time:>18.3f}")
+    return (exp_eval_time, legacy_eval_time)
+
+
+def bench_macros(macros_num: int, used_pct: float) -> tuple[float, float]:
+    prelude = generate_prelude(macros_num)
+    macros_num = 3 * (macros_num // 3)
+    used_num = int(macros_num * used_pct / 100) // 3
+    refs = "".join(f"PERIPH_{idx * (macros_num // 3) // max(used_num, 1)}_WRITE(0x10, {idx});\n" for idx in range(used_num))
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    neatcpp = NeatCpp()
+    neatcpp.process_code(prelude, global_output=False)
+    define_time = time.perf_counter() - start_time
+    define_bytes = tracemalloc.get_traced_memory()[0]
+    neatcpp.expand_macros(refs)
+    used_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"{'macros':>8} {'define time [s]':>16} {'bytes/macro':>12} {'used [%]':>9} {'bytes/macro used':>17}")
+    print(f"{macros_num:>8} {define_time:>16.3f} {define_bytes / macros_num:>12.0f} {used_pct:>9.1f} "
+          f"{used_bytes / macros_num:>17.0f}")
+    return (define_bytes / macros_num, used_bytes / macros_num)
+
+
+def run_scenario(files: dict[str, str], dir_path: Path, stream: bool = False, measure_memory: bool = True) -> dict:
+    for (file_name, code) in files.items():
+        Path(dir_path, file_name).write_text(code, encoding="utf-8")
+    in_file_path = Path(dir_path, "main.c")
+    out_file_path = Path(dir_path, "main_out.c")
+    lines_num = sum(code.count("\n") for code in files.values())
+    size_mb = sum(len(code.encode("utf-8")) for code in files.values()) / (1024 * 1024)
+
+    def process() -> None:
+        neatcpp = NeatCpp()
+        neatcpp.add_include_dirs(dir_path)
+        if stream:
+            neatcpp.process_files_stream(in_file_path, out_file_path=out_file_path)
+        else:
+            neatcpp.process_files(in_file_path)
+            neatcpp.save_output_to_file(out_file_path)
+
+    start_time = time.perf_counter()
+    process()
+    duration = time.perf_counter() - start_time
+    peak_mb = None
+    if measure_memory:
+        # Memory is measured in a separate run, because the allocations tracing slows down the processing.
+        tracemalloc.start()
+        process()
+        peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+    return {"lines": lines_num, "size_mb": size_mb, "time": duration, "lines_per_s": lines_num / duration,
+            "mb_per_s": size_mb / duration, "peak_mb": peak_mb}
+
+
+def bench_suite(scenarios: list[str], scale: float, stream: bool, measure_memory: bool) -> dict[str, dict]:
+    results = {}
+    print(f"{'scenario':<18} {'lines':>8} {'size [MB]':>10} {'time [s]':>9} {'lines/s':>10} {'MB/s':>7} {'peak [MB]':>10}")
+    for scenario in scenarios:
+        with tempfile.TemporaryDirectory() as dir_name:
+            result = run_scenario(SCENARIOS[scenario](scale), Path(dir_name), stream, measure_memory)
+        results[scenario] = result
+        peak_mb = f"{result['peak_mb']:>10.2f}" if result["peak_mb"] is not None else f"{'-':>10}"
+        print(f"{scenario:<18} {result['lines']:>8} {result['size_mb']:>10.2f} {result['time']:>9.3f} "
+              f"{result['lines_per_s']:>10.0f} {result['mb_per_s']:>7.3f} {peak_mb}")
+    return results
+
+
+def main() -> None:
+    argparser = argparse.ArgumentParser(description="Benchmarks of the neatcpp preprocessor.")
+    subparsers = argparser.add_subparsers(dest="scenario", required=True)
+    output_parser = subparsers.add_parser("output", help="output accumulation time for inputs of various sizes")
+    output_parser.add_argument("sizes", metavar="size_mb", type=float, nargs="*", default=[1, 10, 25, 50, 100],
+                               help="input code sizes in MB")
+    if_parser = subparsers.add_parser("if", help="evaluation time of #if expressions compared to the legacy eval()")
+    if_parser.add_argument("lines_num", metavar="lines", type=int, nargs="?", default=100000,
+                           help="number of evaluated #if expressions")
+    macros_parser = subparsers.add_parser("macros", help="definition time and memory footprint of the macros in a large header")
+    macros_parser.add_argument("macros_num", metavar="macros", type=int, nargs="?", default=50000,
+                               help="number of defined macros")
+    macros_parser.add_argument("-u", "--used", metavar="pct", type=float, default=1.0,
+                               help="percentage of the referenced macros (default: 1)")
+    suite_parser = subparsers.add_parser("suite", help="preprocessing throughput and peak memory for synthetic C code scenarios")
+    suite_parser.add_argument("scenarios", metavar="scenario", nargs="*", default=list(SCENARIOS),
+                              help=f"processed scenarios: {', '.join(SCENARIOS)} (default: all)")
+    suite_parser.add_argument("-s", "--scale", type=float, default=1.0, help="scale of the generated code size")
+    suite_parser.add_argument("--stream", action="store_true", help="process the files in the streaming mode")
+    suite_parser.add_argument("--no_memory", action="store_true", help="skip the peak memory measurement")
+    suite_parser.add_argument("--json", metavar="json_file", type=Path, help="save the results into a JSON file")
+    args = argparser.parse_args()
+
+    if args.scenario == "output":
+        print(f"{'size [MB]':>10} {'time [s]':>10} {'time/MB [ms]':>14}")
+        for size_mb in args.sizes:
+            duration = bench_output(size_mb)
+            print(f"{size_mb:>10.1f} {duration:>10.3f} {1000 * duration / size_mb:>14.2f}")
+    elif args.scenario == "if":
+        bench_if(args.lines_num)
+    elif args.scenario == "macros":
+        bench_macros(args.macros_num, args.used)
+    elif args.scenario == "suite":
+        unknown_scenarios = [scenario for scenario in args.scenarios if scenario not in SCENARIOS]
+        if unknown_scenarios:
+            suite_parser.error(f"unknown scenarios: {', '.join(unknown_scenarios)}")
+        results = bench_suite(args.scenarios, args.scale, args.stream, not args.no_memory)
+        if args.json is not None:
+            args.json.write_text(json.dumps(results, indent=4), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
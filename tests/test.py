@@ -1,6 +1,10 @@
 # pylint: disable=missing-module-docstring, missing-function-docstring
 
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import socket
+import threading
+import time
 import sys
 import pytest
 
@@ -10,8 +14,8 @@ CURR_DIR_PATH = Path(__file__).parent
 sys.path.append(str(Path(CURR_DIR_PATH, "../src").resolve()))
 
 # pylint: disable=wrong-import-position
-from neatcpp import NeatCpp             # noqa: E402
-from neatcpp import run_console_app     # noqa: E402
+from neatcpp import NeatCpp, PreprocSnapshot, DependencyManifest, PreprocServer, PreprocClient    # noqa: E402
+from neatcpp import run_console_app             # noqa: E402
 
 
 def compare_files(gen_file: Path, exp_file: Path) -> bool:
@@ -103,3 +107,417 @@ def test_script(monkeypatch, incl_dirs: tuple[Path], excludes: list[str], files_
 
     # Assert that the output file is the same as the expected file.
     assert compare_files(file_out, file_exp) is True
+
+
+def test_include_guards(ncpp: NeatCpp, tmp_path: Path) -> None:
+    Path(tmp_path, "guard.h").write_text("/* Guarded. */\n#ifndef GUARD_H\n#define GUARD_H\n#define VAL_G 1\n#endif\n",
+                                         encoding="utf-8")
+    Path(tmp_path, "once.h").write_text("#pragma once\n#define VAL_O 2\n", encoding="utf-8")
+    Path(tmp_path, "else.h").write_text("#ifndef ELSE_H\n#define ELSE_H\n#else\n#define AGAIN 1\n#endif\n", encoding="utf-8")
+    ncpp.reset()
+    ncpp.add_include_dirs(tmp_path)
+    output = ncpp.process_code("#include \"guard.h\"\n#include \"guard.h\"\n#include <once.h>\n#include <once.h>\n"
+                               "#include \"else.h\"\n#include \"else.h\"\nVAL_G VAL_O AGAIN\n")
+    assert output == "1 2 1\n"
+
+
+def test_parallel(ncpp: NeatCpp, tmp_path: Path) -> None:
+    ncpp.reset()
+    ncpp.add_include_dirs(Path(CURR_DIR_PATH, "c_files", "incl"))
+    ncpp.exclude_macros_files = ["IGN_MACRO_OBJ", "IGN_MACRO_FUNC", "stdint.h"]
+    out_files = ncpp.process_files_parallel(Path(CURR_DIR_PATH, "c_files", "src1.c"), Path(CURR_DIR_PATH, "c_files", "src2.c"),
+                                            out_dir_path=tmp_path, out_suffix="_out", jobs=2)
+    assert out_files == [Path(tmp_path, "src1_out.c"), Path(tmp_path, "src2_out.c")]
+    assert compare_files(out_files[0], Path(CURR_DIR_PATH, "c_files", "src1_exp.c")) is True
+    assert ncpp.output == "" and not ncpp.macros
+    ncpp.process_files(Path(CURR_DIR_PATH, "c_files", "src2.c"))
+    assert out_files[1].read_text(encoding="utf-8") == ncpp.output
+
+
+def test_snapshot(ncpp: NeatCpp, tmp_path: Path) -> None:
+    ncpp.reset()
+    ncpp.process_code("#define A 1\n#define F(X) X + A\n#if A\n", global_output=False)
+    snapshot = ncpp.snapshot()
+    ncpp.process_code("#undef A\n#define A 2\n#define B 3\n#endif\n", global_output=False)
+    assert ncpp.expand_macros("F(B)") == "3 + 2"
+    ncpp.restore(snapshot)
+    assert ncpp.expand_macros("F(B)") == "B + 1"
+    snapshot.save(Path(tmp_path, "snapshot.bin"))
+    ncpp.reset()
+    loaded_snapshot = PreprocSnapshot.load(Path(tmp_path, "snapshot.bin"))
+    assert loaded_snapshot is not None
+    ncpp.restore(loaded_snapshot)
+    assert list(ncpp.macros) == ["F", "A"]
+    assert ncpp.process_code("F(A)\n#endif\n") == "1 + 1\n"
+
+
+def test_macro_db(ncpp: NeatCpp, tmp_path: Path) -> None:
+    header = Path(tmp_path, "prelude.h")
+    header.write_text("#ifndef PRELUDE_H\n#define PRELUDE_H\n#define SQR(X) (X) * (X)\n#endif\n", encoding="utf-8")
+    ncpp.reset()
+    ncpp.add_include_dirs(tmp_path)
+    ncpp.process_files("prelude.h", global_output=False)
+    ncpp.save_macro_db(Path(tmp_path, "macros.db"), "prelude.h")
+    ncpp.reset()
+    ncpp.add_include_dirs(tmp_path)
+    assert ncpp.load_macro_db(Path(tmp_path, "macros.db"), "prelude.h") is True
+    assert ncpp.process_code("#include \"prelude.h\"\nSQR(2)\n") == "(2) * (2)\n"
+    header.write_text("#define SQR(X) X * X\n", encoding="utf-8")
+    ncpp.reset()
+    ncpp.add_include_dirs(tmp_path)
+    assert ncpp.load_macro_db(Path(tmp_path, "macros.db"), "prelude.h") is False
+    # Database is not valid if a missing included file is created or if a new file shadows an included file.
+    Path(tmp_path, "inc").mkdir()
+    Path(tmp_path, "inc", "types.h").write_text("#define TYPE int\n", encoding="utf-8")
+    header.write_text("#include \"missing.h\"\n#include <types.h>\n", encoding="utf-8")
+    for new_file_path in (Path(tmp_path, "missing.h"), Path(tmp_path, "types.h")):
+        ncpp.reset()
+        ncpp.add_include_dirs(tmp_path, Path(tmp_path, "inc"))
+        ncpp.process_files("prelude.h", global_output=False)
+        ncpp.save_macro_db(Path(tmp_path, "macros.db"), "prelude.h")
+        ncpp.reset()
+        ncpp.add_include_dirs(tmp_path, Path(tmp_path, "inc"))
+        assert ncpp.load_macro_db(Path(tmp_path, "macros.db"), "prelude.h") is True
+        new_file_path.write_text("#define TYPE long\n", encoding="utf-8")
+        ncpp.reset()
+        ncpp.add_include_dirs(tmp_path, Path(tmp_path, "inc"))
+        assert ncpp.load_macro_db(Path(tmp_path, "macros.db"), "prelude.h") is False
+
+
+EVAL_PARAMS = [
+    ("1 ? 2 : 0 ? 3 : 4", 2), ("!defined(EVAL_A) || !EVAL_A", 0), ("~0u", 0xFFFFFFFFFFFFFFFF), ("-1 < 0u", 0),
+    ("0x7FFFFFFFFFFFFFFF + 1", -0x8000000000000000), ("-7 / 2 + -7 % 2", -4), ("EVAL_F(EVAL_A) << 2 >> 1", 12),
+    ("'a' + '\\n' + '\\x01'", 108), ("10UL * 3LL", 30), ("UNDEFINED + 1", 1), ("0 && 1 / 0", 0), ("1 / 0", False),
+    ("EVAL_A /* comment */ == 5 && EVAL_A != 4", 1), ("08", False), ("09 + 1", False), ("1e2f + 08.5 + 0x1p1", 110.5)]
+
+
+@pytest.mark.parametrize("expr, value", EVAL_PARAMS)
+def test_evaluate(ncpp: NeatCpp, expr: str, value: int | bool) -> None:
+    ncpp.reset()
+    ncpp.process_code("#define EVAL_A 5\n#define EVAL_F(X) ((X) + 1)\n", global_output=False)
+    result = ncpp.evaluate(expr)
+    assert result == value and type(result) is type(value)
+
+
+def test_macro_ref_args(ncpp: NeatCpp) -> None:
+    ncpp.reset()
+    ncpp.process_code("#define ARGS_2(A, B) [A] [B]\n", global_output=False)
+    assert ncpp.expand_macros("ARGS_2 (f(1,2), \"),(\")") == "[f(1,2)] [\"),(\"]"
+    assert ncpp.expand_macros("ARGS_2(x /* ,) */, ')')") == "[x /* ,) */] [')']"
+    assert ncpp.expand_macros("ARGS_2(\n    (1, 2),\n    3\n)") == "[(1, 2)] [3]"
+
+
+def test_macro_subst(ncpp: NeatCpp) -> None:
+    ncpp.reset()
+    ncpp.process_code("#define TWICE(a) a+a\n#define SWAP(a, b) b a\n#define CAT_STR(x, ...) x ## _y #x: __VA_ARGS__\n",
+                      global_output=False)
+    assert ncpp.expand_macros("TWICE(1)") == "1+1"
+    assert ncpp.expand_macros("SWAP(b, \"\\n\")") == "\"\\n\" b"
+    assert ncpp.expand_macros("CAT_STR(z, 1, 2)") == "z_y \"z\": 1, 2"
+
+
+def test_macro_in_comment(ncpp: NeatCpp) -> None:
+    ncpp.reset()
+    ncpp.process_code("#define CMNT_A 1\n#define CMNT_F(X) (X + CMNT_A)\n", global_output=False)
+    assert ncpp.expand_macros("/* CMNT_A, CMNT_F(2) */ CMNT_A; // CMNT_A\nCMNT_F(CMNT_A)") == \
+        "/* CMNT_A, CMNT_F(2) */ 1; // CMNT_A\n(1 + 1)"
+    assert ncpp.expand_macros("s = \"CMNT_A /*\" CMNT_F('\"') \"*/\"") == "s = \"CMNT_A /*\" ('\"' + 1) \"*/\""
+
+
+def test_stream(ncpp: NeatCpp, tmp_path: Path) -> None:
+    for full_output in (False, True):
+        ncpp.reset()
+        ncpp.add_include_dirs(Path(CURR_DIR_PATH, "c_files", "incl"))
+        ncpp.exclude_macros_files = ["IGN_MACRO_OBJ", "IGN_MACRO_FUNC", "stdint.h"]
+        in_files = (Path(CURR_DIR_PATH, "c_files", "src1.c"), Path(CURR_DIR_PATH, "c_files", "src2.c"))
+        ncpp.process_files_stream(*in_files, out_file_path=Path(tmp_path, "out.c"), full_output=full_output)
+        assert ncpp.output == ""
+        ncpp.reset()
+        ncpp.add_include_dirs(Path(CURR_DIR_PATH, "c_files", "incl"))
+        ncpp.exclude_macros_files = ["IGN_MACRO_OBJ", "IGN_MACRO_FUNC", "stdint.h"]
+        ncpp.process_files(*in_files)
+        expected_output = ncpp.output_full if full_output else ncpp.output
+        assert Path(tmp_path, "out.c").read_text(encoding="utf-8") == expected_output
+
+
+def test_include_search(ncpp: NeatCpp, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    Path(tmp_path, "lib").mkdir()
+    Path(tmp_path, "incl").mkdir()
+    Path(tmp_path, "lib", "lib.h").write_text("#include \"cfg.h\"\n#include <sys.h>\n", encoding="utf-8")
+    Path(tmp_path, "lib", "cfg.h").write_text("#define CFG 1\n", encoding="utf-8")
+    Path(tmp_path, "lib", "sys.h").write_text("#define SYS 1\n", encoding="utf-8")
+    Path(tmp_path, "incl", "sys.h").write_text("#define SYS 2\n", encoding="utf-8")
+    ncpp.reset()
+    ncpp.add_include_dirs(Path(tmp_path, "incl"), tmp_path)
+    assert ncpp.process_code("#include \"lib/lib.h\"\nCFG SYS\n") == "1 2\n"
+    assert ncpp.process_code("#undef CFG\n#include <cfg.h>\n#include \"cfg.h\"\nCFG\n") == "CFG\n"
+    assert ncpp.process_code("#include \"late.h\"\nLATE\n") == "LATE\n"
+    Path(tmp_path, "incl", "late.h").write_text("#define LATE 2\n", encoding="utf-8")
+    assert ncpp.process_code("#include \"late.h\"\nLATE\n") == "LATE\n"
+    ncpp.clear_file_lookups()
+    assert ncpp.process_code("#include \"late.h\"\nLATE\n") == "2\n"
+    # Missing files are searched only once, so the repeated includes do not check the files in each include directory.
+    for idx in range(20):
+        Path(tmp_path, f"dir{idx}").mkdir()
+        ncpp.add_include_dirs(Path(tmp_path, f"dir{idx}"))
+    is_file_calls = []
+    orig_is_file = Path.is_file
+    monkeypatch.setattr(Path, "is_file", lambda path: is_file_calls.append(path) or orig_is_file(path))
+    ncpp.process_code(1000 * "#include <missing.h>\n")
+    assert len(is_file_calls) == 23
+
+
+def test_incremental(ncpp: NeatCpp, tmp_path: Path) -> None:
+    def process(prelude: str) -> bool:
+        ncpp.reset()
+        ncpp.add_include_dirs(tmp_path)
+        ncpp.process_code(prelude, global_output=False)
+        manifest = DependencyManifest.load(Path(tmp_path, "deps.json"))
+        processed = ncpp.process_files_incremental(src, out_file_path=out, manifest=manifest)
+        manifest.save(Path(tmp_path, "deps.json"))
+        return processed
+
+    (src, hdr, out) = (Path(tmp_path, "src.c"), Path(tmp_path, "hdr.h"), Path(tmp_path, "src_out.c"))
+    src.write_text("#include \"hdr.h\"\n#include \"opt.h\"\n#ifdef OPT\n#undef CFG\n#define CFG 9\n#endif\nVAL\n", encoding="utf-8")
+    hdr.write_text("#define VAL CFG\n", encoding="utf-8")
+    assert process("#define CFG 1\n#define UNUSED 1\n") is True
+    assert out.read_text(encoding="utf-8") == "1\n"
+    assert process("#define CFG 1\n#define UNUSED 2\n") is False
+    assert process("#define CFG 2\n") is True
+    assert out.read_text(encoding="utf-8") == "2\n"
+    hdr.write_text("#define VAL CFG + 1\n", encoding="utf-8")
+    assert process("#define CFG 2\n") is True
+    assert process("#define CFG 2\n#define OPT\n") is True
+    assert out.read_text(encoding="utf-8") == "9 + 1\n"
+    Path(tmp_path, "opt.h").write_text("", encoding="utf-8")
+    assert process("#define CFG 2\n#define OPT\n") is True
+    assert process("#define CFG 2\n#define OPT\n") is False
+
+
+def test_profile(ncpp: NeatCpp) -> None:
+    ncpp.reset()
+    ncpp.enable_profiling()
+    ncpp.process_code("#define PRF_A 1\n#define PRF_B(X) (X + PRF_A)\n#if PRF_B(1) == 2\nPRF_B(PRF_A) PRF_A\n#endif\n")
+    profile = ncpp.get_profile(top_num=1)
+    assert {"input", "expand_macros", "evaluate", "directive:define", "directive:if"} <= set(profile["phase_times"])
+    assert profile["top_macros_by_count"] == [{"macro": "PRF_A", "expansions": 4, "time": pytest.approx(0, abs=1)}]
+    assert profile["deepest_expansion_chains"] == [["PRF_B", "PRF_A"]]
+    ncpp.enable_profiling(False)
+    assert ncpp.get_profile() == {}
+
+
+def test_tab_size(ncpp: NeatCpp) -> None:
+    ncpp.reset()
+    ncpp.tab_size = 8
+    ncpp.process_code("#define TAB_A\t1\r\n\tTAB_A\tx;  \r\nab\tc\t\n")
+    assert ncpp.output == "        1   x;\nab      c\n"
+    ncpp.reset()
+    ncpp.tab_size = 2
+    ncpp.process_code("\tTAB_A\tx;\n")
+    assert ncpp.output == "  TAB_A x;\n"
+    assert ncpp.snapshot().tab_size == 2
+
+
+def test_expansion_cache() -> None:
+    ncpp = NeatCpp()
+    ncpp.process_code("#define EC_A EC_B + 1\n#define EC_B 1\n#define EC_F(X) (X * EC_A)\n#define EC_D EC_E\n")
+    for _ in range(3):
+        assert ncpp.expand_macros("EC_F(2) EC_A EC_D") == "(2 * 1 + 1) 1 + 1 EC_E"
+    stats = ncpp.get_expansion_cache_stats()
+    assert stats["hits"] > 0 and stats["size"] > 0 and stats["invalidations"] == 0
+    ncpp.process_code("#define EC_C 3\n#undef EC_B\n#define EC_B 5\n#define EC_E 7\n")
+    assert ncpp.get_expansion_cache_stats()["invalidations"] > 0
+    assert ncpp.expand_macros("EC_F(2) EC_A EC_D") == "(2 * 5 + 1) 5 + 1 7"
+    ncpp.expansion_cache_size = 1
+    assert ncpp.get_expansion_cache_stats()["size"] <= 1
+    ncpp.expansion_cache_size = 0
+    assert ncpp.get_expansion_cache_stats()["size"] == 0
+    assert ncpp.expand_macros("EC_F(2) EC_A EC_D") == "(2 * 5 + 1) 5 + 1 7"
+
+
+def test_expansion_depth() -> None:
+    errors = []
+    ncpp = NeatCpp()
+    ncpp.log.set_printers(lambda *_: None, lambda text, *_: errors.append(text))
+    ncpp.process_code("".join(f"#define ED_M{idx} ED_M{idx + 1}\n#define ED_F{idx}(x) ED_F{idx + 1}(x)\n" for idx in range(505)) +
+                      "#define ED_M505 42\n#define ED_F505(x) (x)\n")
+    assert ncpp.expand_macros("ED_M0 ED_F0(ED_M0)") == "42 (42)"
+    assert not errors
+    for (code, exp_code) in (("#define stdin stdin\nstdin;\n", "stdin;\n"), ("#define f(x) f(x)\nf(1);\n", "f(1);\n"),
+                             ("#define A B\n#define B A\nA;\n", "A;\n"), ("#define A A+1\nA;\n", f"A{513 * '+1'};\n")):
+        errors.clear()
+        ncpp.reset()
+        ncpp.process_code(code)
+        assert ncpp.output == exp_code
+        assert errors and all("depth limit 512 exceeded" in error for error in errors)
+
+
+def test_macro_order(ncpp: NeatCpp) -> None:
+    ncpp.reset()
+    ncpp.process_code("#define MO_A 1\n#define MO_F(X) X\n#define MO_B 2\n#define MO_G(X) MO_F(X)\n#define MO_F(X) (X)\n")
+    assert list(ncpp.macros) == ["MO_F", "MO_G", "MO_A", "MO_B"]
+    assert ncpp.expand_macros("MO_G(MO_A)") == "(1)"
+    macros = ncpp.macros
+    ncpp.process_code("#define MO_H(X) X\n#undef MO_B\n")
+    macros["MO_C"] = macros["MO_A"]
+    assert ncpp.expand_macros("MO_H(MO_C)") == "1"
+    assert list(ncpp.macros) == ["MO_H", "MO_F", "MO_G", "MO_A", "MO_C"]
+
+
+def test_lazy_macro_body(ncpp: NeatCpp) -> None:
+    ncpp.reset()
+    ncpp.process_code("#define LZ_A  \\\n    (1 + \\\n     2)\n#define LZ_F(X)  \\\n    X##_t\n#define fine 3\n#ifdef LZ_A\n#endif\n")
+    assert not any(macro.parsed for macro in ncpp.macros.values())
+    assert ncpp.expand_macros("LZ_F(uint8) fine") == "uint8_t 3"
+    assert ncpp.is_true("LZ_A == 3")
+    assert all(macro.parsed for macro in ncpp.macros.values())
+    assert ncpp.macros["LZ_A"].body == "(1 +\n 2)"
+
+
+def test_macro_data_model(ncpp: NeatCpp) -> None:
+    ncpp.reset()
+    ncpp.process_code("#define DM_F(ARG_A, ARG_B) ARG_A + ARG_B\n#define DM_G(ARG_A) ARG_A\n#define DM_C 1\n")
+    macros = ncpp.macros
+    assert macros["DM_F"].args == ("ARG_A", "ARG_B") and macros["DM_C"].args == ()
+    assert macros["DM_F"].args[0] is macros["DM_G"].args[0]
+    assert not hasattr(macros["DM_F"], "__dict__")
+    assert ncpp.expand_macros("DM_F(DM_C, DM_G(2))") == "1 + 2"
+
+
+def test_custom_directive() -> None:
+    pragmas = []
+    ncpp = NeatCpp()
+    ncpp.add_directive("pragma", lambda parts, code: pragmas.append(parts["expr"]))
+    ncpp.add_directive("line", lambda parts, code: pragmas.append(f"line {parts['num']}"), r"^[ \t]*#[ \t]*line[ \t]+(?P<num>\d+)")
+    ncpp.process_code("#pragma pack(1)\n#if 0\n#pragma skipped\n#else\n#  pragma \\\n  once\n#endif\n#line x\n#line 10\n#pragma\n")
+    assert pragmas == ["pack(1)", "once", "line 10", None]
+    assert ncpp.output == ""
+    ncpp.add_directive("if", lambda parts, code: None)
+    ncpp.process_code("#if 1\nCD_OK\n#endif\n")
+    assert ncpp.output == "CD_OK\n"
+
+
+def test_inactive_branches(ncpp: NeatCpp, tmp_path: Path) -> None:
+    ncpp.reset()
+    code = ("#if 0\ncode_a;\n/* start\n#endif\n*/\n#define LONG \\\n#else\n#  if 1\ncode_b;\n#  else\ncode_c;\n#  endif\n"
+            "#elif 1\nactive;\n#else\ncode_d;\n#endif\n")
+    ncpp.process_code(code)
+    assert ncpp.output == "active;\n"
+    assert ncpp.output_full == code
+    Path(tmp_path, "inact.h").write_text(f"{code}#if IA_SEL\n#define IA_X 1\n#elif IA_SEL == 0\n#define IA_X 2\n#endif\n",
+                                         encoding="utf-8")
+    ncpp.add_include_dirs(tmp_path)
+    ncpp.process_code("#define IA_SEL 1\n#include \"inact.h\"\nIA_X\n#undef IA_X\n#undef IA_SEL\n#define IA_SEL 0\n"
+                      "#include \"inact.h\"\nIA_X\n")
+    assert ncpp.output.endswith("1\n2\n")
+
+
+def test_thread_safety(tmp_path: Path) -> None:
+    prelude = NeatCpp()
+    prelude.process_code("#define TS_SCALE 3\n#define TS_MUL(a, b) ((a) * (b))\n", global_output=False)
+    snapshot = prelude.snapshot()
+    Path(tmp_path, "ts.h").write_text("#define TS_INCL 1\n\n#if TS_INCL / 0\n#endif\n", encoding="utf-8")
+
+    def process(idx: int) -> tuple[str, list[tuple[str, int]]]:
+        err_locs = []
+        ncpp = NeatCpp()
+        ncpp.log.set_printers(lambda *_: None, lambda *_: err_locs.append((ncpp.log.proc_file_name, ncpp.log.proc_file_line)))
+        ncpp.restore(snapshot)
+        ncpp.add_include_dirs(tmp_path)
+        for _ in range(20):
+            ncpp.reset_output()
+            ncpp.process_code(f"{idx * chr(10)}#define TS_ID {idx}\n#include \"ts.h\"\n#if TS_ID / 0\n#endif\n"
+                              "x = TS_MUL(TS_ID, TS_SCALE);\n#undef TS_ID\n", proc_file_name=f"ts{idx}.c")
+        return (ncpp.output, err_locs)
+
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(process, range(32)))
+    for (idx, (output, err_locs)) in enumerate(results):
+        assert output.strip() == f"x = (({idx}) * (3));"
+        assert err_locs == 20 * [("ts.h", 2), (f"ts{idx}.c", idx + 2)]
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="Unix domain sockets not supported")
+def test_preproc_server(tmp_path: Path) -> None:
+    Path(tmp_path, "srv.h").write_text("#define SRV_A 5\n#define SRV_SQR(x) ((x) * (x))\n", encoding="utf-8")
+    Path(tmp_path, "srv.c").write_text("int a = SRV_SQR(SRV_A);\n#if 1 / 0\n#endif\n", encoding="utf-8")
+    Path(tmp_path, "inc").mkdir()
+    Path(tmp_path, "inc", "shadow.h").write_text("#define SHADOW 1\n", encoding="utf-8")
+    server = PreprocServer(Path(tmp_path, "srv.sock"), [Path(tmp_path, "srv.h")], [Path(tmp_path, "inc")], workers=4, watch_interval=0.05)
+    assert server.start()
+    try:
+        client = PreprocClient(Path(tmp_path, "srv.sock"), timeout=10.0)
+        response = client.request("process_file", file=str(Path(tmp_path, "srv.c")))
+        assert response["result"] == "int a = ((5) * (5));\n"
+        assert len(response["errors"]) == 1 and "srv.c, start line: 2" in response["errors"][0]
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(lambda idx: client.request("process_code", code=f"#define SRV_B {idx}\nSRV_B + SRV_A\n"),
+                                        range(32)))
+        assert [response["result"] for response in results] == [f"{idx} + 5\n" for idx in range(32)]
+        assert client.request("expand_macros", code="SRV_B SRV_SQR(1)")["result"] == "SRV_B ((1) * (1))"
+        assert client.request("evaluate", expr="SRV_SQR(SRV_A) > 20")["result"] == 1
+        assert "error" in client.request("unknown") and "error" in client.request("evaluate")
+        Path(tmp_path, "srv.h").write_text("#define SRV_A 7\n", encoding="utf-8")
+        for _ in range(100):
+            if client.request("evaluate", expr="SRV_A")["result"] == 7:
+                break
+            time.sleep(0.05)
+        assert client.request("evaluate", expr="SRV_A + 1")["result"] == 8
+        assert Path(tmp_path, "srv.sock").stat().st_mode & 0o777 == 0o600
+        Path(tmp_path, "bad.c").write_bytes(b"\xff\xfe#define SRV_C 1\n")
+        assert client.request("process_file", file=str(Path(tmp_path, "bad.c")))["error"].startswith("request failed")
+        Path(tmp_path, "late.c").write_text("#include \"late.h\"\nLATE\n", encoding="utf-8")
+        assert "File 'late.h' not found" in client.request("process_file", file=str(Path(tmp_path, "late.c")))["errors"][0]
+        Path(tmp_path, "late.h").write_text("#define LATE 1\n", encoding="utf-8")
+        time.sleep(0.1)
+        assert client.request("process_file", file=str(Path(tmp_path, "late.c"))) == {"result": "1\n", "errors": []}
+        Path(tmp_path, "shadow.c").write_text("#include \"shadow.h\"\nSHADOW\n", encoding="utf-8")
+        assert client.request("process_file", file=str(Path(tmp_path, "shadow.c")))["result"] == "1\n"
+        Path(tmp_path, "shadow.h").write_text("#define SHADOW 2\n", encoding="utf-8")
+        time.sleep(0.1)
+        assert all(client.request("process_file", file=str(Path(tmp_path, "shadow.c")))["result"] == "2\n" for _ in range(16))
+    finally:
+        server.stop()
+    assert not Path(tmp_path, "srv.sock").exists()
+    assert "error" in PreprocClient(Path(tmp_path, "srv.sock")).request("evaluate", expr="1")
+
+
+def test_include_prefetch(tmp_path: Path) -> None:
+    for idx in range(8):
+        Path(tmp_path, f"pf{idx}.h").write_text(f"#pragma once\n#include \"pf_sub{idx}.h\"\n#define PF_{idx} {idx}\n", encoding="utf-8")
+        Path(tmp_path, f"pf_sub{idx}.h").write_text(f"#define PF_SUB_{idx} {idx}\n{100 * ' '}\n", encoding="utf-8")
+    Path(tmp_path, "pf.c").write_text("".join(f"#include \"pf{idx}.h\"\n" for idx in (*range(8), 0)) +
+                                      "#include \"pf_missing.h\"\nx = PF_7 + PF_SUB_7;\n", encoding="utf-8")
+    outputs = []
+    for budget in (0, 1 << 20, 100):
+        ncpp = NeatCpp()
+        ncpp.prefetch_budget = budget
+        ncpp.enable_profiling()
+        ncpp.add_include_dirs(tmp_path)
+        ncpp.process_files(Path(tmp_path, "pf.c"))
+        outputs.append(ncpp.output)
+        ncpp.close()
+        prefetch = ncpp.get_profile()["prefetch"]
+        if budget == 0:
+            assert prefetch == {"hits": 0, "skips": 0}
+        elif budget == 1 << 20:
+            assert prefetch == {"hits": 16, "skips": 0}
+        else:
+            assert prefetch["skips"] >= 8 and prefetch["hits"] + prefetch["skips"] == 16
+    assert outputs == 3 * ["x = 7 + 7;\n"]
+    # Files prefetched, but not included, are released once the including file is processed and the threads are stopped.
+    Path(tmp_path, "pf_skip.c").write_text("#if 0\n#include \"pf_big.h\"\n#endif\n", encoding="utf-8")
+    Path(tmp_path, "pf_big.h").write_text(f"#define PF_BIG\n{200 * ' '}\n", encoding="utf-8")
+    Path(tmp_path, "pf_next.c").write_text("#include \"pf_sub1.h\"\nPF_SUB_1\n", encoding="utf-8")
+    ncpp = NeatCpp()
+    ncpp.prefetch_budget = 250
+    ncpp.enable_profiling()
+    ncpp.process_files(Path(tmp_path, "pf_skip.c"))
+    time.sleep(0.1)
+    assert ncpp.process_files(Path(tmp_path, "pf_next.c")) == "1\n"
+    assert ncpp.get_profile()["prefetch"] == {"hits": 1, "skips": 0}
+    ncpp.close()
+    for thread in threading.enumerate():
+        if thread.name.startswith("neatcpp_prefetch"):
+            thread.join(5.0)
+            assert not thread.is_alive()